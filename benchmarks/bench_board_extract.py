@@ -0,0 +1,148 @@
+"""
+Clien list/thread parsing benchmark: compiled XPath extractor vs the previous
+BeautifulSoup walk.
+
+Checks that titles, links, comment counts, bodies and comments are identical
+on the saved fixtures (and that every list row got a timestamp), then times
+both. clien_list.html / clien_thread.html are synthetic; the real pages saved
+by capture_fixtures.py in fixtures/real/ are checked and timed as a second
+set. Run from the repo root:
+
+    python benchmarks/bench_board_extract.py [--rounds 100]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clien_fetcher import CLIEN_BASE_URL, _parse_clien_list, _extract_clien_content  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REAL_FIXTURES = os.path.join(FIXTURES, 'real')
+
+def soup_parse_list(html):
+    """The BeautifulSoup list parser this replaced (condensed, same behaviour)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    results = []
+    for item in soup.find_all(class_='list_title'):
+        link_tag = item if item.name == 'a' else item.find('a')
+        if not link_tag or not link_tag.get('href'):
+            continue
+        href = link_tag.get('href')
+        comment_count = 0
+        comment_span = item.find(class_='rSymph05')
+        if not comment_span:
+            row = item.find_parent(class_='list_item')
+            if row:
+                comment_span = row.find(class_='rSymph05')
+        if comment_span:
+            try:
+                comment_count = int(comment_span.get_text(strip=True))
+            except ValueError:
+                pass
+        results.append({
+            'title': link_tag.get_text(strip=True),
+            'link': CLIEN_BASE_URL + href if href.startswith('/') else href,
+            'comment_count': comment_count,
+            'published_at': None
+        })
+    return results
+
+def soup_extract_thread(html):
+    """The BeautifulSoup thread parser this replaced (condensed, same behaviour)."""
+    soup = BeautifulSoup(html, 'html.parser')
+    article = soup.find(class_='post_article') or soup.find(class_='content')
+    body = article.get_text(separator=' ', strip=True) if article else ""
+    comments = []
+    rows = soup.find_all(class_='comment_row') or soup.find_all(attrs={'data-role': 'comment-row'})
+    for row in rows:
+        content = row.find(class_='comment_content') or row.find(class_='comment_msg')
+        if content:
+            text = content.get_text(separator=' ', strip=True)
+            if text:
+                comments.append(text)
+    if not comments:
+        section = soup.find(class_='comment_view') or soup.find(class_='post_comment')
+        if section:
+            msgs = section.find_all(class_='comment_msg')
+            if msgs:
+                comments = [t for t in (m.get_text(separator=' ', strip=True) for m in msgs) if t]
+            elif section.name in ['div', 'span', 'p']:
+                text = section.get_text(separator=' ', strip=True)
+                if text and len(text) > 1:
+                    comments.append(text)
+    return {'body': body, 'comments': comments[:50]}
+
+def read_fixture(path):
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def load_sets():
+    """[(label, list page, [thread pages])]"""
+    sets = [('synthetic', read_fixture(os.path.join(FIXTURES, 'clien_list.html')),
+             [read_fixture(os.path.join(FIXTURES, 'clien_thread.html'))])]
+    real_list = os.path.join(REAL_FIXTURES, 'clien_list.html')
+    if os.path.exists(real_list):
+        threads = [read_fixture(path) for path in sorted(glob.glob(os.path.join(REAL_FIXTURES, 'clien_thread_*.html')))]
+        sets.append(('real', read_fixture(real_list), threads))
+    return sets
+
+def timed(func, pages, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for html in pages:
+            func(html)
+    return (time.perf_counter() - started) / (rounds * len(pages)) * 1000
+
+def check_parity(label, list_html, thread_pages):
+    problems = []
+    old_rows, new_rows = soup_parse_list(list_html), _parse_clien_list(list_html)
+    # Fields the old parser never filled in
+    added = {'published_at', 'post_id'}
+    strip_added = [{k: v for k, v in row.items() if k not in added} for row in new_rows]
+    if strip_added != [{k: v for k, v in row.items() if k not in added} for row in old_rows]:
+        problems.append("list rows differ")
+    missing = [row['link'] for row in new_rows if not row['published_at']]
+    if missing:
+        problems.append(f"{len(missing)} rows without published_at")
+    for i, thread_html in enumerate(thread_pages):
+        thread = _extract_clien_content(thread_html)
+        if soup_extract_thread(thread_html) != {'body': thread['body'], 'comments': thread['comments'][:50]}:
+            problems.append(f"thread {i} body/comments differ")
+    example = new_rows[0]['published_at'] if new_rows else None
+    print(f"{label} list: {len(new_rows)} rows, e.g. {example} UTC; {len(thread_pages)} thread pages")
+    return [f"{label}: {problem}" for problem in problems]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=100)
+    args = parser.parse_args()
+
+    sets = load_sets()
+    problems = [problem for label, list_html, thread_pages in sets
+                for problem in check_parity(label, list_html, thread_pages)]
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    print(f"parity: {'ok' if not problems else 'FAILED'}")
+    if len(sets) == 1:
+        print("no captured pages in fixtures/real (see capture_fixtures.py): synthetic fixtures only")
+
+    for set_label, list_html, thread_pages in sets:
+        for label, old, new, pages in (
+            ('list page', soup_parse_list, _parse_clien_list, [list_html]),
+            ('thread page', soup_extract_thread, _extract_clien_content, thread_pages),
+        ):
+            if not pages:
+                continue
+            old_ms, new_ms = timed(old, pages, args.rounds), timed(new, pages, args.rounds)
+            print(f"{set_label + ' ' + label:22s} soup {old_ms:7.2f} ms   xpath {new_ms:7.2f} ms   "
+                  f"speedup {old_ms / new_ms:4.1f}x")
+
+    sys.exit(1 if problems else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+End-to-end refresh benchmark: the real update_rss_job / update_clien_job_standalone
+against a local stand-in server and a stubbed Gemini backend.
+
+The parent process serves the fixtures (feed.xml for every feed, article.html
+for every article link, the Clien list/thread pages) with a configurable
+latency. Each scenario runs in a fresh child process with its own temporary
+directory and DB, so peak RSS and CPU time belong to that run alone; the
+child swaps the summarizer's model for a stub that answers after
+--llm-latency-ms and counts calls, and counts DB connections and commits.
+Stage wall times come from the job's trace (the 'job' spans under the root).
+
+    python benchmarks/bench_pipeline.py [--feeds 10 100 1000] [--latency-ms 50]
+        [--set pipeline_fetch_concurrency=16] [--tracemalloc] [--output results.json] [--compare old.json]
+
+Results are written as JSON (default benchmarks/results/pipeline-<commit>.json)
+so runs on different commits can be compared with --compare.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(ROOT, 'benchmarks', 'fixtures')
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+# --- stand-in server (parent process) ---
+
+class StandInServer:
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.requests = {}
+        now = datetime.now(timezone.utc)
+        # Recent dates, otherwise the jobs' 7 day cleanup would drop everything
+        dates = iter(format_datetime(now - timedelta(minutes=30 * i)) for i in range(10000))
+        self.feed_xml = re.sub(r'<pubDate>[^<]*</pubDate>', lambda m: f'<pubDate>{next(dates)}</pubDate>', read_fixture('feed.xml'))
+        kst_now = (now + timedelta(hours=9)).strftime('%Y-%m-%d %H:%M:%S')
+        self.clien_list = re.sub(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', kst_now, read_fixture('clien_list.html'))
+        self.clien_thread = read_fixture('clien_thread.html')
+        self.article = read_fixture('article.html')
+        self.base_url = None
+
+    async def _respond(self, kind, text, content_type):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+        await asyncio.sleep(self.latency)
+        return web.Response(text=text, content_type=content_type)
+
+    async def feed(self, request):
+        n = request.match_info['n']
+        xml = self.feed_xml.replace('https://example.com/news/', f"{self.base_url}/article/{n}/")
+        return await self._respond('feed', xml, 'application/rss+xml')
+
+    async def article_page(self, request):
+        return await self._respond('article', self.article, 'text/html')
+
+    async def clien_list_page(self, request):
+        # Older pages: same rows with lower post numbers
+        page = int(request.query.get('po', 0))
+        html = re.sub(r'(/service/board/news/)(\d+)', lambda m: f"{m.group(1)}{int(m.group(2)) - page * 100}", self.clien_list)
+        return await self._respond('clien_list', html, 'text/html')
+
+    async def clien_thread_page(self, request):
+        return await self._respond('clien_thread', self.clien_thread, 'text/html')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/feed/{n}', self.feed)
+        app.router.add_get('/article/{n}/{i}', self.article_page)
+        app.router.add_get('/service/board/news', self.clien_list_page)
+        app.router.add_get('/service/board/news/{post_id}', self.clien_thread_page)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+# --- one scenario (child process) ---
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+    async def __aiter__(self):
+        # stream=True answers: line by line
+        for line in self.text.splitlines(keepends=True):
+            yield StubResponse(line)
+
+class StubModel:
+    """Stands in for genai.GenerativeModel: fixed answers after a fixed latency."""
+
+    def __init__(self, latency_ms):
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if 'Return ONLY the indices' in prompt:
+            return StubResponse(', '.join(str(i) for i in range(10)))
+        if '---ARTICLE---' in prompt:
+            return StubResponse("---ARTICLE---\n* **요약** bench\n* 두 번째 줄\n---COMMENTS---\n* 반응 요약")
+        return StubResponse("* **요약** bench summary\n* 두 번째 줄")
+
+def run_child(args):
+    workdir = tempfile.mkdtemp(prefix='rssy2-bench-')
+    # Relative paths (log file, body cache) land in the temp dir
+    os.chdir(workdir)
+    os.environ['GEMINI_API_KEY'] = 'bench'
+    sys.path.insert(0, ROOT)
+    from logger_config import logger
+    logger.setLevel(args.log_level)
+    import database
+    database.DB_NAME = os.path.join(workdir, 'bench.db')
+    database.init_db()
+    for key, value in args.settings:
+        database.set_setting(key, value)
+    for n in range(args.feeds):
+        database.add_feed(f"{args.base_url}/feed/{n}", f"Bench {n}")
+
+    import clien_fetcher
+    import scheduler
+    from summarizer import get_summarizer
+    stub = StubModel(args.llm_latency_ms)
+    get_summarizer().model = stub
+    get_summarizer().min_interval = args.llm_interval
+    clien_fetcher.CLIEN_BASE_URL = args.base_url
+    clien_fetcher.CLIEN_NEWS_URL = f"{args.base_url}/service/board/news"
+
+    counts = {'connections': 0, 'commits': 0, 'statements': 0}
+    open_connection = database.get_db_connection
+
+    def counting_connection():
+        conn = open_connection()
+        counts['connections'] += 1
+
+        def trace(statement):
+            counts['statements'] += 1
+            if statement == 'COMMIT':
+                counts['commits'] += 1
+        conn.set_trace_callback(trace)
+        return conn
+    database.get_db_connection = counting_connection
+
+    job = scheduler.update_rss_job if args.job == 'rss' else scheduler.update_clien_job_standalone
+    if args.tracemalloc:
+        tracemalloc.start()
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    asyncio.run(job())
+    wall = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    tracemalloc.stop()
+    database.get_db_connection = open_connection
+
+    stages = {}
+    traces = database.get_recent_traces(limit=1)
+    if traces:
+        spans = database.get_trace_spans(traces[0]['trace_id'])
+        root = next(s['span_id'] for s in spans if s['parent_id'] is None)
+        for s in spans:
+            if s['parent_id'] == root and s['category'] == 'job':
+                stages[s['name']] = round(stages.get(s['name'], 0) + s['duration_ms'] / 1000, 3)
+
+    conn = open_connection()
+    articles, top = conn.execute("SELECT COUNT(*), COALESCE(SUM(is_top_selection), 0) FROM articles").fetchone()
+    conn.close()
+    result = {
+        'wall_s': round(wall, 3),
+        'stages_s': stages,
+        'cpu_s': round((usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime), 3),
+        # ru_maxrss is KiB on Linux
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+        # Peak of Python allocations during the job (--tracemalloc; slows the run down)
+        'traced_peak_mb': round(traced_peak / 1024 / 1024, 1) if traced_peak is not None else None,
+        'db_connections': counts['connections'],
+        'db_commits': counts['commits'],
+        'db_statements': counts['statements'],
+        'llm_calls': stub.calls,
+        'articles': articles,
+        'top_articles': top,
+    }
+    with open(args.result_file, 'w') as f:
+        json.dump(result, f)
+
+# --- driver (parent process) ---
+
+async def run_scenario(server, name, job, feeds, args):
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        result_file = f.name
+    command = [
+        sys.executable, os.path.abspath(__file__), '--child', '--job', job, '--feeds', str(feeds),
+        '--base-url', server.base_url, '--result-file', result_file,
+        '--llm-latency-ms', str(args.llm_latency_ms), '--llm-interval', str(args.llm_interval),
+        '--log-level', args.log_level,
+    ]
+    if args.tracemalloc:
+        command.append('--tracemalloc')
+    for key, value in args.settings:
+        command += ['--set', f"{key}={value}"]
+    server.requests.clear()
+    process = await asyncio.create_subprocess_exec(*command, cwd=ROOT)
+    if await process.wait() != 0:
+        raise RuntimeError(f"Scenario {name} failed (exit code {process.returncode})")
+    with open(result_file) as f:
+        result = json.load(f)
+    os.remove(result_file)
+    result = dict({'scenario': name, 'job': job, 'feeds': feeds}, **result, http_requests=dict(server.requests))
+    stages = ' '.join(f"{k}={v:.2f}s" for k, v in result['stages_s'].items())
+    traced = f"  traced {result['traced_peak_mb']:6.1f}MB" if result['traced_peak_mb'] is not None else ''
+    print(f"{name:10s} wall {result['wall_s']:7.2f}s  cpu {result['cpu_s']:6.2f}s  rss {result['peak_rss_mb']:6.1f}MB{traced}  "
+          f"commits {result['db_commits']:5d}  llm {result['llm_calls']:3d}  articles {result['articles']:6d}  [{stages}]")
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {s['scenario']: s for s in json.load(f)['scenarios']}
+    print(f"\nvs {baseline_path}:")
+    for scenario in results:
+        old = baseline.get(scenario['scenario'])
+        if not old:
+            continue
+        deltas = []
+        for key in ('wall_s', 'cpu_s', 'peak_rss_mb', 'traced_peak_mb', 'db_commits', 'llm_calls'):
+            if old.get(key) and scenario.get(key) is not None:
+                deltas.append(f"{key} {100.0 * (scenario[key] - old[key]) / old[key]:+.1f}%")
+        print(f"{scenario['scenario']:10s} " + '  '.join(deltas))
+
+async def run_all(args):
+    server = StandInServer(args.latency_ms)
+    await server.start()
+    results = []
+    try:
+        for feeds in args.feeds:
+            results.append(await run_scenario(server, f"rss-{feeds}", 'rss', feeds, args))
+        if not args.skip_clien:
+            results.append(await run_scenario(server, 'clien', 'clien', 0, args))
+    finally:
+        await server.stop()
+    return results
+
+def parse_setting(text):
+    key, _, value = text.partition('=')
+    if not key or not _:
+        raise argparse.ArgumentTypeError(f"expected key=value, got {text!r}")
+    return key, value
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--feeds', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--latency-ms', type=float, default=50, help='stand-in server latency per request')
+    parser.add_argument('--llm-latency-ms', type=float, default=200, help='stub Gemini latency per call')
+    parser.add_argument('--llm-interval', type=float, default=0, help='summarizer min_interval (the app uses 10s)')
+    parser.add_argument('--set', dest='settings', type=parse_setting, action='append', default=[], help='DB setting key=value')
+    parser.add_argument('--skip-clien', action='store_true')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report the peak of traced Python allocations')
+    parser.add_argument('--output', help='JSON results path')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    # Internal: one scenario in a child process
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--job', help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        args.feeds = args.feeds[0]
+        run_child(args)
+        return
+
+    results = asyncio.run(run_all(args))
+    commit = git_commit()
+    output = args.output or os.path.join(RESULTS, f"pipeline-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created_at': datetime.utcnow().isoformat(),
+            'params': {
+                'latency_ms': args.latency_ms, 'llm_latency_ms': args.llm_latency_ms,
+                'llm_interval': args.llm_interval, 'settings': dict(args.settings),
+            },
+            'scenarios': results,
+        }, f, indent=2)
+    print(f"results: {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""
+Web app cold start benchmark: `python -X importtime -c "import main"` and the
+time until a fresh uvicorn process answers GET /.
+
+Each run is a new interpreter in a scratch directory (its own rssy2.db and
+log), so nothing is cached in-process. Reports the median import time of
+main, the slowest modules it imports, and fails if any of the pipeline's
+heavy dependencies is imported by main. Run from the repo root:
+
+    python benchmarks/bench_startup.py [--runs 5] [--no-serve] [--output startup.json]
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Only the refresh jobs need these; the web UI must start without them
+HEAVY_MODULES = ['google.generativeai', 'trafilatura', 'feedparser', 'bs4', 'aiohttp', 'apscheduler', 'markdown', 'PIL']
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+def scratch_dir():
+    workdir = tempfile.mkdtemp(prefix='rssy2-startup-')
+    for folder in ('templates', 'static'):
+        os.symlink(os.path.join(ROOT, folder), os.path.join(workdir, folder))
+    return workdir
+
+def child_env():
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONWARNINGS='ignore')
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+def import_profile(workdir):
+    """One `import main` under -X importtime: (main cumulative us, {direct import: cumulative us}, heavy modules loaded)."""
+    code = f"import main, sys, json; print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=workdir, env=child_env(),
+                            capture_output=True, text=True, check=True)
+    # Children are listed before their parent; collect depth-1 lines until 'main' closes them
+    children, main_us, main_children = {}, None, {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        _self_us, cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        if depth == 1:
+            children[name] = int(cumulative_us)
+        elif depth == 0:
+            if name == 'main':
+                main_us, main_children = int(cumulative_us), children
+            children = {}
+    return main_us, main_children, json.loads(result.stdout.strip().splitlines()[-1])
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def time_to_first_response(workdir, timeout=60):
+    """Seconds from spawning uvicorn to the first 200 on GET /."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+                               cwd=workdir, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("uvicorn did not answer GET / in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='slowest direct imports of main to list')
+    parser.add_argument('--no-serve', action='store_true', help='skip the uvicorn time-to-first-response runs')
+    parser.add_argument('--output', help='JSON results path')
+    args = parser.parse_args()
+
+    import_ms, serve_ms, heavy = [], [], set()
+    children = {}
+    for _ in range(args.runs):
+        workdir = scratch_dir()
+        try:
+            main_us, children, loaded = import_profile(workdir)
+            heavy.update(loaded)
+            import_ms.append(main_us / 1000)
+            if not args.no_serve:
+                serve_ms.append(time_to_first_response(workdir) * 1000)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"import main: median {statistics.median(import_ms):7.1f} ms  (min {min(import_ms):.1f}, max {max(import_ms):.1f})")
+    if serve_ms:
+        print(f"first GET /: median {statistics.median(serve_ms):7.1f} ms  (min {min(serve_ms):.1f}, max {max(serve_ms):.1f})")
+    direct = sorted(((cumulative, name) for name, cumulative in children.items()), reverse=True)
+    print("slowest imports of main (last run, cumulative):")
+    for cumulative, name in direct[:args.top]:
+        print(f"  {cumulative / 1000:7.1f} ms  {name}")
+    print(f"heavy modules imported by main: {', '.join(sorted(heavy)) or 'none'}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'import_ms': import_ms, 'first_response_ms': serve_ms,
+                'slowest_imports_ms': {name: cumulative / 1000 for cumulative, name in direct[:args.top]},
+                'heavy_modules': sorted(heavy),
+            }, f, indent=2)
+    sys.exit(1 if heavy else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+HTML-to-text benchmark: text_extract.html_to_text vs BeautifulSoup get_text.
+
+Checks that both produce identical output on the fixtures and a few edge
+cases, then times them. feed.xml and article.html are synthetic; pages saved
+by capture_fixtures.py in fixtures/real/ are checked and timed as their own
+groups. Run from the repo root:
+
+    python benchmarks/bench_text_extract.py [--rounds 200]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+import feedparser
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from text_extract import html_to_text  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+REAL_FIXTURES = os.path.join(FIXTURES, 'real')
+
+EDGE_CASES = [
+    "plain text, no markup",
+    "caf&eacute; &amp; bar",
+    "<p>Hello <b>World</b>!</p>",
+    "a<!-- comment -->b",
+    "<script>var x = '<p>no</p>';</script>after",
+    "<style>p{}</style><p>x</p><template>t</template>",
+    "<ruby>漢<rt>kan</rt></ruby>",
+    "<p>unclosed <b>bold",
+    "</p>stray close",
+    "<ul><li>1<li>2</ul>",
+    "<![CDATA[zz]]>hi",
+    "<div>a</div></body></html>after",
+    "x < y and y > z",
+    "<p>" + "<div>" * 600 + "deep" + "</div>" * 600,
+]
+
+def soup_text(text):
+    return BeautifulSoup(text, 'html.parser').get_text(separator=' ', strip=True)
+
+def feed_snippets(paths):
+    snippets = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            snippets.extend(entry.get('summary', '') for entry in feedparser.parse(f.read()).entries)
+    return snippets
+
+def pages(paths):
+    texts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            texts.append(f.read().decode('utf-8', errors='replace'))
+    return texts
+
+def load_groups():
+    """[(label, samples)]: feed snippets and full pages stress different paths, so they are timed apart."""
+    groups = [
+        ('feed snippets', feed_snippets([os.path.join(FIXTURES, 'feed.xml')])),
+        ('article page', pages([os.path.join(FIXTURES, 'article.html')])),
+        ('real snippets', feed_snippets(sorted(glob.glob(os.path.join(REAL_FIXTURES, 'feed_*.xml'))))),
+        ('real pages', pages(sorted(glob.glob(os.path.join(REAL_FIXTURES, '*.html'))))),
+    ]
+    return [(label, samples) for label, samples in groups if samples]
+
+def timed(func, samples, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for sample in samples:
+            func(sample)
+    return time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    groups = load_groups()
+    samples = EDGE_CASES + [sample for _label, group in groups for sample in group]
+    mismatches = 0
+    for sample in samples:
+        expected, got = soup_text(sample), html_to_text(sample)
+        if expected != got:
+            mismatches += 1
+            print(f"MISMATCH {sample[:60]!r}\n  soup: {expected[:120]!r}\n  lxml: {got[:120]!r}")
+    print(f"parity: {len(samples) - mismatches}/{len(samples)} samples identical")
+    if not os.path.isdir(REAL_FIXTURES):
+        print("no captured pages in fixtures/real (see capture_fixtures.py): synthetic fixtures only")
+
+    for label, group in groups:
+        soup_s = timed(soup_text, group, args.rounds)
+        fast_s = timed(html_to_text, group, args.rounds)
+        per_call = 1e6 / (args.rounds * len(group))
+        print(f"{label:14s} soup {soup_s * per_call:8.1f} us/doc   lxml {fast_s * per_call:8.1f} us/doc   "
+              f"speedup {soup_s / fast_s:4.1f}x")
+
+    sys.exit(1 if mismatches else 0)
+
+if __name__ == '__main__':
+    main()
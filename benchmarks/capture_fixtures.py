@@ -0,0 +1,74 @@
+"""
+Saves real pages next to the synthetic fixtures, for the parity and timing
+benchmarks (bench_text_extract.py, bench_board_extract.py).
+
+Downloads the Clien news list, the first --threads thread pages linked from
+it, and for every feed URL given the feed itself and the article page of its
+first entry, into benchmarks/fixtures/real/ (SOURCES.txt records where each
+file came from). Run from the repo root:
+
+    python benchmarks/capture_fixtures.py [--threads 3] [FEED_URL ...]
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime
+
+import aiohttp
+import feedparser
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clien_fetcher import CLIEN_NEWS_URL, HEADERS, _parse_clien_list  # noqa: E402
+
+REAL_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'real')
+
+async def fetch(session, url):
+    async with session.get(url, headers=HEADERS, timeout=aiohttp.ClientTimeout(total=20)) as response:
+        response.raise_for_status()
+        return await response.read()
+
+def save(name, data, url, sources):
+    with open(os.path.join(REAL_FIXTURES, name), 'wb') as f:
+        f.write(data)
+    sources.append(f"{name}\t{url}")
+    print(f"{name:24s} {len(data):8d} bytes  {url}")
+
+async def capture_clien(session, threads, sources):
+    data = await fetch(session, CLIEN_NEWS_URL)
+    save('clien_list.html', data, CLIEN_NEWS_URL, sources)
+    rows = _parse_clien_list(data.decode('utf-8', errors='replace'))
+    for i, row in enumerate(rows[:threads]):
+        save(f'clien_thread_{i}.html', await fetch(session, row['link']), row['link'], sources)
+
+async def capture_feed(session, i, feed_url, sources):
+    data = await fetch(session, feed_url)
+    save(f'feed_{i}.xml', data, feed_url, sources)
+    entries = feedparser.parse(data).entries
+    if entries and entries[0].get('link'):
+        save(f'article_{i}.html', await fetch(session, entries[0].link), entries[0].link, sources)
+
+async def capture(feed_urls, threads, skip_clien):
+    os.makedirs(REAL_FIXTURES, exist_ok=True)
+    sources = []
+    async with aiohttp.ClientSession() as session:
+        if not skip_clien:
+            await capture_clien(session, threads, sources)
+        for i, feed_url in enumerate(feed_urls):
+            try:
+                await capture_feed(session, i, feed_url, sources)
+            except Exception as e:
+                print(f"skipping {feed_url}: {e}")
+    with open(os.path.join(REAL_FIXTURES, 'SOURCES.txt'), 'a', encoding='utf-8') as f:
+        f.write(f"# captured {datetime.utcnow().isoformat()}Z\n" + ''.join(line + '\n' for line in sources))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('feeds', nargs='*', help='feed URLs to capture (feed XML + first article page)')
+    parser.add_argument('--threads', type=int, default=3, help='Clien thread pages to capture')
+    parser.add_argument('--skip-clien', action='store_true')
+    args = parser.parse_args()
+    asyncio.run(capture(args.feeds, args.threads, args.skip_clien))
+
+if __name__ == '__main__':
+    main()
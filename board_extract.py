@@ -0,0 +1,117 @@
+"""
+Declarative extraction for community board pages (list and thread views).
+
+A board is described once as a dict of sections and fields using a small
+CSS subset (tag, .class, #id, [attr], [attr=value], descendant ' ' and child
+'>' combinators). Selectors are compiled to lxml XPath objects once, when
+the config is defined, so parsing a page is one lxml parse plus a handful
+of compiled XPath evaluations instead of repeated soup searches.
+
+    {
+        'list': Section(rows=['.list_item'], fields={
+            'title': Field(['.list_subject'], 'compact_text'),
+            'href': Field(['.list_subject'], '@href'),
+        }),
+    }
+
+Every selector position takes a list of fallbacks; the first one that
+matches anything wins.
+"""
+import re
+from lxml import etree
+from text_extract import element_text, parse_html
+
+_COMPOUND = re.compile(r'^([a-zA-Z][\w-]*|\*)?((?:\.[\w-]+|#[\w-]+|\[[\w-]+(?:=[^\]]+)?\])*)$')
+_PART = re.compile(r'\.([\w-]+)|#([\w-]+)|\[([\w-]+)(?:=([^\]]+))?\]')
+
+def _xpath_literal(value):
+    value = value.strip('\'"')
+    return f"'{value}'" if "'" not in value else f'"{value}"'
+
+def _compile_compound(compound):
+    match = _COMPOUND.match(compound)
+    if not match:
+        raise ValueError(f"Unsupported selector: {compound!r}")
+    tag, rest = match.groups()
+    predicates = []
+    for cls, id_, attr, value in _PART.findall(rest):
+        if cls:
+            predicates.append(f"contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')")
+        elif id_:
+            predicates.append(f"@id={_xpath_literal(id_)}")
+        elif value:
+            predicates.append(f"@{attr}={_xpath_literal(value)}")
+        else:
+            predicates.append(f"@{attr}")
+    return (tag or '*') + ''.join(f'[{p}]' for p in predicates)
+
+def selector_to_xpath(selector):
+    """'.a > b.c' -> "descendant-or-self::*[...a...]/b[...c...]" (the context node itself can match)."""
+    tokens = re.findall(r'>|[^\s>]+', selector)
+    if not tokens or tokens[0] == '>' or tokens[-1] == '>':
+        raise ValueError(f"Unsupported selector: {selector!r}")
+    xpath = 'descendant-or-self::' + _compile_compound(tokens[0])
+    axis = '/descendant::'
+    for token in tokens[1:]:
+        if token == '>':
+            axis = '/'
+            continue
+        xpath += axis + _compile_compound(token)
+        axis = '/descendant::'
+    return xpath
+
+class Field:
+    """
+    One value read relative to a section node: the first fallback selector
+    with a match is used, `value` is 'text', 'compact_text' (no separator,
+    like get_text(strip=True)) or '@attr'. many=True returns every match.
+    """
+
+    def __init__(self, selectors, value='text', many=False):
+        self.xpaths = [etree.XPath(selector_to_xpath(s)) for s in selectors]
+        self.value = value
+        self.many = many
+
+    def _value(self, element):
+        if self.value == 'text':
+            return element_text(element)
+        if self.value == 'compact_text':
+            return element_text(element, separator='')
+        return element.get(self.value[1:])
+
+    def extract(self, node):
+        for xpath in self.xpaths:
+            matches = xpath(node)
+            if matches:
+                if self.many:
+                    return [self._value(m) for m in matches]
+                return self._value(matches[0])
+        return [] if self.many else None
+
+class Section:
+    """A group of fields, read once per row when `rows` selectors are given, else once per page."""
+
+    def __init__(self, fields, rows=None):
+        self.fields = fields
+        self.row_xpaths = [etree.XPath(selector_to_xpath(s)) for s in rows or []]
+
+    def extract(self, node):
+        if not self.row_xpaths:
+            return {name: field.extract(node) for name, field in self.fields.items()}
+        for xpath in self.row_xpaths:
+            rows = xpath(node)
+            if rows:
+                return [{name: field.extract(row) for name, field in self.fields.items()} for row in rows]
+        return []
+
+class BoardExtractor:
+    def __init__(self, config):
+        self.sections = config
+
+    def extract(self, html, section):
+        try:
+            root = parse_html(html or '<html></html>')
+        except (etree.ParserError, ValueError):
+            # Empty document after parsing: every field comes back empty
+            root = parse_html('<html></html>')
+        return self.sections[section].extract(root)
@@ -0,0 +1,151 @@
+"""
+Persistent cache of extracted article bodies.
+
+Entries are JSON files under cache/bodies/, one per URL, holding the
+extracted text (optionally the raw HTML) plus the ETag/Last-Modified
+validators of the response. Within the TTL a cached body is used as is;
+after it the cache issues a conditional GET, so an unchanged article costs a
+304 round trip and no extraction CPU. The directory is kept under a byte
+budget by evicting the least recently used files (mtime is bumped on read).
+
+All methods do blocking file I/O: the async fetchers call them through
+asyncio.to_thread, so stores (and evictions) are serialized with a lock.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from database import get_setting
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+CACHE_DIR = os.path.join("cache", "bodies")
+
+class BodyCache:
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.total_bytes = None
+        self.stats = {'hits': 0, 'revalidated': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + '.json')
+
+    def _scan(self):
+        if self.total_bytes is not None:
+            return
+        total = 0
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        self.total_bytes = total
+
+    def get(self, key):
+        """Returns the cache record for `key` (dict with 'payload', 'etag', 'last_modified', 'stored_at') or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+            os.utime(path)  # LRU: most recently used = newest mtime
+            return record
+        except (OSError, ValueError):
+            return None
+
+    def is_fresh(self, record, ttl_seconds):
+        return record is not None and time.time() - record.get('stored_at', 0) < ttl_seconds
+
+    def put(self, key, payload, etag=None, last_modified=None, html=None):
+        with self._lock:
+            self._put(key, payload, etag, last_modified, html)
+
+    def _put(self, key, payload, etag, last_modified, html):
+        self._scan()
+        path = self._path(key)
+        record = {
+            'key': key,
+            'payload': payload,
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': time.time(),
+        }
+        if html is not None and get_setting('body_cache_store_html', 'false') == 'true':
+            record['html'] = html
+        data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        old_size = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self.total_bytes += len(data) - old_size
+        self.stats['stores'] += 1
+        self._evict()
+
+    def touch(self, key):
+        """Restarts the TTL of a record after a 304 revalidation."""
+        record = self.get(key)
+        if record:
+            self.put(key, record['payload'], record.get('etag'), record.get('last_modified'), record.get('html'))
+        return record
+
+    def _evict(self):
+        max_bytes = float(get_setting('body_cache_max_mb', 100)) * 1024 * 1024
+        if self.total_bytes <= max_bytes:
+            return
+        files = []
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        # Evict down to 90% so we don't evict on every store
+        target = max_bytes * 0.9
+        for _mtime, size, path in files:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+
+    def record_lookup(self, outcome):
+        self.stats[outcome] += 1
+
+    def hit_rate(self):
+        lookups = self.stats['hits'] + self.stats['revalidated'] + self.stats['misses']
+        if not lookups:
+            return None
+        return (self.stats['hits'] + self.stats['revalidated']) / lookups
+
+    def log_stats(self):
+        rate = self.hit_rate()
+        if rate is not None:
+            logger.info(f"Body cache: {rate:.0%} hit rate {self.stats}, {self.total_bytes or 0} bytes on disk.")
+
+def conditional_headers(record):
+    headers = {}
+    if record:
+        if record.get('etag'):
+            headers['If-None-Match'] = record['etag']
+        if record.get('last_modified'):
+            headers['If-Modified-Since'] = record['last_modified']
+    return headers
+
+def get_body_ttl():
+    return float(get_setting('body_cache_ttl_hours', 24)) * 3600
+
+body_cache = BodyCache()
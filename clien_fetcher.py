@@ -1,204 +1,189 @@
 import aiohttp
-from bs4 import BeautifulSoup
 import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from body_cache import body_cache, conditional_headers
+from board_extract import BoardExtractor, Section, Field
+from database import get_setting
+from metrics import cpu_timed, fetch_timer
+from logger_config import get_logger
+
+logger = get_logger(__name__)
 
 CLIEN_BASE_URL = "https://www.clien.net"
 CLIEN_NEWS_URL = "https://www.clien.net/service/board/news"
+CLIEN_HOST = "www.clien.net"
+KST = timezone(timedelta(hours=9))
+# Post numbers only count on the news board itself (notices link to /board/rule/...)
+POST_ID_PATTERN = re.compile(r'/service/board/news/(\d+)')
+
+# Board layout, compiled once. Row: <div class="list_item symph_row"> with
+# .list_title > a.list_subject, the comment count in .rSymph05 and the full
+# post time in .list_time .timestamp.
+CLIEN_EXTRACTOR = BoardExtractor({
+    'list': Section(rows=['.list_item', '.list_title'], fields={
+        'title': Field(['.list_title a', 'a'], 'compact_text'),
+        'href': Field(['.list_title a', 'a'], '@href'),
+        'comment_count': Field(['.rSymph05'], 'compact_text'),
+        'timestamp': Field(['.list_time .timestamp', '.timestamp'], 'compact_text'),
+    }),
+    'thread': Section(fields={
+        'body': Field(['.post_article', '.content']),
+        'comment_rows': Section(rows=['.comment_row', '[data-role=comment-row]'], fields={
+            'text': Field(['.comment_content', '.comment_msg']),
+            'id': Field(['[data-comment-sn]'], '@data-comment-sn'),
+        }),
+        'comment_msgs': Field(['.comment_view .comment_msg', '.post_comment .comment_msg'], many=True),
+        'comment_section': Field(['div.comment_view', 'div.post_comment']),
+    }),
+})
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
 
-async def fetch_clien_list():
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+def get_clien_crawl_settings():
+    return {
+        'pages': int(get_setting('clien_pages', 3)),
+        'concurrency': int(get_setting('clien_page_concurrency', 2)),
     }
+
+async def fetch_clien_page(session, page):
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(CLIEN_NEWS_URL, headers=headers, timeout=10) as response:
+        with fetch_timer(CLIEN_HOST, 'clien_list'):
+            async with session.get(CLIEN_NEWS_URL, params={'po': page}, headers=HEADERS, timeout=10) as response:
                 if response.status != 200:
-                    print(f"Failed to fetch Clien list: {response.status}")
+                    logger.warning(f"Failed to fetch Clien list page {page}: {response.status}")
                     return []
-                
                 html = await response.text()
-                return await asyncio.to_thread(_parse_clien_list, html)
+        return await asyncio.to_thread(_parse_clien_list, html)
     except Exception as e:
-        print(f"Error fetching Clien list: {e}")
+        logger.error(f"Error fetching Clien list page {page}: {e}")
         return []
 
+async def fetch_clien_list(pages=1, stop_at_id=None, concurrency=2):
+    """
+    Crawls up to `pages` list pages, `concurrency` at a time, newest first.
+    Stops after the wave that reaches a post at or below stop_at_id (the
+    newest post seen by the previous crawl). Notices and links to other
+    boards are dropped; posts that moved to the next page mid-crawl are
+    only returned once.
+    """
+    results = []
+    seen_ids = set()
+    async with aiohttp.ClientSession() as session:
+        for first_page in range(0, pages, concurrency):
+            wave = range(first_page, min(pages, first_page + concurrency))
+            page_rows = await asyncio.gather(*(fetch_clien_page(session, page) for page in wave))
+
+            reached_cursor = False
+            for rows in page_rows:
+                posts = [row for row in rows if row['post_id']]
+                if not posts or (stop_at_id and min(row['post_id'] for row in posts) <= stop_at_id):
+                    reached_cursor = True
+                for row in posts:
+                    if row['post_id'] not in seen_ids:
+                        seen_ids.add(row['post_id'])
+                        results.append(row)
+            if reached_cursor:
+                break
+    return results
+
+def parse_clien_timestamp(text):
+    """'2024-05-01 12:34:56' (KST, as shown by Clien) -> naive UTC ISO string like the rest of the DB."""
+    if not text:
+        return None
+    try:
+        local = datetime.strptime(text.strip()[:19], '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return local.replace(tzinfo=KST).astimezone(timezone.utc).replace(tzinfo=None).isoformat()
+
+@cpu_timed('clien_list')
 def _parse_clien_list(html):
-    soup = BeautifulSoup(html, 'html.parser')
     results = []
-    
-    # User specified class 'list_title' for title/link and 'rSymph05' for comment count
-    # Inspecting typical Clien structure (based on user request):
-    # The list items are usually rows. We need to find the specific elements.
-    # We will look for elements with class 'list_title' which usually contains the <a> tag.
-    
-    # Note: 'list_title' might be on the <a> tag itself or a wrapper.
-    # Let's find all elements with class 'list_title'.
-    
-    titles = soup.find_all(class_='list_title')
-    
-    for item in titles:
+    for row in CLIEN_EXTRACTOR.extract(html, 'list'):
+        href = row['href']
+        if not href:
+            continue
         try:
-            # The item itself might be the link or contain it.
-            # In Clien, .list_title is usually a span or div containing the <a> tag.
-            # Or it might be the a tag with class list_subject?
-            # User said "list_title 와 rSymph05 class를 읽어".
-            # Let's assume list_title contains the text and the link.
-            
-            link_tag = item.find('a') if item.name != 'a' else item
-            if not link_tag and item.has_attr('href'):
-                link_tag = item
-            
-            if not link_tag:
-                # Try finding parent if list_title is just text span?
-                # Let's assume standard structure: <div class="list_title"><a href="...">Title</a></div>
-                # If item is the container.
-                link_tag = item.find('a')
-            
-            if not link_tag:
-                continue
-
-            title = link_tag.get_text(strip=True)
-            href = link_tag.get('href')
-            
-            if not href:
-                continue
-                
-            full_url = CLIEN_BASE_URL + href if href.startswith('/') else href
-            
-            # Comment count. It is usually inside the list item row, not necessarily inside list_title.
-            # We need the parent row to find the sibling 'rSymph05'.
-            # Let's try to find the row container.
-            # Usually .list_item.symph_row
-            
-            # Heuristic: verify if rSymph05 is inside list_title or sibling.
-            # On Clien, the comment count is often inside the title component or separate column.
-            # Let's try to find 'rSymph05' within the same row container.
-            
-            # Assuming 'item' is a descendant of the row.
-            # calculate comment count
+            comment_count = int(row['comment_count'] or 0)
+        except ValueError:
             comment_count = 0
-            
-            # Traverse up to find a container that might hold the comment count
-            # OR, if the user meant that rSymph05 is INSIDE list_title (common in mobile views or specific layouts).
-            
-            comment_span = item.find(class_='rSymph05')
-            if not comment_span:
-                # Try siblings or parent's siblings?
-                # This is risky without seeing HTML.
-                # However, usually comment count is separate.
-                # Let's try looking for the row.
-                row = item.find_parent(class_='list_item')
-                if row:
-                    comment_span = row.find(class_='rSymph05')
-            
-            if comment_span:
-                 try:
-                     comment_count = int(comment_span.get_text(strip=True))
-                 except:
-                     pass
-            
-            results.append({
-                'title': title,
-                'link': full_url,
-                'comment_count': comment_count,
-                # Use current time as placeholder for published_at as checking detail page for every item is expensive
-                # or we can parse it if available in list. Clien list usually has timestamp.
-                # But user didn't specify. We'll use None or specific logic later.
-                'published_at': None 
-            })
-            
-        except Exception as e:
-            continue
-            
+        post_id = POST_ID_PATTERN.search(href)
+        results.append({
+            'title': row['title'] or '',
+            'link': CLIEN_BASE_URL + href if href.startswith('/') else href,
+            'comment_count': comment_count,
+            'published_at': parse_clien_timestamp(row['timestamp']),
+            'post_id': int(post_id.group(1)) if post_id else None
+        })
     return results
 
 async def fetch_clien_article_full(url):
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-    }
+    headers = dict(HEADERS)
+    # Threads change as comments come in, so the parsed result is only reused
+    # briefly or after a successful revalidation
+    cache_key = 'clien:' + url
+    record = await asyncio.to_thread(body_cache.get, cache_key)
+    if body_cache.is_fresh(record, float(get_setting('clien_cache_ttl_minutes', 5)) * 60):
+        body_cache.record_lookup('hits')
+        return record['payload']
+    headers.update(conditional_headers(record))
+
     try:
         async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as response:
-                if response.status != 200:
-                    return ""
-                html = await response.text()
-                return await asyncio.to_thread(_extract_clien_content, html)
+            with fetch_timer(CLIEN_HOST, 'clien_thread'):
+                async with session.get(url, headers=headers, timeout=10) as response:
+                    status = response.status
+                    html = await response.text() if status == 200 else ''
+                    response_headers = response.headers
+        if status == 304 and record:
+            body_cache.record_lookup('revalidated')
+            await asyncio.to_thread(body_cache.touch, cache_key)
+            return record['payload']
+        body_cache.record_lookup('misses')
+        if status != 200:
+            return {'body': '', 'comments': []}
+        result = await asyncio.to_thread(_extract_clien_content, html)
+        await asyncio.to_thread(body_cache.put, cache_key, result, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+        return result
     except Exception as e:
-        print(f"Error fetching Clien article {url}: {e}")
-        return ""
+        logger.error(f"Error fetching Clien article {url}: {e}")
+        return {'body': '', 'comments': []}
 
+@cpu_timed('clien_thread')
 def _extract_clien_content(html):
-    soup = BeautifulSoup(html, 'html.parser')
-    
-    # 1. Extract main article content
-    article = soup.find(class_='post_article')
-    if not article:
-        article = soup.find(class_='content') # Fallback
-        
-    content_text = ""
-    if article:
-        content_text = article.get_text(separator=' ', strip=True)
-    
-    # 2. Extract comments
-    extracted_comments = []
-    
-    # Priority 1: Look for explicit comment rows (classic desktop/mobile web)
-    # Search globally or within a large container to avoid missing them if layout changes
-    comment_items = soup.find_all(class_='comment_row')
-    
-    # If not found by class, try data-role
-    if not comment_items:
-        comment_items = soup.find_all(attrs={'data-role': 'comment-row'})
-
-    if comment_items:
-        for item in comment_items:
-            # Determine if it's a re-comment (nested)
-            is_reply = False
-            classes = item.get('class', [])
-            if 're_comment' in classes:
-                is_reply = True
-            
-            # Identify content
-            content_div = item.find(class_='comment_content')
-            if not content_div:
-                content_div = item.find(class_='comment_msg')
-            
-            if content_div:
-                text = content_div.get_text(separator=' ', strip=True)
-                if text:
-                    # Optional: Add indicator for replies if needed, e.g. "↳ "
-                    # But user just wants to read them.
-                    extracted_comments.append(text)
-    
-    # Priority 2: Fallback to existing logic if no rows found
-    if not extracted_comments:
-        comments_section = soup.find(class_='comment_view')
-        if not comments_section:
-            comments_section = soup.find(class_='post_comment')
-            
-        if comments_section:
-            # Look for comment_msg or just text
-            msgs = comments_section.find_all(class_='comment_msg')
-            if msgs:
-                for msg in msgs:
-                    text = msg.get_text(separator=' ', strip=True)
-                    if text:
-                        extracted_comments.append(text)
-            else:
-                # Last resort: text of section
-                # But this might include UI text. Be careful.
-                # Only do this if it looks like a simple text container
-                if comments_section.name in ['div', 'span', 'p']:
-                     text = comments_section.get_text(separator=' ', strip=True)
-                     if text and len(text) > 1: # filtering empty
-                         extracted_comments.append(text)
+    thread = CLIEN_EXTRACTOR.extract(html, 'thread')
 
+    rows = [row for row in thread['comment_rows'] if row['text']]
+    comments = [row['text'] for row in rows]
+    comment_ids = [row['id'] for row in rows]
+    if not comments:
+        comments = [text for text in thread['comment_msgs'] if text]
+        comment_ids = [None] * len(comments)
+    if not comments and thread['comment_section'] and len(thread['comment_section']) > 1:
+        # Last resort: the whole comment section (may include some UI text)
+        comments = [thread['comment_section']]
+        comment_ids = [None]
+
+    # All comments are kept so later runs can tell which ones are new;
+    # callers cap what goes into a prompt
     return {
-        'body': content_text,
-        'comments': extracted_comments[:50]  # Limit to top 50 comments
-    }
-    
-    return {
-        'body': content_text,
-        'comments': extracted_comments[:50]  # Limit to top 50 comments
+        'body': thread['body'] or '',
+        'comments': comments,
+        'comment_ids': comment_ids
     }
+
+def content_hash(text):
+    return hashlib.sha1((text or '').encode('utf-8')).hexdigest()[:16]
+
+def thread_fingerprint(thread):
+    """(body hash, comment keys) of a fetched thread; a comment's key is its Clien number, else a hash of its text."""
+    comment_ids = thread.get('comment_ids') or []
+    keys = []
+    for i, comment in enumerate(thread['comments']):
+        comment_id = comment_ids[i] if i < len(comment_ids) else None
+        keys.append(comment_id or content_hash(comment))
+    return content_hash(thread['body']), keys
@@ -1,19 +1,30 @@
+import json
 import sqlite3
 import uuid
 from datetime import datetime, timedelta
-from logger_config import logger
+from logger_config import get_logger
+from markdown_render import render_summary, RENDER_VERSION
+from metrics import db_timed
+from url_canon import canonicalize_url
+
+logger = get_logger(__name__)
 
 DB_NAME = "rssy2.db"
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
+    # timeout: the web app and the standalone worker may write concurrently
+    conn = sqlite3.connect(DB_NAME, timeout=30)
     conn.row_factory = sqlite3.Row
     return conn
 
+@db_timed
 def init_db():
     logger.info(f"Initializing database: {DB_NAME}")
     conn = get_db_connection()
     cursor = conn.cursor()
+
+    # WAL lets the web process read while the worker process writes
+    cursor.execute("PRAGMA journal_mode=WAL")
     
     # Create feeds table
     cursor.execute('''
@@ -33,6 +44,7 @@ def init_db():
         feed_id TEXT,
         title TEXT,
         original_url TEXT,
+        canonical_url TEXT,
         published_at DATETIME,
         raw_content TEXT,
         summary TEXT,
@@ -51,8 +63,21 @@ def init_db():
     except sqlite3.OperationalError:
         logger.info("Migrating database: adding comment_count to articles table")
         cursor.execute("ALTER TABLE articles ADD COLUMN comment_count INTEGER DEFAULT 0")
-    
 
+    # Clien thread fingerprint: body hash + JSON list of comment keys already summarized
+    try:
+        cursor.execute("SELECT body_hash, comment_keys FROM articles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding body_hash and comment_keys to articles table")
+        cursor.execute("ALTER TABLE articles ADD COLUMN body_hash TEXT")
+        cursor.execute("ALTER TABLE articles ADD COLUMN comment_keys TEXT")
+
+    # Migration: comment count as of the last thread summary (comment_count is the live one)
+    try:
+        cursor.execute("SELECT summarized_comment_count FROM articles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding summarized_comment_count to articles table")
+        cursor.execute("ALTER TABLE articles ADD COLUMN summarized_comment_count INTEGER")
 
     # Create settings table
     cursor.execute('''
@@ -62,6 +87,105 @@ def init_db():
     )
     ''')
 
+    # Summaries pre-rendered to sanitized HTML when they are stored (see markdown_render.py)
+    try:
+        cursor.execute("SELECT summary_html, comment_summary_html FROM articles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding summary_html and comment_summary_html to articles table")
+        cursor.execute("ALTER TABLE articles ADD COLUMN summary_html TEXT")
+        cursor.execute("ALTER TABLE articles ADD COLUMN comment_summary_html TEXT")
+    cursor.execute("SELECT value FROM settings WHERE key = 'summary_html_version'")
+    row = cursor.fetchone()
+    if (row['value'] if row else None) != RENDER_VERSION:
+        # The renderer changed: stored HTML is rendered again below
+        cursor.execute("UPDATE articles SET summary_html = NULL WHERE summary_html IS NOT NULL")
+        cursor.execute("INSERT OR REPLACE INTO settings (key, value) VALUES ('summary_html_version', ?)", (RENDER_VERSION,))
+    cursor.execute(
+        '''
+        SELECT id, summary, comment_summary FROM articles
+        WHERE summary_html IS NULL AND summary IS NOT NULL AND (is_top_selection = 1 OR feed_id = 'clien-community')
+        '''
+    )
+    backfill = [(render_summary(row['summary']), render_summary(row['comment_summary']), row['id']) for row in cursor.fetchall()]
+    if backfill:
+        logger.info(f"Rendering {len(backfill)} stored summaries to HTML")
+        cursor.executemany("UPDATE articles SET summary_html = ?, comment_summary_html = ? WHERE id = ?", backfill)
+
+    # Migration: how a Top 10 summary was made (passthrough/raw/extractive/short/full, see summarizer.py)
+    try:
+        cursor.execute("SELECT summary_tier FROM articles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding summary_tier to articles table")
+        cursor.execute("ALTER TABLE articles ADD COLUMN summary_tier TEXT")
+
+    # Create url_redirects table (feed proxy / shortener URL -> article URL)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS url_redirects (
+        source_url TEXT PRIMARY KEY,
+        target_url TEXT NOT NULL,
+        resolved_at DATETIME
+    )
+    ''')
+
+    # Migration: articles.canonical_url is the dedup key (see url_canon.py)
+    try:
+        cursor.execute("SELECT canonical_url FROM articles LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding canonical_url to articles table")
+        cursor.execute("ALTER TABLE articles ADD COLUMN canonical_url TEXT")
+    cursor.execute("SELECT id, original_url FROM articles WHERE canonical_url IS NULL")
+    backfill = [(canonicalize_url(row['original_url']), row['id']) for row in cursor.fetchall()]
+    if backfill:
+        cursor.executemany("UPDATE articles SET canonical_url = ? WHERE id = ?", backfill)
+        # Of articles that turn out to be duplicates keep the copy with the AI summary, else the oldest
+        cursor.execute(
+            '''
+            DELETE FROM articles WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY canonical_url
+                        ORDER BY COALESCE(is_top_selection, 0) DESC,
+                                 (COALESCE(summary, '') != '' OR COALESCE(comment_summary, '') != '') DESC,
+                                 rowid
+                    ) AS copy_rank
+                    FROM articles
+                ) WHERE copy_rank > 1
+            )
+            '''
+        )
+        if cursor.rowcount:
+            logger.info(f"Migrating database: removed {cursor.rowcount} duplicate articles by canonical URL")
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_articles_canonical_url ON articles(canonical_url)")
+
+    # Migration: feeds.top_picks counts how often a feed's articles made the Top 10
+    try:
+        cursor.execute("SELECT top_picks FROM feeds LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding top_picks to feeds table")
+        cursor.execute("ALTER TABLE feeds ADD COLUMN top_picks INTEGER DEFAULT 0")
+
+    # Migration: per-feed adaptive polling stats
+    for column, column_type in [
+        ('publish_interval_minutes', 'REAL'),
+        ('last_new_item_at', 'DATETIME'),
+        ('fetch_cost_ms', 'REAL'),
+        ('poll_interval_minutes', 'REAL'),
+        ('next_poll_at', 'DATETIME'),
+    ]:
+        try:
+            cursor.execute(f"SELECT {column} FROM feeds LIMIT 1")
+        except sqlite3.OperationalError:
+            logger.info(f"Migrating database: adding {column} to feeds table")
+            cursor.execute(f"ALTER TABLE feeds ADD COLUMN {column} {column_type}")
+
+    # Migration: outcome of the check made when the feed was added (see opml.py)
+    try:
+        cursor.execute("SELECT probe_status, probe_error FROM feeds LIMIT 1")
+    except sqlite3.OperationalError:
+        logger.info("Migrating database: adding probe_status and probe_error to feeds table")
+        cursor.execute("ALTER TABLE feeds ADD COLUMN probe_status TEXT")
+        cursor.execute("ALTER TABLE feeds ADD COLUMN probe_error TEXT")
+
     # Create job_status table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS job_status (
@@ -74,6 +198,107 @@ def init_db():
     )
     ''')
     
+    # Create job_requests table (queue between the web app and the standalone worker)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_requests (
+        id TEXT PRIMARY KEY,
+        job_type TEXT NOT NULL,
+        status TEXT DEFAULT 'pending',
+        requested_at DATETIME,
+        started_at DATETIME,
+        finished_at DATETIME,
+        error TEXT
+    )
+    ''')
+    
+    # Create job_runs / job_run_items tables (refresh checkpoints for crash recovery)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_runs (
+        id TEXT PRIMARY KEY,
+        job_type TEXT NOT NULL,
+        status TEXT,
+        candidates TEXT,
+        selected TEXT,
+        started_at DATETIME,
+        updated_at DATETIME
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_run_items (
+        run_id TEXT,
+        item_index INTEGER,
+        completed_at DATETIME,
+        PRIMARY KEY (run_id, item_index)
+    )
+    ''')
+    
+    # Create host_health table (per-host circuit breaker state, see resilience.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS host_health (
+        host TEXT PRIMARY KEY,
+        state TEXT DEFAULT 'closed',
+        consecutive_failures INTEGER DEFAULT 0,
+        total_failures INTEGER DEFAULT 0,
+        total_successes INTEGER DEFAULT 0,
+        last_error TEXT,
+        last_latency_ms REAL,
+        opened_at DATETIME,
+        updated_at DATETIME
+    )
+    ''')
+    
+    # Create trace_spans table (per job run timeline, see tracing.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS trace_spans (
+        trace_id TEXT NOT NULL,
+        span_id TEXT NOT NULL,
+        parent_id TEXT,
+        job_type TEXT,
+        name TEXT NOT NULL,
+        category TEXT,
+        trace_started_at DATETIME,
+        offset_ms REAL,
+        duration_ms REAL,
+        attrs TEXT,
+        PRIMARY KEY (trace_id, span_id)
+    )
+    ''')
+
+    # Create image_thumbs table (image URL -> content-addressed thumbnail, see thumbnails.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS image_thumbs (
+        image_url TEXT PRIMARY KEY,
+        thumb_hash TEXT,
+        fetched_at DATETIME
+    )
+    ''')
+
+    # Create token_usage table (Gemini tokens per job run and day, see token_budget.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS token_usage (
+        day TEXT NOT NULL,
+        trace_id TEXT NOT NULL,
+        job_type TEXT,
+        calls INTEGER DEFAULT 0,
+        estimated_calls INTEGER DEFAULT 0,
+        prompt_tokens INTEGER DEFAULT 0,
+        output_tokens INTEGER DEFAULT 0,
+        started_at DATETIME,
+        updated_at DATETIME,
+        PRIMARY KEY (day, trace_id)
+    )
+    ''')
+
+    # Create stream_events table (live updates from the worker to the web app, see events.py)
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS stream_events (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        event TEXT NOT NULL,
+        data TEXT,
+        created_at DATETIME
+    )
+    ''')
+
     # Insert Clien placeholder feed if not exists
     cursor.execute("SELECT id FROM feeds WHERE id = 'clien-community'")
     if not cursor.fetchone():
@@ -85,6 +310,7 @@ def init_db():
     conn.commit()
     conn.close()
 
+@db_timed
 def add_feed(url, name=None):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -97,6 +323,24 @@ def add_feed(url, name=None):
     conn.close()
     return feed_id
 
+@db_timed
+def add_feeds_bulk(feeds):
+    """Inserts [{'url', 'name', 'is_active', 'fetch_cost_ms', 'probe_status', 'probe_error'}] in one transaction (see opml.py)."""
+    if not feeds:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO feeds (id, url, name, is_active, fetch_cost_ms, probe_status, probe_error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(str(uuid.uuid4()), feed['url'], feed['name'], 1 if feed['is_active'] else 0, feed.get('fetch_cost_ms'),
+          feed.get('probe_status'), feed.get('probe_error'))
+         for feed in feeds]
+    )
+    conn.commit()
+    conn.close()
+    return len(feeds)
+
+@db_timed
 def get_feeds(active_only=True):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -108,6 +352,53 @@ def get_feeds(active_only=True):
     conn.close()
     return feeds
 
+@db_timed
+def get_feed(feed_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM feeds WHERE id = ?", (feed_id,))
+    feed = cursor.fetchone()
+    conn.close()
+    return feed
+
+@db_timed
+def update_feed_poll_stats(feed_id, publish_interval_minutes, last_new_item_at, fetch_cost_ms, poll_interval_minutes, next_poll_at):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        UPDATE feeds SET publish_interval_minutes = ?, last_new_item_at = ?, fetch_cost_ms = ?,
+            poll_interval_minutes = ?, next_poll_at = ?, last_fetched_at = ?
+        WHERE id = ?
+        ''',
+        (publish_interval_minutes, last_new_item_at, fetch_cost_ms, poll_interval_minutes, next_poll_at,
+         datetime.utcnow().isoformat(), feed_id)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_feed_priorities():
+    """Share of past Top 10 picks per feed, normalized to 0..1."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, top_picks FROM feeds WHERE is_active = 1")
+    rows = cursor.fetchall()
+    conn.close()
+    max_picks = max((row['top_picks'] or 0 for row in rows), default=0)
+    if not max_picks:
+        return {}
+    return {row['id']: (row['top_picks'] or 0) / max_picks for row in rows}
+
+@db_timed
+def set_feed_active(feed_id, active):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("UPDATE feeds SET is_active = ? WHERE id = ?", (1 if active else 0, feed_id))
+    conn.commit()
+    conn.close()
+
+@db_timed
 def delete_feed(feed_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -116,61 +407,248 @@ def delete_feed(feed_id):
     conn.commit()
     conn.close()
 
+def _canonical_urls(cursor, urls):
+    """Maps each URL to its dedup key: the redirect target if resolved (see redirects.py), canonicalized."""
+    urls = list(dict.fromkeys(urls))
+    targets = {}
+    if urls:
+        placeholders = ','.join('?' * len(urls))
+        cursor.execute(f"SELECT source_url, target_url FROM url_redirects WHERE source_url IN ({placeholders})", urls)
+        targets = {row['source_url']: row['target_url'] for row in cursor.fetchall()}
+    return {url: canonicalize_url(targets.get(url, url)) for url in urls}
+
+def _existing_canonical_urls(cursor, canonical_urls):
+    canonical_urls = list(set(canonical_urls))
+    if not canonical_urls:
+        return set()
+    placeholders = ','.join('?' * len(canonical_urls))
+    cursor.execute(f"SELECT canonical_url FROM articles WHERE canonical_url IN ({placeholders})", canonical_urls)
+    return {row['canonical_url'] for row in cursor.fetchall()}
+
+@db_timed
 def filter_new_urls(urls):
     if not urls:
         return []
     conn = get_db_connection()
     cursor = conn.cursor()
-    placeholders = ','.join('?' * len(urls))
-    cursor.execute(f"SELECT original_url FROM articles WHERE original_url IN ({placeholders})", urls)
-    existing_urls = {row['original_url'] for row in cursor.fetchall()}
+    canonical = _canonical_urls(cursor, urls)
+    existing = _existing_canonical_urls(cursor, canonical.values())
     conn.close()
-    return [url for url in urls if url not in existing_urls]
+    new_urls = []
+    for url in urls:
+        if canonical[url] not in existing:
+            existing.add(canonical[url]) # Same article twice in one batch
+            new_urls.append(url)
+    return new_urls
 
-def save_article(feed_id, title, url, published_at, content, image_url=None, summary=None, is_top_selection=False, comment_summary=None, comment_count=0):
+@db_timed
+def save_article(feed_id, title, url, published_at, content, image_url=None, summary=None, is_top_selection=False, comment_summary=None, comment_count=0, body_hash=None, comment_keys=None):
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # Check if article already exists (by URL)
-    cursor.execute("SELECT id FROM articles WHERE original_url = ?", (url,))
-    if cursor.fetchone():
-        conn.close()
-        return None  # Already exists
+    canonical_url = _canonical_urls(cursor, [url])[url]
         
     article_id = str(uuid.uuid4())
     # If summary is provided initially (e.g. from batch process)
     summarized_at = datetime.utcnow().isoformat() if summary else None
     
+    # The unique canonical_url index drops duplicates (tracking params, redirects, ...)
     cursor.execute(
         '''
-        INSERT INTO articles (id, feed_id, title, original_url, published_at, raw_content, image_url, summary, summarized_at, is_top_selection, comment_summary, comment_count)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        INSERT OR IGNORE INTO articles (id, feed_id, title, original_url, canonical_url, published_at, raw_content, image_url, summary, summary_html, summarized_at, is_top_selection, comment_summary, comment_summary_html, comment_count, summarized_comment_count, body_hash, comment_keys)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''',
-        (article_id, feed_id, title, url, published_at, content, image_url, summary, summarized_at, is_top_selection, comment_summary, comment_count)
+        (article_id, feed_id, title, url, canonical_url, published_at, content, image_url, summary, render_summary(summary), summarized_at, is_top_selection,
+         comment_summary, render_summary(comment_summary), comment_count, comment_count if summary else None, body_hash,
+         json.dumps(comment_keys) if comment_keys is not None else None)
     )
+    inserted = cursor.rowcount == 1
     conn.commit()
     conn.close()
-    return article_id
+    return article_id if inserted else None  # None: already exists
 
+@db_timed
+def save_articles_bulk(feed_entries):
+    """
+    Saves many non-top entries (summary = feed content) in a single transaction.
+    Their summary is only shown as a plain-text snippet, so no summary_html.
+    feed_entries: FeedEntry objects with feed_id set. Returns the number inserted.
+    """
+    if not feed_entries:
+        return 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical = _canonical_urls(cursor, [entry.link for entry in feed_entries])
+
+    rows = []
+    for entry in feed_entries:
+        rows.append((
+            str(uuid.uuid4()), entry.feed_id, entry.title, entry.link, canonical[entry.link],
+            entry.published_at, entry.content, entry.image_url, entry.content, None, False
+        ))
+    before = conn.total_changes
+    cursor.executemany(
+        '''
+        INSERT OR IGNORE INTO articles (id, feed_id, title, original_url, canonical_url, published_at, raw_content, image_url, summary, summarized_at, is_top_selection)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        rows
+    )
+    inserted = conn.total_changes - before
+    conn.commit()
+    conn.close()
+    return inserted
+
+@db_timed
+def get_article_content(url):
+    """raw_content of a saved article (by canonical URL), or None."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical_url = _canonical_urls(cursor, [url])[url]
+    cursor.execute("SELECT raw_content FROM articles WHERE canonical_url = ?", (canonical_url,))
+    row = cursor.fetchone()
+    conn.close()
+    return row['raw_content'] if row else None
+
+@db_timed
+def update_comment_counts(counts):
+    """
+    Refreshes comment_count for articles that are already saved.
+    counts: {url: comment_count}. Returns {url: comment count at the last summary} for the URLs that
+    were known, so a thread whose re-summary failed still counts its new comments next time.
+    """
+    if not counts:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical = _canonical_urls(cursor, counts.keys())
+    keys = list(set(canonical.values()))
+    placeholders = ','.join('?' * len(keys))
+    cursor.execute(
+        f"SELECT canonical_url, COALESCE(summarized_comment_count, comment_count) AS previous FROM articles WHERE canonical_url IN ({placeholders})",
+        keys
+    )
+    previous = {row['canonical_url']: row['previous'] or 0 for row in cursor.fetchall()}
+    known = {url: previous[canonical[url]] for url in counts if canonical[url] in previous}
+    cursor.executemany(
+        "UPDATE articles SET comment_count = ? WHERE canonical_url = ?",
+        [(counts[url], canonical[url]) for url in known]
+    )
+    conn.commit()
+    conn.close()
+    return known
+
+@db_timed
+def get_thread_states(urls):
+    """{url: {'summary', 'comment_summary', 'body_hash', 'comment_keys'}} for saved threads."""
+    if not urls:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical = _canonical_urls(cursor, urls)
+    keys = list(set(canonical.values()))
+    placeholders = ','.join('?' * len(keys))
+    cursor.execute(
+        f"SELECT canonical_url, summary, comment_summary, body_hash, comment_keys FROM articles WHERE canonical_url IN ({placeholders})",
+        keys
+    )
+    rows = {row['canonical_url']: row for row in cursor.fetchall()}
+    conn.close()
+    states = {}
+    for url in urls:
+        row = rows.get(canonical[url])
+        if row:
+            states[url] = {
+                'summary': row['summary'],
+                'comment_summary': row['comment_summary'],
+                'body_hash': row['body_hash'],
+                'comment_keys': json.loads(row['comment_keys']) if row['comment_keys'] else []
+            }
+    return states
+
+@db_timed
+def update_thread_summary(url, summary, comment_summary, body_hash, comment_keys, comment_count):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical_url = _canonical_urls(cursor, [url])[url]
+    cursor.execute(
+        '''
+        UPDATE articles SET summary = ?, summary_html = ?, comment_summary = ?, comment_summary_html = ?,
+            body_hash = ?, comment_keys = ?, summarized_comment_count = ?, summarized_at = ?
+        WHERE canonical_url = ?
+        ''',
+        (summary, render_summary(summary), comment_summary, render_summary(comment_summary), body_hash, json.dumps(comment_keys),
+         comment_count, datetime.utcnow().isoformat(), canonical_url)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def update_article_top_summary(url, summary, summary_tier=None):
+    """Promotes an already saved article to the Top selection with its summary and the tier that made it; returns the summary HTML."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    canonical_url = _canonical_urls(cursor, [url])[url]
+    summary_html = render_summary(summary)
+    cursor.execute(
+        "UPDATE articles SET summary = ?, summary_html = ?, summary_tier = ?, summarized_at = ?, is_top_selection = 1 WHERE canonical_url = ?",
+        (summary, summary_html, summary_tier, datetime.utcnow().isoformat(), canonical_url)
+    )
+    cursor.execute(
+        "UPDATE feeds SET top_picks = top_picks + 1 WHERE id = (SELECT feed_id FROM articles WHERE canonical_url = ?)",
+        (canonical_url,)
+    )
+    conn.commit()
+    conn.close()
+    return summary_html
+
+@db_timed
+def get_url_redirects(urls):
+    if not urls:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ','.join('?' * len(urls))
+    cursor.execute(f"SELECT source_url, target_url FROM url_redirects WHERE source_url IN ({placeholders})", list(urls))
+    redirects = {row['source_url']: row['target_url'] for row in cursor.fetchall()}
+    conn.close()
+    return redirects
+
+@db_timed
+def save_url_redirects(redirects):
+    if not redirects:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cursor.executemany(
+        "INSERT OR REPLACE INTO url_redirects (source_url, target_url, resolved_at) VALUES (?, ?, ?)",
+        [(source, target, now) for source, target in redirects.items()]
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
 def update_article_summary(article_id, summary):
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute(
-        "UPDATE articles SET summary = ?, summarized_at = ? WHERE id = ?",
-        (summary, datetime.utcnow().isoformat(), article_id)
+        "UPDATE articles SET summary = ?, summary_html = ?, summarized_at = ? WHERE id = ?",
+        (summary, render_summary(summary), datetime.utcnow().isoformat(), article_id)
     )
     conn.commit()
     conn.close()
 
+@db_timed
 def get_recent_rss_articles(hours=24):
     conn = get_db_connection()
     cursor = conn.cursor()
     cutoff = (datetime.utcnow() - timedelta(hours=hours)).isoformat()
     cursor.execute(
         '''
-        SELECT a.*, f.name as feed_name 
+        SELECT a.*, f.name as feed_name, t.thumb_hash
         FROM articles a 
         JOIN feeds f ON a.feed_id = f.id 
+        LEFT JOIN image_thumbs t ON t.image_url = a.image_url
         WHERE a.published_at > ? AND a.feed_id != 'clien-community'
         ORDER BY a.published_at DESC
         ''',
@@ -180,6 +658,7 @@ def get_recent_rss_articles(hours=24):
     conn.close()
     return articles
 
+@db_timed
 def get_clien_articles(limit=20):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -197,14 +676,21 @@ def get_clien_articles(limit=20):
     conn.close()
     return articles
 
+@db_timed
 def cleanup_old_articles(days=7):
     conn = get_db_connection()
     cursor = conn.cursor()
     cutoff = (datetime.utcnow() - timedelta(days=days)).isoformat()
     cursor.execute("DELETE FROM articles WHERE published_at < ?", (cutoff,))
+    cursor.execute(
+        "DELETE FROM image_thumbs WHERE fetched_at < ? AND image_url NOT IN (SELECT image_url FROM articles WHERE image_url IS NOT NULL)",
+        (cutoff,)
+    )
+    cursor.execute("DELETE FROM token_usage WHERE day < ?", ((datetime.utcnow() - timedelta(days=90)).date().isoformat(),))
     conn.commit()
     conn.close()
 
+@db_timed
 def clear_articles(feed_type='all'):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -217,6 +703,7 @@ def clear_articles(feed_type='all'):
     conn.commit()
     conn.close()
 
+@db_timed
 def update_feed_last_fetched(feed_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -227,6 +714,7 @@ def update_feed_last_fetched(feed_id):
     conn.commit()
     conn.close()
 
+@db_timed
 def get_last_updated():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -237,6 +725,7 @@ def get_last_updated():
         return result['last_updated']
     return None
 
+@db_timed
 def get_setting(key, default=None):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -247,6 +736,7 @@ def get_setting(key, default=None):
         return result['value']
     return default
 
+@db_timed
 def set_setting(key, value):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -257,6 +747,7 @@ def set_setting(key, value):
     conn.commit()
     conn.close()
 
+@db_timed
 def update_job_status(job_id, status, progress_text=None, total_items=None, processed_items=None):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -290,6 +781,7 @@ def update_job_status(job_id, status, progress_text=None, total_items=None, proc
     conn.commit()
     conn.close()
 
+@db_timed
 def get_job_status(job_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -299,3 +791,380 @@ def get_job_status(job_id):
     if result:
         return dict(result)
     return None
+
+@db_timed
+def enqueue_job_request(job_type):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    # Don't pile up identical requests while the worker is busy
+    cursor.execute("SELECT id FROM job_requests WHERE job_type = ? AND status = 'pending'", (job_type,))
+    existing = cursor.fetchone()
+    if existing:
+        conn.close()
+        return existing['id']
+
+    request_id = str(uuid.uuid4())
+    cursor.execute(
+        "INSERT INTO job_requests (id, job_type, status, requested_at) VALUES (?, ?, 'pending', ?)",
+        (request_id, job_type, datetime.utcnow().isoformat())
+    )
+    conn.commit()
+    conn.close()
+    return request_id
+
+@db_timed
+def claim_next_job_request():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM job_requests WHERE status = 'pending' ORDER BY requested_at LIMIT 1")
+    request = cursor.fetchone()
+    if not request:
+        conn.close()
+        return None
+
+    # Guarded update so two workers can never claim the same request
+    cursor.execute(
+        "UPDATE job_requests SET status = 'running', started_at = ? WHERE id = ? AND status = 'pending'",
+        (datetime.utcnow().isoformat(), request['id'])
+    )
+    claimed = cursor.rowcount == 1
+    conn.commit()
+    conn.close()
+    return dict(request) if claimed else None
+
+@db_timed
+def finish_job_request(request_id, status, error=None):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE job_requests SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+        (status, datetime.utcnow().isoformat(), error, request_id)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def reset_stale_job_requests():
+    """Marks requests left 'running' by a worker that died as failed."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE job_requests SET status = 'failed', finished_at = ?, error = 'worker restarted' WHERE status = 'running'",
+        (datetime.utcnow().isoformat(),)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def create_job_run(job_type, candidates):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    run_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        "INSERT INTO job_runs (id, job_type, status, candidates, selected, started_at, updated_at) VALUES (?, ?, 'running', ?, NULL, ?, ?)",
+        (run_id, job_type, json.dumps(candidates, ensure_ascii=False), now, now)
+    )
+    conn.commit()
+    conn.close()
+    return run_id
+
+@db_timed
+def update_job_run_candidates(run_id, candidates):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE job_runs SET candidates = ?, updated_at = ? WHERE id = ?",
+        (json.dumps(candidates, ensure_ascii=False), datetime.utcnow().isoformat(), run_id)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def save_job_run_selection(run_id, selected):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "UPDATE job_runs SET selected = ?, updated_at = ? WHERE id = ?",
+        (json.dumps(list(selected)), datetime.utcnow().isoformat(), run_id)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def mark_job_run_item_done(run_id, item_index):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        "INSERT OR IGNORE INTO job_run_items (run_id, item_index, completed_at) VALUES (?, ?, ?)",
+        (run_id, item_index, datetime.utcnow().isoformat())
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_job_run_done_items(run_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT item_index FROM job_run_items WHERE run_id = ?", (run_id,))
+    done = {row['item_index'] for row in cursor.fetchall()}
+    conn.close()
+    return done
+
+@db_timed
+def finish_job_run(run_id, status):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    # The checkpoint data is only needed while the run can still be resumed
+    cursor.execute(
+        "UPDATE job_runs SET status = ?, candidates = NULL, updated_at = ? WHERE id = ?",
+        (status, datetime.utcnow().isoformat(), run_id)
+    )
+    cursor.execute("DELETE FROM job_run_items WHERE run_id = ?", (run_id,))
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_interrupted_job_runs():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM job_runs WHERE status = 'running' ORDER BY started_at DESC")
+    runs = []
+    for row in cursor.fetchall():
+        run = dict(row)
+        run['candidates'] = json.loads(run['candidates']) if run['candidates'] else []
+        run['selected'] = json.loads(run['selected']) if run['selected'] is not None else None
+        runs.append(run)
+    conn.close()
+    return runs
+
+@db_timed
+def get_host_health():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM host_health")
+    rows = {row['host']: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return rows
+
+@db_timed
+def save_host_health(rows):
+    if not rows:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        '''
+        INSERT INTO host_health (host, state, consecutive_failures, total_failures, total_successes, last_error, last_latency_ms, opened_at, updated_at)
+        VALUES (:host, :state, :consecutive_failures, :total_failures, :total_successes, :last_error, :last_latency_ms, :opened_at, :updated_at)
+        ON CONFLICT(host) DO UPDATE SET
+            state = excluded.state,
+            consecutive_failures = excluded.consecutive_failures,
+            total_failures = excluded.total_failures,
+            total_successes = excluded.total_successes,
+            last_error = excluded.last_error,
+            last_latency_ms = excluded.last_latency_ms,
+            opened_at = excluded.opened_at,
+            updated_at = excluded.updated_at
+        ''',
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def save_trace_spans(trace_id, started_at, spans, keep_traces=20):
+    """Writes one trace in a single transaction and drops traces beyond the newest keep_traces."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany(
+        '''
+        INSERT OR REPLACE INTO trace_spans (trace_id, span_id, parent_id, job_type, name, category, trace_started_at, offset_ms, duration_ms, attrs)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        [
+            (trace_id, span['span_id'], span['parent_id'], span['job_type'], span['name'], span['category'], started_at,
+             span['offset_ms'], span['duration_ms'], json.dumps(span['attrs'], ensure_ascii=False, default=str) if span['attrs'] else None)
+            for span in spans
+        ]
+    )
+    cursor.execute(
+        '''
+        DELETE FROM trace_spans WHERE trace_id NOT IN (
+            SELECT trace_id FROM trace_spans GROUP BY trace_id ORDER BY MAX(trace_started_at) DESC LIMIT ?
+        )
+        ''',
+        (keep_traces,)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_recent_traces(limit=20):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        SELECT t.trace_id, t.job_type, t.trace_started_at, t.duration_ms,
+               (SELECT COUNT(*) FROM trace_spans s WHERE s.trace_id = t.trace_id) as span_count
+        FROM trace_spans t WHERE t.parent_id IS NULL
+        ORDER BY t.trace_started_at DESC LIMIT ?
+        ''',
+        (limit,)
+    )
+    traces = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return traces
+
+@db_timed
+def get_trace_spans(trace_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT * FROM trace_spans WHERE trace_id = ? ORDER BY offset_ms", (trace_id,))
+    spans = []
+    for row in cursor.fetchall():
+        span = dict(row)
+        span['attrs'] = json.loads(span['attrs']) if span['attrs'] else None
+        spans.append(span)
+    conn.close()
+    return spans
+
+@db_timed
+def get_image_thumbs(image_urls):
+    """{image_url: {'thumb_hash', 'fetched_at'}} for URLs already fetched (thumb_hash is None after a failure)."""
+    urls = list(image_urls)
+    if not urls:
+        return {}
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ','.join('?' * len(urls))
+    cursor.execute(f"SELECT * FROM image_thumbs WHERE image_url IN ({placeholders})", urls)
+    rows = {row['image_url']: dict(row) for row in cursor.fetchall()}
+    conn.close()
+    return rows
+
+@db_timed
+def save_image_thumb(image_url, thumb_hash):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        INSERT INTO image_thumbs (image_url, thumb_hash, fetched_at) VALUES (?, ?, ?)
+        ON CONFLICT(image_url) DO UPDATE SET thumb_hash = excluded.thumb_hash, fetched_at = excluded.fetched_at
+        ''',
+        (image_url, thumb_hash, datetime.utcnow().isoformat())
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def delete_image_thumbs(thumb_hashes):
+    """Forgets evicted thumbnails, so their images are downloaded again when next needed."""
+    hashes = list(thumb_hashes)
+    if not hashes:
+        return
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ','.join('?' * len(hashes))
+    cursor.execute(f"DELETE FROM image_thumbs WHERE thumb_hash IN ({placeholders})", hashes)
+    conn.commit()
+    conn.close()
+
+@db_timed
+def add_token_usage(day, trace_id, job_type, prompt_tokens, output_tokens, estimated=False):
+    now = datetime.utcnow().isoformat()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        INSERT INTO token_usage (day, trace_id, job_type, calls, estimated_calls, prompt_tokens, output_tokens, started_at, updated_at)
+        VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?)
+        ON CONFLICT(day, trace_id) DO UPDATE SET
+            calls = calls + 1,
+            estimated_calls = estimated_calls + excluded.estimated_calls,
+            prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+            output_tokens = output_tokens + excluded.output_tokens,
+            updated_at = excluded.updated_at
+        ''',
+        (day, trace_id, job_type, int(estimated), prompt_tokens, output_tokens, now, now)
+    )
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_token_usage_totals(day, trace_id=None):
+    """(tokens used on `day`, tokens used by job run `trace_id` on any day)."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        SELECT
+            (SELECT COALESCE(SUM(prompt_tokens + output_tokens), 0) FROM token_usage WHERE day = ?),
+            (SELECT COALESCE(SUM(prompt_tokens + output_tokens), 0) FROM token_usage WHERE trace_id = ?)
+        ''',
+        (day, trace_id or '')
+    )
+    day_tokens, job_tokens = cursor.fetchone()
+    conn.close()
+    return day_tokens, job_tokens if trace_id else 0
+
+@db_timed
+def get_token_usage_history(days=7, runs=10):
+    """Per day totals for the last `days` days and the latest `runs` job runs."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(
+        '''
+        SELECT day, SUM(calls) as calls, SUM(estimated_calls) as estimated_calls,
+               SUM(prompt_tokens) as prompt_tokens, SUM(output_tokens) as output_tokens
+        FROM token_usage GROUP BY day ORDER BY day DESC LIMIT ?
+        ''',
+        (days,)
+    )
+    by_day = [dict(row) for row in cursor.fetchall()]
+    cursor.execute(
+        '''
+        SELECT trace_id, job_type, MIN(started_at) as started_at, SUM(calls) as calls,
+               SUM(estimated_calls) as estimated_calls, SUM(prompt_tokens) as prompt_tokens, SUM(output_tokens) as output_tokens
+        FROM token_usage WHERE trace_id != ''
+        GROUP BY trace_id ORDER BY started_at DESC LIMIT ?
+        ''',
+        (runs,)
+    )
+    by_run = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return by_day, by_run
+
+# Rows kept in stream_events; the web app relays them within a second
+STREAM_EVENTS_KEEP = 1000
+
+@db_timed
+def add_stream_events(rows):
+    """Appends [(event, data)] in order, in one transaction."""
+    if not rows:
+        return
+    now = datetime.utcnow().isoformat()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.executemany("INSERT INTO stream_events (event, data, created_at) VALUES (?, ?, ?)", [(event, data, now) for event, data in rows])
+    cursor.execute("DELETE FROM stream_events WHERE id <= (SELECT MAX(id) FROM stream_events) - ?", (STREAM_EVENTS_KEEP,))
+    conn.commit()
+    conn.close()
+
+@db_timed
+def get_stream_events(after_id, limit=500):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, event, data FROM stream_events WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit))
+    rows = [dict(row) for row in cursor.fetchall()]
+    conn.close()
+    return rows
+
+@db_timed
+def get_latest_stream_event_id():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(id), 0) FROM stream_events")
+    latest = cursor.fetchone()[0]
+    conn.close()
+    return latest
@@ -0,0 +1,143 @@
+"""
+Push channel for live updates: Top 10 summaries as they are generated.
+
+publish() hands an event to every /events (Server-Sent Events) connection
+of this process. The pipeline publishes 'summary_start' when it starts on a
+Top 10 entry, 'summary_delta' for each streamed chunk of the Gemini answer
+and 'summary_done' with the rendered HTML once the summary is stored.
+
+The standalone worker has no browsers attached: worker.py switches it to
+the DB channel, where publish() buffers events and a background task appends
+them to the stream_events table in batches (off the event loop), and the web
+app (RSSY2_WORKER_MODE=external) relays new rows to its subscribers with
+relay_db_events(). While it has subscribers the web app also refreshes the
+live_subscribers_at setting; the worker only streams while that is recent.
+"""
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+from database import add_stream_events, get_stream_events, get_latest_stream_event_id, get_setting, set_setting
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+# Events a slow client may fall behind by before it is dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+KEEPALIVE_SECONDS = 15
+RELAY_INTERVAL_SECONDS = 0.5
+# Web app -> worker: "browsers are connected", refreshed this often and trusted this long
+HEARTBEAT_SECONDS = 5
+HEARTBEAT_TTL_SECONDS = 15
+# Worker: how long one heartbeat lookup is reused, and how often buffered events are written
+HEARTBEAT_CHECK_SECONDS = 2
+FLUSH_INTERVAL_SECONDS = 0.25
+
+_subscribers = set()
+_db_channel = False
+_db_buffer = []
+_flush_task = None
+_live_checked = (0.0, False)
+
+def use_db_channel():
+    """Publish through the stream_events table (worker process)."""
+    global _db_channel
+    _db_channel = True
+
+def is_live():
+    """True when someone can receive streamed chunks; summaries are only streamed then."""
+    if _db_channel:
+        return _web_app_has_subscribers()
+    return bool(_subscribers)
+
+def _web_app_has_subscribers():
+    global _live_checked
+    checked_at, live = _live_checked
+    if time.monotonic() - checked_at < HEARTBEAT_CHECK_SECONDS:
+        return live
+    heartbeat = get_setting('live_subscribers_at')
+    try:
+        live = datetime.utcnow() - datetime.fromisoformat(heartbeat) < timedelta(seconds=HEARTBEAT_TTL_SECONDS)
+    except (TypeError, ValueError):
+        live = False
+    _live_checked = (time.monotonic(), live)
+    return live
+
+def publish(event, data):
+    global _flush_task
+    if _db_channel:
+        _db_buffer.append((event, json.dumps(data, ensure_ascii=False)))
+        if _flush_task is None or _flush_task.done():
+            _flush_task = asyncio.get_running_loop().create_task(_flush_db_buffer())
+        return
+    _deliver(event, data)
+
+async def _flush_db_buffer():
+    # One writer at a time keeps the rows in publish order
+    while _db_buffer:
+        await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+        rows = _db_buffer[:]
+        del _db_buffer[:len(rows)]
+        try:
+            await asyncio.to_thread(add_stream_events, rows)
+        except Exception as e:
+            logger.error(f"Failed to write {len(rows)} live update events: {e}")
+
+async def flush():
+    """Waits until buffered DB channel events are written (end of a refresh)."""
+    if _flush_task is not None:
+        await _flush_task
+
+def _deliver(event, data):
+    for queue in list(_subscribers):
+        if queue.qsize() >= SUBSCRIBER_QUEUE_SIZE:
+            logger.warning("Dropping a live update subscriber that fell behind.")
+            _subscribers.discard(queue)
+            queue.put_nowait(None)  # The spare slot: tells the stream to end
+            continue
+        queue.put_nowait((event, data))
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def stream(is_disconnected):
+    """SSE body for one connection; ends when `is_disconnected()` turns true."""
+    queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE + 1)
+    _subscribers.add(queue)
+    try:
+        yield "retry: 3000\n\n"
+        while not await is_disconnected():
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if item is None:
+                return
+            yield format_event(*item)
+    finally:
+        _subscribers.discard(queue)
+
+async def relay_db_events():
+    """Web app side of the DB channel: forwards rows written by the worker while anyone is subscribed."""
+    last_id = None
+    last_heartbeat = 0.0
+    while True:
+        await asyncio.sleep(RELAY_INTERVAL_SECONDS)
+        if not _subscribers:
+            last_id = None
+            continue
+        try:
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_SECONDS:
+                # Tells the worker to stream summaries
+                set_setting('live_subscribers_at', datetime.utcnow().isoformat())
+                last_heartbeat = time.monotonic()
+            if last_id is None:
+                # Start from now, not from events nobody was watching
+                last_id = get_latest_stream_event_id()
+                continue
+            for row in get_stream_events(last_id):
+                last_id = row['id']
+                _deliver(row['event'], json.loads(row['data']))
+        except Exception as e:
+            logger.error(f"Live update relay failed: {e}")
@@ -0,0 +1,46 @@
+"""
+Compact representation of one feed item as it moves through a refresh.
+
+A full refresh keeps every parsed entry alive for the whole job (selection,
+checkpoint, Top-10 lane), so entries are slotted objects with interned feed
+IDs, and the cleaned content is only held until the persist lane has written
+it: after save_articles_bulk the entry drops it (take_content) and the DB row
+is the only copy. The Top-10 fallback reads it back with get_article_content.
+"""
+import sys
+
+class FeedEntry:
+    __slots__ = ('title', 'link', 'published_at', 'image_url', 'content', 'content_length', 'feed_id', 'canonical_url')
+
+    def __init__(self, title, link, published_at, content='', image_url=None, feed_id=None, canonical_url=None):
+        self.title = title
+        self.link = link
+        self.published_at = published_at
+        self.image_url = image_url
+        self.content = content
+        # Kept for ranking after the content itself is released
+        self.content_length = len(content or '')
+        self.feed_id = sys.intern(feed_id) if feed_id else None
+        self.canonical_url = canonical_url
+
+    def __repr__(self):
+        return f"FeedEntry({self.link!r})"
+
+    def set_feed(self, feed_id):
+        self.feed_id = sys.intern(feed_id)
+
+    def take_content(self):
+        """Returns the content and drops this entry's reference to it; call once it is persisted."""
+        content, self.content = self.content, None
+        return content
+
+    def to_dict(self):
+        """Job run checkpoint form; content is None once it has been persisted."""
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        entry = cls(data['title'], data['link'], data['published_at'], data.get('content'), data.get('image_url'),
+                    data.get('feed_id'), data.get('canonical_url'))
+        entry.content_length = data.get('content_length', entry.content_length)
+        return entry
@@ -0,0 +1,99 @@
+"""
+Per-feed adaptive polling.
+
+Instead of polling every feed at the global refresh interval, each feed gets
+its own scheduler job (see scheduler.sync_feed_polls). Busy feeds are polled
+about twice per observed publish interval, quiet ones back off exponentially,
+always within the poll_min_minutes..poll_max_minutes settings.
+"""
+import time
+import aiohttp
+from datetime import datetime, timedelta
+from database import get_setting, filter_new_urls, save_articles_bulk, update_feed_poll_stats
+from rss_fetcher import fetch_feed_async
+from resilience import host_breaker
+from redirects import canonicalize_entries
+from feed_stream import is_streaming_enabled, fetch_feed_streaming
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+def is_adaptive_polling():
+    return get_setting('polling_mode', 'global') == 'adaptive'
+
+def get_poll_bounds():
+    return float(get_setting('poll_min_minutes', 15)), float(get_setting('poll_max_minutes', 720))
+
+def observed_publish_interval(entries):
+    """Mean gap in minutes between the feed's items, or None with fewer than two dated items."""
+    stamps = []
+    for entry in entries:
+        try:
+            stamps.append(datetime.fromisoformat(entry.published_at))
+        except (TypeError, ValueError):
+            continue
+    if len(stamps) < 2:
+        return None
+    stamps.sort()
+    span_minutes = (stamps[-1] - stamps[0]).total_seconds() / 60
+    return span_minutes / (len(stamps) - 1) or None
+
+def _ewma(previous, sample, weight=0.3):
+    if previous is None:
+        return sample
+    if sample is None:
+        return previous
+    return previous * (1 - weight) + sample * weight
+
+def next_poll_interval(current, found_new, publish_interval, min_minutes, max_minutes):
+    if found_new:
+        # Aim for about two polls per published item
+        interval = publish_interval / 2 if publish_interval else current / 2
+    else:
+        interval = current * 2
+    return max(min_minutes, min(max_minutes, interval))
+
+async def poll_feed(feed):
+    """
+    Fetches one feed, saves its new entries (as non-top articles) and updates
+    the feed's polling stats. Returns (new_entries, next_interval_minutes).
+    """
+    min_minutes, max_minutes = get_poll_bounds()
+
+    async with aiohttp.ClientSession() as session:
+        started = time.monotonic()
+        if is_streaming_enabled():
+            result = await fetch_feed_streaming(feed['url'], session)
+        else:
+            result = await fetch_feed_async(feed['url'])
+        fetch_cost_ms = (time.monotonic() - started) * 1000
+        host_breaker.flush()
+
+        entries = result.get('entries', [])
+        if entries:
+            # Resolved redirects are stored in the DB, which filter_new_urls consults
+            await canonicalize_entries(entries, session)
+    new_urls = set(filter_new_urls([entry.link for entry in entries]))
+    new_entries = [entry for entry in entries if entry.link in new_urls]
+    for entry in new_entries:
+        entry.set_feed(feed['id'])
+    save_articles_bulk(new_entries)
+    # The entries wait for the debounced summarization step; their content is in the DB now
+    for entry in new_entries:
+        entry.take_content()
+
+    publish_interval = _ewma(feed['publish_interval_minutes'], observed_publish_interval(entries))
+    current = feed['poll_interval_minutes'] or min_minutes
+    poll_interval = next_poll_interval(current, bool(new_entries), publish_interval, min_minutes, max_minutes)
+
+    now = datetime.utcnow()
+    update_feed_poll_stats(
+        feed['id'],
+        publish_interval,
+        now.isoformat() if new_entries else feed['last_new_item_at'],
+        _ewma(feed['fetch_cost_ms'], fetch_cost_ms),
+        poll_interval,
+        (now + timedelta(minutes=poll_interval)).isoformat()
+    )
+    logger.info(f"Polled feed '{feed['name']}': {len(new_entries)} new, next poll in {poll_interval:.0f} min.")
+    return new_entries, poll_interval
@@ -0,0 +1,234 @@
+"""
+Streaming, size-bounded feed fetch and parse.
+
+Instead of reading the whole response and building a full entry list with
+feedparser, the body is read in chunks into an incremental XML parser and
+entries are handed on in small batches as soon as they are complete. Reading
+stops at feed_max_bytes, at feed_max_items entries, or once the feed has
+moved past the display window. The raw bytes are kept alongside (up to the
+same size limit): a feed that turns out not to be well-formed XML is read to
+the end and handed to feedparser whole, and the entries it finds that were
+not yielded yet follow.
+"""
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from database import get_setting
+from rss_fetcher import clean_html, parse_feed_content
+from feed_entry import FeedEntry
+from resilience import host_breaker, get_host, get_fetch_timeout, CircuitOpenError, HostUnavailableError
+from logger_config import get_logger
+from tracing import span
+from metrics import cpu_timed, fetch_seconds, parse_cpu_seconds
+
+logger = get_logger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+# Feeds are newest-first; this many consecutive out-of-window items ends the read
+OLD_ITEM_STREAK = 5
+
+ENTRY_TAGS = {'item', 'entry'}
+
+def is_streaming_enabled():
+    return get_setting('feed_streaming', 'true') == 'true'
+
+def get_stream_limits():
+    return {
+        'max_bytes': int(float(get_setting('feed_max_mb', 5)) * 1024 * 1024),
+        'max_items': int(get_setting('feed_max_items', 100)),
+        'max_age_hours': float(get_setting('feed_max_age_hours', 24)),
+    }
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else ''
+
+def _text(elem):
+    return ''.join(elem.itertext()).strip()
+
+def _parse_feed_date(text):
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        dt = parsedate_to_datetime(text)  # RSS: RFC 822
+    except (TypeError, ValueError, IndexError):
+        try:
+            dt = datetime.fromisoformat(text.replace('Z', '+00:00'))  # Atom: RFC 3339
+        except ValueError:
+            return None
+    if dt.tzinfo:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+def _entry_from_element(elem):
+    """Builds an entry dict (content still HTML) from an RSS <item> or Atom <entry>."""
+    fields = {}
+    link = None
+    image_url = None
+
+    for child in elem.iter():
+        if child is elem:
+            continue
+        name = _local(child.tag)
+        if name == 'link':
+            # Atom: <link rel="alternate" href="..."/>, RSS: <link>url</link>
+            href = child.get('href')
+            if href and child.get('rel', 'alternate') == 'alternate':
+                link = link or href
+            elif not href and child.text:
+                link = link or child.text.strip()
+        elif name in ('content', 'thumbnail') and child.get('url'):
+            # media:content / media:thumbnail
+            image_url = image_url or child.get('url')
+        elif name == 'enclosure' and (child.get('type') or '').startswith('image/'):
+            image_url = image_url or child.get('url')
+        elif name not in fields:
+            fields[name] = _text(child)
+
+    title = fields.get('title')
+    if not title or not link:
+        return None
+
+    published = None
+    for key in ('pubDate', 'published', 'date', 'updated'):
+        published = _parse_feed_date(fields.get(key))
+        if published:
+            break
+
+    # Same preference order as feedparser: full content, then summary/description
+    content = fields.get('encoded') or fields.get('content') or fields.get('summary') or fields.get('description') or ''
+
+    return {
+        'title': title,
+        'link': link,
+        'published': published,
+        'content': content,
+        'image_url': image_url
+    }
+
+@cpu_timed('feed_clean')
+def _finish_batch(raw_entries):
+    """CPU part of a batch (HTML cleaning); runs in a worker thread."""
+    now = datetime.utcnow().isoformat()
+    entries = []
+    for raw in raw_entries:
+        published_at = raw['published'].isoformat() if raw['published'] else now
+        entries.append(FeedEntry(raw['title'], raw['link'], published_at, clean_html(raw['content']), raw['image_url']))
+    return entries
+
+async def _finish_batch_async(raw_entries):
+    with span('clean_batch', 'cpu', entries=len(raw_entries)):
+        return await asyncio.to_thread(_finish_batch, raw_entries)
+
+async def iter_feed_batches(feed_url, session, batch_size=50, limits=None):
+    """
+    Async generator yielding lists of entry dicts (same shape as
+    parse_feed_content entries) while the feed is still downloading.
+    """
+    limits = limits or get_stream_limits()
+    cutoff = datetime.utcnow() - timedelta(hours=limits['max_age_hours'])
+    host = get_host(feed_url)
+    if not host_breaker.allow(host):
+        raise CircuitOpenError(f"circuit open for {host}")
+
+    started = time.monotonic()
+    parser = ET.XMLPullParser(events=('end',))
+    # The whole document so far, for the feedparser fallback
+    fallback_buffer = bytearray()
+    yielded_links = set()
+    received = 0
+    old_streak = 0
+    batch = []
+    parse_error = None
+    parse_cpu = 0.0
+
+    try:
+        async with session.get(feed_url, timeout=get_fetch_timeout()) as response:
+            if response.status >= 500 or response.status == 429:
+                raise HostUnavailableError(f"HTTP {response.status}")
+            if response.status != 200:
+                # The host answered, so (as in guarded_get_text) this is not a host failure
+                logger.warning(f"Feed {feed_url} returned HTTP {response.status}")
+                host_breaker.record_success(host, (time.monotonic() - started) * 1000)
+                return
+
+            done = False
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                received += len(chunk)
+                if received > limits['max_bytes']:
+                    logger.warning(f"Feed {feed_url} exceeds {limits['max_bytes']} bytes; stopping read.")
+                    break
+                fallback_buffer.extend(chunk)
+                if parse_error is not None:
+                    continue  # Only collecting the rest for feedparser
+                cpu_started = time.thread_time()
+                try:
+                    parser.feed(chunk)
+                    # The pull parser may also hand a ParseError over as an event
+                    for _event, elem in parser.read_events():
+                        if _local(elem.tag) not in ENTRY_TAGS:
+                            continue
+                        raw = _entry_from_element(elem)
+                        elem.clear()  # Drop the subtree, only the small dict is kept
+                        if raw is None:
+                            continue
+                        if raw['published'] and raw['published'] < cutoff:
+                            old_streak += 1
+                            if old_streak >= OLD_ITEM_STREAK:
+                                done = True
+                                break
+                            continue
+                        old_streak = 0
+                        batch.append(raw)
+                        yielded_links.add(raw['link'])
+                        if len(yielded_links) >= limits['max_items']:
+                            done = True
+                            break
+                except ET.ParseError as e:
+                    parse_error = e
+                parse_cpu += time.thread_time() - cpu_started
+
+                if len(batch) >= batch_size:
+                    yield await _finish_batch_async(batch)
+                    batch = []
+                if done:
+                    break
+
+            if batch:
+                yield await _finish_batch_async(batch)
+                batch = []
+
+            if parse_error is not None:
+                # Not well-formed XML (common with hand-rolled feeds): let feedparser cope
+                logger.info(f"Feed {feed_url} is not well-formed ({parse_error}) after {len(yielded_links)} entries; "
+                            f"falling back to feedparser on {len(fallback_buffer)} bytes.")
+                parsed = await asyncio.to_thread(parse_feed_content, bytes(fallback_buffer))
+                entries = [
+                    entry for entry in parsed['entries']
+                    if entry.published_at >= cutoff.isoformat() and entry.link not in yielded_links
+                ][:max(0, limits['max_items'] - len(yielded_links))]
+                for i in range(0, len(entries), batch_size):
+                    yield entries[i:i + batch_size]
+            fallback_buffer = None
+    except Exception as e:
+        host_breaker.record_failure(host, e)
+        fetch_seconds.observe(time.monotonic() - started, host=host, kind='feed', outcome='error')
+        raise
+    finally:
+        # Cancellation or an abandoned generator records no outcome; never keep the probe slot
+        host_breaker.release(host)
+    host_breaker.record_success(host, (time.monotonic() - started) * 1000)
+    fetch_seconds.observe(time.monotonic() - started, host=host, kind='feed', outcome='ok')
+    parse_cpu_seconds.observe(parse_cpu, stage='feed_stream')
+
+async def fetch_feed_streaming(feed_url, session):
+    """Collects iter_feed_batches into the fetch_feed_async result shape."""
+    entries = []
+    try:
+        async for batch in iter_feed_batches(feed_url, session):
+            entries.extend(batch)
+    except Exception as e:
+        logger.error(f"Error fetching {feed_url}: {e}")
+    return {'title': None, 'entries': entries}
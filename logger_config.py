@@ -1,8 +1,64 @@
+import atexit
+import json
 import logging
-import os
-from logging.handlers import RotatingFileHandler
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Records are queued in the calling thread and written by a listener thread,
+# so formatting output, file I/O and rotation never run on the event loop.
+# Modules log through child loggers (get_logger(__name__) -> 'RSSy2.scheduler')
+# so levels can be set per module, see apply_log_settings.
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULT_MAX_MESSAGE_CHARS = 2000
+
+# Callables returning extra fields for a record (e.g. tracing's job/span IDs),
+# evaluated in the thread/context that logs
+_context_providers = []
+_listener = None
+
+class ContextQueueHandler(QueueHandler):
+    """Queues a record with its message rendered, capped and tagged with the current context."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.max_message_chars = DEFAULT_MAX_MESSAGE_CHARS
+
+    def prepare(self, record):
+        message = record.getMessage()
+        if self.max_message_chars and len(message) > self.max_message_chars:
+            message = f"{message[:self.max_message_chars]}... [{len(message) - self.max_message_chars} more chars]"
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg, record.args, record.message = message, None, message
+        if record.exc_info:
+            # Tracebacks hold frames; render them now and drop the references
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        for provider in _context_providers:
+            record.__dict__.update(provider())
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, message, plus job/trace_id/span_id inside traced jobs."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key in ('job', 'trace_id', 'span_id'):
+            value = getattr(record, key, None)
+            if value:
+                entry[key] = value
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
 
 def setup_logging(log_file="rssy2.log"):
+    global _listener
     # Create logger
     logger = logging.getLogger("RSSy2")
     logger.setLevel(logging.INFO)
@@ -11,21 +67,66 @@ def setup_logging(log_file="rssy2.log"):
     if logger.handlers:
         return logger
 
-    # Log format
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formatter = logging.Formatter(TEXT_FORMAT)
 
     # Console Handler
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
     # File Handler (Rotating)
     # Max 5MB per file, keep 3 backups
     file_handler = RotatingFileHandler(log_file, maxBytes=5*1024*1024, backupCount=3, encoding='utf-8')
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
 
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(ContextQueueHandler(log_queue))
+    _listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    # Flushes what is still queued on interpreter exit
+    atexit.register(_listener.stop)
     return logger
 
+def get_logger(name):
+    """Module logger, e.g. get_logger(__name__) -> 'RSSy2.scheduler'."""
+    return logger.getChild(name)
+
+def add_log_context(provider):
+    _context_providers.append(provider)
+
+def _parse_module_levels(text):
+    levels = {}
+    for item in (text or '').replace(';', ',').split(','):
+        name, _, level = item.partition('=')
+        level = level.strip().upper()
+        if name.strip() and isinstance(logging.getLevelName(level), int):
+            levels[name.strip()] = level
+    return levels
+
+_configured_modules = set()
+
+def apply_log_settings(get_setting):
+    """
+    Applies the logging settings stored in the DB:
+    log_level (INFO), log_module_levels ('scheduler=DEBUG,summarizer=WARNING'),
+    log_format ('text' or 'json') and log_max_message_chars (2000, 0 = no cap).
+    """
+    level = str(get_setting('log_level', 'INFO')).upper()
+    logger.setLevel(level if isinstance(logging.getLevelName(level), int) else logging.INFO)
+
+    module_levels = _parse_module_levels(get_setting('log_module_levels', ''))
+    for name in _configured_modules - set(module_levels):
+        get_logger(name).setLevel(logging.NOTSET)
+    for name, module_level in module_levels.items():
+        get_logger(name).setLevel(module_level)
+    _configured_modules.clear()
+    _configured_modules.update(module_levels)
+
+    formatter = JsonFormatter() if get_setting('log_format', 'text') == 'json' else logging.Formatter(TEXT_FORMAT)
+    for handler in _listener.handlers:
+        handler.setFormatter(formatter)
+    for handler in logger.handlers:
+        if isinstance(handler, ContextQueueHandler):
+            handler.max_message_chars = int(get_setting('log_max_message_chars', DEFAULT_MAX_MESSAGE_CHARS))
+
 # Create a shared logger instance
 logger = setup_logging()
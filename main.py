@@ -1,18 +1,33 @@
-from fastapi import FastAPI, Request, Form, HTTPException, BackgroundTasks
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi import FastAPI, Request, Form, HTTPException, BackgroundTasks, UploadFile, File
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, FileResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from database import init_db, add_feed, get_feeds, delete_feed, get_recent_rss_articles, get_last_updated, get_setting, set_setting, get_job_status, get_clien_articles
-from scheduler import start_scheduler, update_feeds_job, update_rss_job, update_clien_job_standalone, update_job_settings
-from logger_config import logger
+from database import init_db, get_feeds, delete_feed, set_feed_active, get_recent_rss_articles, get_last_updated, get_setting, set_setting, get_job_status, get_clien_articles, enqueue_job_request, get_host_health, get_recent_traces, get_trace_spans, get_token_usage_history
+from url_canon import get_host
+from logger_config import get_logger, apply_log_settings
+from tracing import build_waterfall, to_chrome_trace
+from token_budget import usage_summary
+from opml import parse_opml, export_opml, import_feeds
+import events
+from thumbnails import thumb_cache, is_thumb_hash, pick_width
+from metrics import registry, http_request_seconds, CONTENT_TYPE as METRICS_CONTENT_TYPE
 from dotenv import load_dotenv
 import uvicorn
+import asyncio
+import importlib
 import os
+import time
 from datetime import datetime, timedelta
 
+logger = get_logger(__name__)
+
 # Load keys from key.env
 load_dotenv("key.env")
 ADMIN_PIN = os.getenv("ADMIN_PIN", "1234") # Default fallback
+# "embedded": jobs run inside this process. "external": jobs run in worker.py,
+# this process only queues job requests in the DB.
+WORKER_MODE = os.getenv("RSSY2_WORKER_MODE", "embedded")
+MAX_OPML_BYTES = 5 * 1024 * 1024
 
 app = FastAPI(title="RSSy2")
 
@@ -25,11 +40,41 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 templates = Jinja2Templates(directory="templates")
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template, not raw path, to keep the series count bounded
+        route = request.scope.get("route")
+        http_request_seconds.observe(time.perf_counter() - started, route=getattr(route, "path", "unmatched"),
+                                     method=request.method, status=status)
+
+def jobs():
+    """The scheduler module; the pipeline stack (aiohttp, feedparser, Gemini SDK, ...) is only imported with it."""
+    return importlib.import_module('scheduler')
+
+async def start_embedded_jobs():
+    # Import off the loop so the UI is served while the pipeline modules load
+    scheduler = await asyncio.to_thread(jobs)
+    scheduler.start_scheduler()
+    # Pick up a refresh that was interrupted by the last shutdown
+    await scheduler.resume_interrupted_jobs()
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     logger.info("Application starting...")
     init_db()
-    start_scheduler()
+    apply_log_settings(get_setting)
+    if WORKER_MODE == "external":
+        logger.info("External worker mode: scheduler runs in worker.py")
+        asyncio.create_task(events.relay_db_events())
+    else:
+        asyncio.create_task(start_embedded_jobs())
 
 @app.on_event("shutdown")
 def on_shutdown():
@@ -38,17 +83,52 @@ def on_shutdown():
 def is_authenticated(request: Request):
     return request.cookies.get("admin_auth") == "true"
 
+def build_feed_health(feeds):
+    health = get_host_health()
+    rows = []
+    for feed in feeds:
+        host = get_host(feed['url'])
+        stats = health.get(host, {})
+        rows.append({
+            'name': feed['name'],
+            'host': host,
+            'state': stats.get('state', 'unknown'),
+            'consecutive_failures': stats.get('consecutive_failures', 0),
+            'total_failures': stats.get('total_failures', 0),
+            'total_successes': stats.get('total_successes', 0),
+            'last_latency_ms': stats.get('last_latency_ms'),
+            'last_error': stats.get('last_error'),
+            'poll_interval_minutes': feed['poll_interval_minutes'],
+        })
+    return rows
+
+def dispatch_job(background_tasks: BackgroundTasks, job_type: str):
+    if WORKER_MODE == "external":
+        enqueue_job_request(job_type)
+    else:
+        background_tasks.add_task(jobs().JOB_TYPES[job_type])
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
     authenticated = is_authenticated(request)
     articles = get_recent_rss_articles(hours=24)
-    feeds = get_feeds()
+    all_feeds = get_feeds(active_only=False)
+    feeds = [f for f in all_feeds if f['is_active']]
+    inactive_feeds = [f for f in all_feeds if not f['is_active']] if authenticated else []
     
     top_articles = [a for a in articles if a['is_top_selection']]
     other_articles = [a for a in articles if not a['is_top_selection']]
     
     last_updated = get_last_updated()
     clien_articles = get_clien_articles()
+    feed_health = build_feed_health(feeds) if authenticated else []
+    recent_traces = get_recent_traces() if authenticated else []
+    selected_trace = None
+    if authenticated:
+        selected_trace = request.query_params.get('trace') or (recent_traces[0]['trace_id'] if recent_traces else None)
+    trace_waterfall = build_waterfall(get_trace_spans(selected_trace)) if selected_trace else []
+    token_usage = usage_summary() if authenticated else None
+    token_days, token_runs = get_token_usage_history() if authenticated else ([], [])
     
     if last_updated:
         try:
@@ -60,16 +140,30 @@ async def read_root(request: Request):
     # Get Settings
     auto_refresh = get_setting('auto_refresh', 'true') == 'true'
     refresh_interval = int(get_setting('refresh_interval', 120))
+    polling_mode = get_setting('polling_mode', 'global')
+    poll_min_minutes = int(float(get_setting('poll_min_minutes', 15)))
+    poll_max_minutes = int(float(get_setting('poll_max_minutes', 720)))
 
     return templates.TemplateResponse("index.html", {
         "request": request, 
         "top_articles": top_articles,
         "other_articles": other_articles,
         "feeds": feeds,
+        "inactive_feeds": inactive_feeds,
         "last_updated": last_updated,
         "auto_refresh": auto_refresh,
         "refresh_interval": refresh_interval,
+        "polling_mode": polling_mode,
+        "poll_min_minutes": poll_min_minutes,
+        "poll_max_minutes": poll_max_minutes,
         "clien_articles": clien_articles,
+        "feed_health": feed_health,
+        "recent_traces": recent_traces,
+        "selected_trace": selected_trace,
+        "trace_waterfall": trace_waterfall,
+        "token_usage": token_usage,
+        "token_days": token_days,
+        "token_runs": token_runs,
         "authenticated": authenticated
     })
 
@@ -92,9 +186,47 @@ async def create_feed(request: Request, url: str = Form(...), name: str = Form(.
     if not is_authenticated(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
     try:
-        add_feed(url, name)
+        # Probed like an OPML import (a page URL becomes its feed), but kept active whatever the probe found
+        report = await import_feeds([{'url': url.strip(), 'name': name}], keep_active=True)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if WORKER_MODE != "external":
+        jobs().sync_feed_polls()
+    if 'application/json' in request.headers.get('accept', ''):
+        return report
+    return RedirectResponse(url="/", status_code=303)
+
+@app.post("/feeds/import")
+async def import_opml_file(request: Request, file: UploadFile = File(...)):
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    data = await file.read(MAX_OPML_BYTES + 1)
+    if len(data) > MAX_OPML_BYTES:
+        raise HTTPException(status_code=413, detail="OPML file too large")
+    try:
+        candidates = parse_opml(data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid OPML: {e}")
+    report = await import_feeds(candidates)
+    if WORKER_MODE != "external":
+        jobs().sync_feed_polls()
+    return report
+
+@app.get("/feeds/export")
+async def export_opml_file(request: Request):
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(export_opml(get_feeds(active_only=False)), media_type="text/x-opml", headers={
+        "Content-Disposition": 'attachment; filename="rssy2-feeds.opml"'
+    })
+
+@app.post("/feeds/activate")
+async def activate_feed(request: Request, feed_id: str = Form(...)):
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    set_feed_active(feed_id, True)
+    if WORKER_MODE != "external":
+        jobs().sync_feed_polls()
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/feeds/delete")
@@ -102,20 +234,22 @@ async def remove_feed(request: Request, feed_id: str = Form(...)):
     if not is_authenticated(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
     delete_feed(feed_id)
+    if WORKER_MODE != "external":
+        jobs().sync_feed_polls()
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/refresh/rss")
 async def refresh_rss(request: Request, background_tasks: BackgroundTasks):
     if not is_authenticated(request):
          raise HTTPException(status_code=401, detail="Unauthorized")
-    background_tasks.add_task(update_rss_job)
+    dispatch_job(background_tasks, 'rss')
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/refresh/clien")
 async def refresh_clien(request: Request, background_tasks: BackgroundTasks):
     if not is_authenticated(request):
          raise HTTPException(status_code=401, detail="Unauthorized")
-    background_tasks.add_task(update_clien_job_standalone)
+    dispatch_job(background_tasks, 'clien')
     return RedirectResponse(url="/", status_code=303)
 
 @app.post("/refresh")
@@ -124,10 +258,48 @@ async def refresh_feeds(request: Request, background_tasks: BackgroundTasks):
     if not is_authenticated(request):
          raise HTTPException(status_code=401, detail="Unauthorized")
     # Trigger update in background
-    background_tasks.add_task(update_feeds_job)
+    dispatch_job(background_tasks, 'all')
     # Return immediately to let UI poll for status
     return RedirectResponse(url="/", status_code=303)
 
+@app.get("/thumb/{thumb_hash}")
+async def thumbnail(thumb_hash: str, w: int = 640):
+    if not is_thumb_hash(thumb_hash):
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    width = pick_width(w)
+    path = thumb_cache.get_path(thumb_hash, width)
+    if not path:
+        raise HTTPException(status_code=404, detail="Thumbnail not found")
+    # Named by the hash of the source image, so a URL never changes content
+    return FileResponse(path, media_type="image/jpeg", headers={
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{thumb_hash[:16]}-{width}"',
+    })
+
+@app.get("/metrics")
+async def metrics():
+    return Response(registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/traces/{trace_id}/chrome.json")
+async def export_trace(request: Request, trace_id: str):
+    if not is_authenticated(request):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    spans = get_trace_spans(trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    # Load in chrome://tracing or ui.perfetto.dev
+    return JSONResponse(to_chrome_trace(spans), headers={
+        "Content-Disposition": f'attachment; filename="rssy2-trace-{trace_id[:8]}.json"'
+    })
+
+@app.get("/events")
+async def live_events(request: Request):
+    # Server-Sent Events: Top 10 cards and their summaries as they are generated
+    return StreamingResponse(events.stream(request.is_disconnected), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @app.get("/job_status")
 async def check_job_status():
     status = get_job_status('current_refresh')
@@ -136,7 +308,9 @@ async def check_job_status():
     return status
 
 @app.post("/settings")
-async def update_settings(request: Request, auto_refresh: str = Form(None), refresh_interval: int = Form(...)):
+async def update_settings(request: Request, auto_refresh: str = Form(None), refresh_interval: int = Form(...),
+                          polling_mode: str = Form('global'), poll_min_minutes: int = Form(15), poll_max_minutes: int = Form(720),
+                          token_budget_daily: int = Form(0), token_budget_per_job: int = Form(0)):
     if not is_authenticated(request):
         raise HTTPException(status_code=401, detail="Unauthorized")
     # Checkbox sends 'on' if checked, else None
@@ -144,8 +318,15 @@ async def update_settings(request: Request, auto_refresh: str = Form(None), refr
     
     set_setting('auto_refresh', 'true' if is_auto_refresh else 'false')
     set_setting('refresh_interval', refresh_interval)
+    set_setting('polling_mode', 'adaptive' if polling_mode == 'adaptive' else 'global')
+    set_setting('poll_min_minutes', max(1, poll_min_minutes))
+    set_setting('poll_max_minutes', max(poll_min_minutes, poll_max_minutes))
+    set_setting('token_budget_daily', max(0, token_budget_daily))
+    set_setting('token_budget_per_job', max(0, token_budget_per_job))
     
-    update_job_settings(is_auto_refresh, refresh_interval)
+    # In external mode the worker picks the new settings up from the DB
+    if WORKER_MODE != "external":
+        jobs().update_job_settings(is_auto_refresh, refresh_interval)
     
     return RedirectResponse(url="/", status_code=303)
 
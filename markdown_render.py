@@ -0,0 +1,50 @@
+"""
+Server-side Markdown rendering for AI summaries.
+
+Summaries are rendered once, when they are stored (database.py keeps the
+result in summary_html / comment_summary_html), so the page just emits the
+HTML. The model output is untrusted: Markdown's raw HTML handling is turned
+off, so tags in it come out as escaped text, and link/image URLs are limited
+to http(s) and mailto.
+"""
+import html
+import re
+
+# Bumped when the output changes; database.py then renders stored summaries again
+RENDER_VERSION = '2'
+
+_SAFE_SCHEMES = ('http', 'https', 'mailto')
+_URL_ATTR = re.compile(r'\s(href|src)="([^"]*)"')
+_SCHEME = re.compile(r'^([a-zA-Z][a-zA-Z0-9+.-]*):')
+_LIST_ITEM = re.compile(r'^\s*(?:[*+-]|\d+\.)\s')
+
+def _safe_url_attr(match):
+    url = html.unescape(match.group(2))
+    # Browsers ignore whitespace/control characters inside the scheme ("java\tscript:")
+    scheme = _SCHEME.match(re.sub(r'[\x00-\x20]', '', url))
+    if scheme and scheme.group(1).lower() not in _SAFE_SCHEMES:
+        return ''
+    return match.group(0)
+
+def _separate_lists(text):
+    """Gemini starts lists right under a line of text; Python-Markdown needs a blank line there (marked did not)."""
+    lines = []
+    previous = ''
+    for line in text.splitlines():
+        if _LIST_ITEM.match(line) and previous.strip() and not _LIST_ITEM.match(previous):
+            lines.append('')
+        lines.append(line)
+        previous = line
+    return '\n'.join(lines)
+
+def render_summary(text):
+    """Markdown summary -> sanitized HTML ('' for an empty summary)."""
+    if not text:
+        return ''
+    import markdown  # Loaded on the first summary written, not at web app startup
+    # Not shared: summaries are also rendered from worker threads
+    md = markdown.Markdown(extensions=['sane_lists'], output_format='html')
+    md.preprocessors.deregister('html_block')
+    md.inlinePatterns.deregister('html')
+    rendered = md.convert(_separate_lists(text))
+    return _URL_ATTR.sub(_safe_url_attr, rendered)
@@ -0,0 +1,226 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A deliberately small registry (Counter, Gauge, Histogram with labels) so the
+instrumentation can stay on all the time: recording is a dict lookup and a
+few additions under a lock, nothing is exported until /metrics is scraped.
+Values live in the process that records them; with RSSY2_WORKER_MODE=external
+the pipeline metrics come from the worker's own endpoint (worker.py
+--metrics-port), the web process only has the route/DB series.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Seconds; covers a local SQLite query up to a slow Gemini call
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((key, self._snapshot(value)) for key, value in self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _snapshot(self, value):
+        return value
+
+    def _render_series(self, key, value):
+        return [f"{self.name}{_label_text(self.labelnames, key)} {_number(value)}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket (non-cumulative) counts + overflow, sum
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _snapshot(self, value):
+        return value[0][:], value[1]
+
+    def _render_series(self, key, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = f'le="{_number(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, le)} {cumulative}")
+        labels = _label_text(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+fetch_seconds = registry.register(Histogram(
+    'rssy2_fetch_seconds', 'HTTP fetch latency by host, kind (feed, article, clien_list, clien_thread) and outcome.',
+    ('host', 'kind', 'outcome')))
+parse_cpu_seconds = registry.register(Histogram(
+    'rssy2_parse_cpu_seconds', 'CPU time spent parsing/extracting one document, by stage.',
+    ('stage',), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)))
+gemini_call_seconds = registry.register(Histogram(
+    'rssy2_gemini_call_seconds', 'Gemini API call latency (single attempt) by outcome.', ('outcome',)))
+gemini_retries_total = registry.register(Counter(
+    'rssy2_gemini_retries_total', 'Gemini calls retried after a rate limit error.'))
+gemini_rate_limited_total = registry.register(Counter(
+    'rssy2_gemini_rate_limited_total', 'Gemini responses that were 429 / quota errors.'))
+gemini_tokens_total = registry.register(Counter(
+    'rssy2_gemini_tokens_total', 'Gemini tokens used, by kind (prompt, output); estimated when the response has no usage metadata.',
+    ('kind',)))
+gemini_throttle_wait_seconds_total = registry.register(Counter(
+    'rssy2_gemini_throttle_wait_seconds_total', 'Time spent waiting on the client-side rate limit and 429 backoff.',
+    ('reason',)))
+summary_tier_total = registry.register(Counter(
+    'rssy2_summary_tier_total', 'Top 10 summaries by tier (passthrough, raw, extractive, short, full).', ('tier',)))
+db_query_seconds = registry.register(Histogram(
+    'rssy2_db_query_seconds', 'Latency of database.py functions.', ('function',)))
+job_stage_seconds = registry.register(Histogram(
+    'rssy2_job_stage_seconds', 'Refresh job duration by job and stage.', ('job', 'stage'),
+    buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)))
+http_request_seconds = registry.register(Histogram(
+    'rssy2_http_request_seconds', 'Web request latency by route template, method and status.',
+    ('route', 'method', 'status')))
+
+def db_timed(func):
+    """Decorator for database.py functions."""
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            db_query_seconds.observe(time.perf_counter() - started, function=name)
+    return wrapper
+
+def cpu_timed(stage):
+    """Decorator recording the calling thread's CPU time (not wall time) of a parse/extract function."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                parse_cpu_seconds.observe(time.thread_time() - started, stage=stage)
+        return wrapper
+    return decorator
+
+@contextmanager
+def fetch_timer(host, kind):
+    """Times a fetch; the outcome label is 'error' when the block raises."""
+    started = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        fetch_seconds.observe(time.perf_counter() - started, host=host, kind=kind, outcome=outcome)
+
+def stage_timer(job, stage):
+    return job_stage_seconds.time(job=job, stage=stage)
+
+def job_timed(job):
+    """Decorator for async job functions: the whole run is recorded as stage 'total'."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with stage_timer(job, 'total'):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+"""
+OPML import/export of feed subscriptions, with probing of new feeds.
+
+import_feeds() checks every feed before it is added, opml_probe_concurrency
+at a time: the URL is fetched (response time and size measured) and parsed,
+and a web page is followed to the feed it advertises with
+<link rel="alternate">. All feeds are then inserted in one transaction.
+Dead, slow (opml_slow_ms) or oversized (opml_max_feed_kb) feeds are added
+inactive so the refresh jobs don't wait on them (Settings lists them with
+the probe outcome, to activate or delete); the probe time seeds the feed's
+fetch_cost_ms for adaptive polling. A feed added by hand stays active
+whatever the probe found, the outcome is only reported.
+"""
+import asyncio
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from urllib.parse import urljoin
+from database import get_setting, get_feeds, add_feeds_bulk
+from url_canon import get_host
+from metrics import fetch_timer
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+CLIEN_FEED_ID = 'clien-community'
+FEED_LINK_TYPES = ('application/rss+xml', 'application/atom+xml', 'application/rdf+xml', 'application/xml', 'text/xml')
+PROBE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'application/rss+xml, application/atom+xml, application/xml;q=0.9, text/html;q=0.8, */*;q=0.5',
+}
+
+def parse_opml(data):
+    """OPML document -> [{'url', 'name'}] in document order; raises ET.ParseError for invalid XML."""
+    root = ET.fromstring(data)
+    feeds = {}
+    for outline in root.iter('outline'):
+        # htmlUrl-only outlines are probed for an advertised feed
+        url = (outline.get('xmlUrl') or outline.get('htmlUrl') or '').strip()
+        if not url.startswith(('http://', 'https://')):
+            continue
+        feeds.setdefault(url, {'url': url, 'name': outline.get('title') or outline.get('text') or None})
+    return list(feeds.values())
+
+def export_opml(feeds):
+    """OPML 2.0 document (bytes) with one outline per feed; inactive feeds are included."""
+    root = ET.Element('opml', version='2.0')
+    head = ET.SubElement(root, 'head')
+    ET.SubElement(head, 'title').text = 'RSSy2 subscriptions'
+    ET.SubElement(head, 'dateCreated').text = format_datetime(datetime.now(timezone.utc))
+    body = ET.SubElement(root, 'body')
+    for feed in feeds:
+        if feed['id'] == CLIEN_FEED_ID:
+            continue  # Crawled, not a feed
+        name = feed['name'] or feed['url']
+        ET.SubElement(body, 'outline', type='rss', text=name, title=name, xmlUrl=feed['url'])
+    ET.indent(root)
+    return ET.tostring(root, encoding='utf-8', xml_declaration=True)
+
+def get_probe_settings():
+    return {
+        'concurrency': int(get_setting('opml_probe_concurrency', 16)),
+        'slow_ms': float(get_setting('opml_slow_ms', 5000)),
+        'max_bytes': int(float(get_setting('opml_max_feed_kb', 5120)) * 1024),
+    }
+
+def find_feed_link(html, base_url):
+    """URL of the first feed a page advertises with <link rel="alternate">, or None."""
+    from text_extract import parse_html
+
+    try:
+        document = parse_html(html)
+    except Exception:
+        return None
+    for link in document.iter('link'):
+        rel = (link.get('rel') or '').lower().split()
+        if 'alternate' in rel and (link.get('type') or '').lower() in FEED_LINK_TYPES and link.get('href'):
+            return urljoin(base_url, link.get('href').strip())
+    return None
+
+def _parse_feed(data):
+    import feedparser
+
+    parsed = feedparser.parse(data)
+    if not parsed.version and not parsed.entries:
+        return None
+    return {'title': parsed.feed.get('title'), 'entries': len(parsed.entries)}
+
+async def _fetch(session, url, max_bytes):
+    """(final URL, body or None when over max_bytes, Content-Type, ms); raises on HTTP errors."""
+    from resilience import get_fetch_timeout
+
+    started = time.monotonic()
+    with fetch_timer(get_host(url), 'probe'):
+        async with session.get(url, headers=PROBE_HEADERS, timeout=get_fetch_timeout()) as response:
+            if response.status != 200:
+                raise ValueError(f"HTTP {response.status}")
+            data = bytearray()
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > max_bytes:
+                    return str(response.url), None, response.content_type, (time.monotonic() - started) * 1000
+            return str(response.url), bytes(data), response.content_type, (time.monotonic() - started) * 1000
+
+async def probe_feed(session, url, settings):
+    """
+    Fetches and parses `url`, following a page's advertised feed once.
+    Returns {'source_url', 'url', 'status' (ok/slow/large/dead), 'title',
+    'entries', 'elapsed_ms', 'size_bytes', 'discovered', 'error'}.
+    """
+    result = {'source_url': url, 'url': url, 'status': 'dead', 'title': None, 'entries': 0,
+              'elapsed_ms': None, 'size_bytes': 0, 'discovered': False, 'error': None}
+    started = time.monotonic()
+    try:
+        final_url, data, content_type, elapsed_ms = await _fetch(session, url, settings['max_bytes'])
+        feed = await asyncio.to_thread(_parse_feed, data) if data else None
+        if data and feed is None and 'html' in content_type:
+            feed_url = await asyncio.to_thread(find_feed_link, data, final_url)
+            if feed_url:
+                # Time the feed itself, not the page
+                result['discovered'] = True
+                final_url, data, content_type, elapsed_ms = await _fetch(session, feed_url, settings['max_bytes'])
+                feed = await asyncio.to_thread(_parse_feed, data) if data else None
+        result['elapsed_ms'] = elapsed_ms
+        result['url'] = final_url
+        if data is None:
+            result['status'], result['size_bytes'] = 'large', settings['max_bytes']
+            return result
+        result['size_bytes'] = len(data)
+        if feed is None:
+            result['error'] = "not a feed"
+            return result
+        result['title'], result['entries'] = feed['title'], feed['entries']
+        result['status'] = 'slow' if result['elapsed_ms'] > settings['slow_ms'] else 'ok'
+    except Exception as e:
+        result['elapsed_ms'] = (time.monotonic() - started) * 1000
+        result['error'] = str(e) or type(e).__name__
+    return result
+
+async def import_feeds(candidates, keep_active=False):
+    """
+    Probes and adds [{'url', 'name'}] feeds that aren't subscribed yet; with
+    keep_active they are added active even when the probe failed.
+    Returns {'added', 'inactive', 'skipped', 'feeds': [probe result + name/active]}.
+    """
+    import aiohttp
+
+    settings = get_probe_settings()
+    known = {feed['url'] for feed in get_feeds(active_only=False)}
+    pending = [feed for feed in candidates if feed['url'] not in known]
+    semaphore = asyncio.Semaphore(settings['concurrency'])
+
+    async def probe(feed):
+        async with semaphore:
+            return await probe_feed(session, feed['url'], settings)
+
+    started = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(*(probe(feed) for feed in pending))
+
+    rows, report = [], []
+    for feed, result in zip(pending, results):
+        # The advertised / redirected URL may be a feed we already have
+        if result['url'] in known:
+            result['status'] = 'duplicate'
+            report.append(dict(result, name=feed['name'], active=False))
+            continue
+        known.add(result['url'])
+        name = feed['name'] or result['title'] or result['url']
+        active = keep_active or result['status'] == 'ok'
+        rows.append({'url': result['url'], 'name': name, 'is_active': active, 'fetch_cost_ms': result['elapsed_ms'],
+                     'probe_status': result['status'], 'probe_error': result['error']})
+        report.append(dict(result, name=name, active=active))
+    add_feeds_bulk(rows)
+
+    inactive = sum(1 for row in rows if not row['is_active'])
+    logger.info(f"Feed import: probed {len(pending)} feeds in {time.monotonic() - started:.1f}s, "
+                f"added {len(rows)} ({inactive} inactive), skipped {len(candidates) - len(rows)}.")
+    return {'added': len(rows), 'inactive': inactive, 'skipped': len(candidates) - len(rows), 'feeds': report}
@@ -0,0 +1,296 @@
+"""
+Staged RSS refresh pipeline.
+
+    fetch -> parse -+-> persist lane (bulk saves, Top-10 updates)
+                    |
+                    +-> select -> AI lane (body fetch + summarize) -> persist lane
+
+Stages are connected by bounded asyncio queues and each one has its own
+concurrency setting, so the cheap saves of non-top entries never wait behind
+Top-10 body fetches and Gemini calls: entries are in the DB (and the UI)
+right after their feed is parsed. The persist lane is a single consumer that
+writes in a worker thread, in queue order (a Top-10 update must find its
+entry saved), so the fetch and AI lanes keep running during the writes.
+"""
+import asyncio
+import aiohttp
+from database import get_setting, save_articles_bulk, update_article_top_summary, update_feed_last_fetched, get_feed_priorities, get_article_content, get_feeds
+from rss_fetcher import fetch_feed_raw_async, parse_feed_content, fetch_article_body_async
+from prefetch import BodyPrefetcher
+from resilience import host_breaker, get_host, run_with_deadline
+from body_cache import body_cache
+from summarizer import get_summary_tier_settings
+from thumbnails import fetch_thumbnails, thumb_cache
+import events
+from redirects import canonicalize_entries
+from feed_stream import is_streaming_enabled, iter_feed_batches
+from logger_config import get_logger
+from tracing import span
+
+logger = get_logger(__name__)
+
+_STOP = object()
+
+def get_pipeline_settings():
+    return {
+        'fetch_concurrency': int(get_setting('pipeline_fetch_concurrency', 8)),
+        'parse_concurrency': int(get_setting('pipeline_parse_concurrency', 2)),
+        'ai_concurrency': int(get_setting('pipeline_ai_concurrency', 3)),
+        'persist_batch_size': int(get_setting('pipeline_persist_batch_size', 50)),
+        'queue_size': int(get_setting('pipeline_queue_size', 100)),
+        'prefetch_budget': int(get_setting('prefetch_budget', 20)),
+        'prefetch_concurrency': int(get_setting('prefetch_concurrency', 4)),
+        'fetch_stage_deadline': float(get_setting('fetch_stage_deadline_seconds', 60)),
+    }
+
+async def _consume(queue, handler, concurrency):
+    """Runs `concurrency` consumers over `queue` until each receives a stop marker."""
+    async def consumer():
+        while True:
+            item = await queue.get()
+            if item is _STOP:
+                return
+            try:
+                await handler(item)
+            except Exception as e:
+                logger.error(f"Pipeline stage error: {e}")
+
+    await asyncio.gather(*(consumer() for _ in range(concurrency)))
+
+async def _close(queue, concurrency):
+    for _ in range(concurrency):
+        await queue.put(_STOP)
+
+async def process_article(summarizer, entry, session, prefetcher=None, rank=None, tier_settings=None, feed_name=None):
+    """
+    AI lane worker: fetches the full body of a Top-10 entry and summarizes it
+    with the tier its length and selection rank call for. Returns (summary, tier).
+    While browsers are connected the card is announced and the summary streamed to them.
+    """
+    logger.info(f"Summarizing Top 10 item: {entry.title}")
+    on_delta = None
+    if events.is_live():
+        events.publish('summary_start', {
+            'url': entry.link, 'title': entry.title, 'feed_name': feed_name or '', 'published_at': entry.published_at,
+        })
+
+        def on_delta(text):
+            events.publish('summary_delta', {'url': entry.link, 'text': text})
+
+    # Fetch full content for top articles, unless it was prefetched during selection
+    with span('fetch_body', 'network', url=entry.link):
+        full_content = await prefetcher.get(entry.link) if prefetcher else None
+        if full_content is None:
+            full_content = await fetch_article_body_async(entry.link, session=session, cache_key=entry.canonical_url)
+    # Feed content: still on the entry if the persist lane hasn't written it yet, else in the DB
+    context_content = full_content or entry.content
+    if not context_content:
+        context_content = await asyncio.to_thread(get_article_content, entry.link) or ''
+
+    with span('summarize_article', 'gemini', chars=len(context_content), rank=rank):
+        summary, tier = await summarizer.summarize_tiered_async(context_content, rank, tier_settings, on_delta)
+    if not summary:
+        logger.warning("Nothing to summarize. Using the title as the summary.")
+        summary = entry.title
+    logger.info(f"Summary tier for {entry.title}: {tier}")
+    return summary, tier
+
+class RssPipeline:
+    """
+    Owns the shared HTTP session and the persist lane for one RSS refresh.
+    Use as `async with RssPipeline(summarizer) as pipeline:`; leaving the block
+    drains the persist lane.
+    """
+
+    def __init__(self, summarizer, settings=None):
+        self.summarizer = summarizer
+        self.settings = settings or get_pipeline_settings()
+        self.persist_queue = asyncio.Queue(maxsize=self.settings['queue_size'])
+        self.session = None
+        self.prefetcher = None
+        self._persist_task = None
+
+    async def __aenter__(self):
+        # Pick up breaker settings and state written by the other process
+        host_breaker.reload()
+        self.session = aiohttp.ClientSession()
+        self.prefetcher = BodyPrefetcher(self.session, concurrency=self.settings['prefetch_concurrency'])
+        self._persist_task = asyncio.create_task(
+            _consume(self.persist_queue, self._persist, 1)
+        )
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await _close(self.persist_queue, 1)
+        await self._persist_task
+        await self.prefetcher.close()
+        await self.session.close()
+        await events.flush()
+        host_breaker.flush()
+        body_cache.log_stats()
+        thumb_cache.log_stats()
+
+    async def _persist(self, item):
+        kind, payload = item
+        with span('db_write', 'db', kind=kind):
+            summary_html = await asyncio.to_thread(self._write, kind, payload)
+        if kind == 'top':
+            url, _summary, tier, on_done = payload
+            # Live cards switch from the streamed text to the stored rendering
+            events.publish('summary_done', {'url': url, 'html': summary_html, 'tier': tier})
+            if on_done:
+                on_done()
+
+    def _write(self, kind, payload):
+        """Runs in a worker thread; returns the stored summary HTML for 'top'."""
+        if kind == 'entries':
+            save_articles_bulk(payload)
+            # The DB row is the only copy from here on
+            for entry in payload:
+                entry.take_content()
+        elif kind == 'top':
+            url, summary, tier, _on_done = payload
+            return update_article_top_summary(url, summary, tier)
+        elif kind == 'feed_fetched':
+            update_feed_last_fetched(payload)
+
+    async def persist_entries(self, entries):
+        batch_size = self.settings['persist_batch_size']
+        for i in range(0, len(entries), batch_size):
+            await self.persist_queue.put(('entries', entries[i:i + batch_size]))
+
+    async def collect(self, feeds, on_feed_done=None):
+        """
+        Fetch and parse stages. Every parsed entry is handed to the persist lane
+        straight away; returns all entries (FeedEntry, feed_id set) for selection.
+
+        In streaming mode (feed_streaming setting) fetch and parse are fused:
+        each feed is parsed incrementally and its entries arrive in batches
+        while it is still downloading, so no full entry list is ever built.
+        """
+        feed_queue = asyncio.Queue()
+        raw_queue = asyncio.Queue(maxsize=self.settings['queue_size'])
+        all_entries = []
+        fetch_concurrency = self.settings['fetch_concurrency']
+        parse_concurrency = self.settings['parse_concurrency']
+        streaming = is_streaming_enabled()
+
+        for feed in feeds:
+            feed_queue.put_nowait(feed)
+        for _ in range(fetch_concurrency):
+            feed_queue.put_nowait(_STOP)
+
+        in_flight = set()
+        started_count = 0
+
+        async def accept(feed, entries, first_batch):
+            for entry in entries:
+                entry.set_feed(feed['id'])
+            # Resolve feed-proxy links once so dedup sees the real article URL
+            await canonicalize_entries(entries, self.session)
+            all_entries.extend(entries)
+            if first_batch:
+                await self.persist_queue.put(('feed_fetched', feed['id']))
+            await self.persist_entries(entries)
+
+        async def stream(feed):
+            count = 0
+            try:
+                async for batch in iter_feed_batches(feed['url'], self.session, self.settings['persist_batch_size']):
+                    await accept(feed, batch, count == 0)
+                    count += len(batch)
+            except Exception as e:
+                logger.error(f"Error fetching {feed['url']}: {e}")
+            if on_feed_done:
+                on_feed_done(feed, count)
+
+        async def fetch(feed):
+            with span('fetch_feed', 'network', url=feed['url'], streaming=streaming):
+                await fetch_one(feed)
+
+        async def fetch_one(feed):
+            nonlocal started_count
+            started_count += 1
+            in_flight.add(feed['url'])
+            try:
+                if streaming:
+                    await stream(feed)
+                    return
+                content = await fetch_feed_raw_async(feed['url'], self.session)
+            except asyncio.CancelledError:
+                # Straggler cut off at the stage deadline counts against its host
+                host_breaker.record_failure(get_host(feed['url']), "fetch stage deadline exceeded")
+                raise
+            except Exception as e:
+                logger.error(f"Error fetching {feed['url']}: {e}")
+                content = None
+            finally:
+                in_flight.discard(feed['url'])
+            await raw_queue.put((feed, content))
+
+        async def parse(item):
+            feed, content = item
+            entries = []
+            if content:
+                # feedparser + HTML cleaning are CPU bound, keep them off the loop
+                with span('parse_feed', 'cpu', url=feed['url']):
+                    parsed = await asyncio.to_thread(parse_feed_content, content)
+                entries = parsed['entries']
+            if entries:
+                await accept(feed, entries, True)
+            if on_feed_done:
+                on_feed_done(feed, len(entries))
+
+        def on_deadline():
+            skipped = len(feeds) - started_count
+            logger.warning(f"Fetch stage deadline hit: cancelled {len(in_flight)} straggling and skipped {skipped} queued feeds.")
+
+        async def fetch_stage():
+            await run_with_deadline(
+                _consume(feed_queue, fetch, fetch_concurrency),
+                self.settings['fetch_stage_deadline'],
+                on_timeout=on_deadline
+            )
+            await _close(raw_queue, parse_concurrency)
+
+        await asyncio.gather(fetch_stage(), _consume(raw_queue, parse, parse_concurrency))
+        return all_entries
+
+    def start_prefetch(self, entries):
+        """Starts speculative body downloads; call right before the selection request."""
+        budget = self.settings['prefetch_budget']
+        if budget > 0:
+            self.prefetcher.start(entries, budget, get_feed_priorities())
+
+    async def summarize(self, entries, indices, on_item_done=None, ranks=None):
+        """
+        AI lane: body fetch + summarize the selected entries, results go to the
+        persist lane. Their images are turned into local thumbnails meanwhile
+        (only Top 10 cards show an image). `ranks` maps an index to its
+        selection rank when `indices` is not the whole selection.
+        """
+        self.prefetcher.keep_only(entries[idx].link for idx in indices)
+        ranks = ranks or {idx: rank for rank, idx in enumerate(indices)}
+        tier_settings = get_summary_tier_settings()
+        feed_names = {feed['id']: feed['name'] for feed in get_feeds()} if events.is_live() else {}
+        thumbnails = asyncio.create_task(fetch_thumbnails((entries[idx].image_url for idx in indices), self.session))
+        ai_queue = asyncio.Queue()
+        ai_concurrency = self.settings['ai_concurrency']
+        for idx in indices:
+            ai_queue.put_nowait(idx)
+        for _ in range(ai_concurrency):
+            ai_queue.put_nowait(_STOP)
+
+        async def summarize_one(idx):
+            entry = entries[idx]
+            summary, tier = await process_article(self.summarizer, entry, self.session, self.prefetcher,
+                                                  ranks.get(idx), tier_settings, feed_names.get(entry.feed_id))
+            # Completion is reported once the summary is actually stored
+            on_done = (lambda: on_item_done(idx)) if on_item_done else None
+            await self.persist_queue.put(('top', (entry.link, summary, tier, on_done)))
+
+        await _consume(ai_queue, summarize_one, ai_concurrency)
+        try:
+            await thumbnails
+        except Exception as e:
+            logger.error(f"Thumbnail stage error: {e}")
@@ -0,0 +1,136 @@
+"""
+Speculative article-body prefetch.
+
+While the Top-10 selection call is in flight (including the Gemini throttle),
+the most likely candidates already have their bodies downloaded and extracted.
+Results land in an in-memory LRU that process_article reads from, so the AI
+lane starts summarizing instead of waiting on the network.
+"""
+import asyncio
+import re
+from collections import OrderedDict
+from datetime import datetime
+from rss_fetcher import fetch_article_body_async
+from logger_config import get_logger
+from tracing import span
+
+logger = get_logger(__name__)
+
+# Mirrors the "economic and technical topics" focus of the selection prompt
+KEYWORD_PATTERN = re.compile(
+    r"econom|market|stock|rate|inflation|bank|invest|earning|semiconductor|chip|\bai\b|"
+    r"tech|software|apple|google|samsung|nvidia|microsoft|startup|"
+    r"경제|금리|증시|주가|환율|물가|반도체|기술|투자|실적|인공지능|삼성|애플|구글",
+    re.IGNORECASE
+)
+
+class BodyLRU:
+    """Small LRU of extracted article bodies keyed by URL."""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+
+    def get(self, url):
+        if url not in self._items:
+            return None
+        self._items.move_to_end(url)
+        return self._items[url]
+
+    def put(self, url, text):
+        self._items[url] = text
+        self._items.move_to_end(url)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+# Shared across runs: stories often stay in the Top 10 for several refreshes
+body_lru = BodyLRU()
+
+def score_candidate(entry, feed_priority=0.0, now=None):
+    """Cheap local guess of how likely the selection call is to pick an entry."""
+    now = now or datetime.utcnow()
+    score = 0.0
+
+    score += 2.0 * len(KEYWORD_PATTERN.findall(entry.title or ''))
+
+    # The prompt tells the model to ignore entries with no or too short text
+    content_len = entry.content_length
+    if content_len < 80:
+        score -= 3.0
+    else:
+        score += min(content_len / 1000.0, 2.0)
+
+    try:
+        age_hours = (now - datetime.fromisoformat(entry.published_at)).total_seconds() / 3600
+        score += max(0.0, 3.0 - age_hours / 8.0)
+    except (TypeError, ValueError):
+        pass
+
+    return score + 4.0 * feed_priority
+
+def rank_candidates(entries, feed_priorities=None):
+    feed_priorities = feed_priorities or {}
+    now = datetime.utcnow()
+    return sorted(
+        range(len(entries)),
+        key=lambda i: score_candidate(entries[i], feed_priorities.get(entries[i].feed_id, 0.0), now),
+        reverse=True
+    )
+
+class BodyPrefetcher:
+    """
+    Downloads bodies for the top `budget` ranked candidates with bounded
+    concurrency. process_article calls get(), which returns a cached body,
+    waits for an in-flight download, or returns None on a miss.
+    """
+
+    def __init__(self, session, lru=body_lru, concurrency=4):
+        self.session = session
+        self.lru = lru
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.tasks = {}
+        self.hits = 0
+        self.misses = 0
+
+    def start(self, entries, budget, feed_priorities=None):
+        for idx in rank_candidates(entries, feed_priorities)[:budget]:
+            url = entries[idx].link
+            if url in self.tasks or self.lru.get(url) is not None:
+                continue
+            self.tasks[url] = asyncio.create_task(self._fetch(url, entries[idx].canonical_url))
+        logger.info(f"Prefetching {len(self.tasks)} article bodies during Top 10 selection.")
+
+    async def _fetch(self, url, cache_key=None):
+        async with self.semaphore:
+            with span('prefetch_body', 'network', url=url):
+                text = await fetch_article_body_async(url, session=self.session, cache_key=cache_key)
+        if text:
+            self.lru.put(url, text)
+        return text
+
+    async def get(self, url):
+        text = self.lru.get(url)
+        if text is None and url in self.tasks:
+            try:
+                text = await self.tasks[url]
+            except asyncio.CancelledError:
+                text = None
+        if text:
+            self.hits += 1
+            return text
+        self.misses += 1
+        return None
+
+    def keep_only(self, urls):
+        """Cancels speculative downloads that the selection didn't pick."""
+        keep = set(urls)
+        for url, task in self.tasks.items():
+            if url not in keep and not task.done():
+                task.cancel()
+
+    async def close(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        if self.hits or self.misses:
+            logger.info(f"Body prefetch: {self.hits} hits, {self.misses} misses.")
@@ -0,0 +1,46 @@
+"""
+Redirect resolution for feed-proxy and shortener URLs.
+
+Links on REDIRECTOR_HOSTS (feedburner, t.co, ...) are resolved once with a
+HEAD request; the result is kept in the url_redirects table so dedup, body
+caching and the canonical_url key all see the real article URL.
+"""
+import asyncio
+import aiohttp
+from database import get_url_redirects, save_url_redirects
+from url_canon import canonicalize_url, is_redirector
+from logger_config import get_logger
+
+logger = get_logger(__name__)
+
+async def _resolve_one(session, url, semaphore):
+    async with semaphore:
+        try:
+            async with session.head(url, allow_redirects=True, timeout=aiohttp.ClientTimeout(total=10)) as response:
+                target = str(response.url)
+                return url, target if target != url else None
+        except Exception as e:
+            logger.warning(f"Could not resolve redirect for {url}: {e}")
+            return url, None
+
+async def resolve_redirects(urls, session, concurrency=8):
+    """Returns {url: final_url} for the given URLs, resolving unknown redirector links."""
+    candidates = [url for url in dict.fromkeys(urls) if is_redirector(url)]
+    if not candidates:
+        return {}
+    known = get_url_redirects(candidates)
+    unknown = [url for url in candidates if url not in known]
+    if unknown:
+        semaphore = asyncio.Semaphore(concurrency)
+        results = await asyncio.gather(*(_resolve_one(session, url, semaphore) for url in unknown))
+        resolved = {url: target for url, target in results if target}
+        save_url_redirects(resolved)
+        known.update(resolved)
+    return known
+
+async def canonicalize_entries(entries, session):
+    """Sets entry.canonical_url (redirects resolved) on each entry in place."""
+    redirects = await resolve_redirects([entry.link for entry in entries], session)
+    for entry in entries:
+        entry.canonical_url = canonicalize_url(redirects.get(entry.link, entry.link))
+    return entries
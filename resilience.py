@@ -0,0 +1,149 @@
+"""
+Fetch resilience: per-request timeouts, per-host circuit breaker.
+
+A host that keeps failing (connection errors, timeouts, 5xx/429, or being cut
+off at a stage deadline) is "opened" after breaker_failure_threshold
+consecutive failures and skipped for breaker_cooldown_minutes. After the
+cooldown one request is let through as a half-open probe: success closes the
+breaker, failure opens it again. State lives in the host_health table so it
+survives restarts and is visible in the Settings tab.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+import aiohttp
+from database import get_setting, get_host_health, save_host_health
+from logger_config import get_logger
+from metrics import fetch_timer
+from url_canon import get_host
+
+logger = get_logger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    pass
+
+class HostUnavailableError(Exception):
+    pass
+
+def get_fetch_timeout():
+    return aiohttp.ClientTimeout(total=float(get_setting('fetch_timeout_seconds', 15)))
+
+class HostCircuitBreaker:
+    def __init__(self):
+        self.hosts = None
+        self.dirty = set()
+        self.probing = set()
+
+    def _load(self):
+        if self.hosts is None:
+            self.hosts = get_host_health()
+            self.failure_threshold = int(get_setting('breaker_failure_threshold', 3))
+            self.cooldown = timedelta(minutes=float(get_setting('breaker_cooldown_minutes', 30)))
+
+    def _row(self, host):
+        self._load()
+        if host not in self.hosts:
+            self.hosts[host] = {
+                'host': host, 'state': CLOSED, 'consecutive_failures': 0, 'total_failures': 0,
+                'total_successes': 0, 'last_error': None, 'last_latency_ms': None,
+                'opened_at': None, 'updated_at': None
+            }
+        return self.hosts[host]
+
+    def allow(self, host):
+        row = self._row(host)
+        if row['state'] == CLOSED:
+            return True
+        if host in self.probing:
+            return False
+        opened_at = datetime.fromisoformat(row['opened_at']) if row['opened_at'] else datetime.min
+        if datetime.utcnow() - opened_at < self.cooldown:
+            return False
+        # Cooldown over: let exactly one probe through
+        row['state'] = HALF_OPEN
+        self.probing.add(host)
+        self.dirty.add(host)
+        return True
+
+    def release(self, host):
+        """Frees a half-open probe slot without recording an outcome (e.g. our own cancellation)."""
+        self.probing.discard(host)
+
+    def record_success(self, host, latency_ms):
+        row = self._row(host)
+        self.probing.discard(host)
+        row.update(state=CLOSED, consecutive_failures=0, last_latency_ms=latency_ms,
+                   updated_at=datetime.utcnow().isoformat())
+        row['total_successes'] += 1
+        self.dirty.add(host)
+
+    def record_failure(self, host, error):
+        row = self._row(host)
+        self.probing.discard(host)
+        now = datetime.utcnow().isoformat()
+        row['consecutive_failures'] += 1
+        row['total_failures'] += 1
+        row.update(last_error=str(error)[:200] or type(error).__name__, updated_at=now)
+        if row['state'] == HALF_OPEN or row['consecutive_failures'] >= self.failure_threshold:
+            if row['state'] != OPEN:
+                logger.warning(f"Circuit opened for host {host} after {row['consecutive_failures']} failures.")
+            row.update(state=OPEN, opened_at=now)
+        self.dirty.add(host)
+
+    def flush(self):
+        """Persists the hosts touched since the last flush in one transaction."""
+        if not self.dirty:
+            return
+        save_host_health([self.hosts[host] for host in self.dirty])
+        self.dirty.clear()
+
+    def reload(self):
+        """Drops the in-memory view so settings and state are re-read from the DB."""
+        self.flush()
+        self.hosts = None
+        self.probing.clear()
+
+# Shared by all fetches in this process
+host_breaker = HostCircuitBreaker()
+
+async def guarded_get_text(session, url, headers=None, timeout=None, breaker=host_breaker, kind='fetch'):
+    """
+    GET `url` through the host's circuit breaker with a per-request timeout.
+    Returns (status, text, headers). Raises CircuitOpenError when the host is being skipped.
+    """
+    host = get_host(url)
+    if not breaker.allow(host):
+        raise CircuitOpenError(f"circuit open for {host}")
+
+    started = time.monotonic()
+    try:
+        with fetch_timer(host, kind):
+            async with session.get(url, headers=headers, timeout=timeout or get_fetch_timeout()) as response:
+                if response.status >= 500 or response.status == 429:
+                    raise HostUnavailableError(f"HTTP {response.status}")
+                text = await response.text() if response.status == 200 else ""
+                response_headers = response.headers
+    except asyncio.CancelledError:
+        breaker.release(host)
+        raise
+    except Exception as e:
+        breaker.record_failure(host, e)
+        raise
+    breaker.record_success(host, (time.monotonic() - started) * 1000)
+    return response.status, text, response_headers
+
+async def run_with_deadline(coro, deadline, on_timeout=None):
+    """
+    Awaits `coro` for at most `deadline` seconds. At the deadline the work is
+    cancelled (stragglers included) and on_timeout() is called.
+    """
+    try:
+        return await asyncio.wait_for(coro, timeout=deadline)
+    except asyncio.TimeoutError:
+        if on_timeout:
+            on_timeout()
+        return None
@@ -2,8 +2,13 @@ import feedparser
 from datetime import datetime
 import calendar
 from time import mktime
-from bs4 import BeautifulSoup
-import trafilatura
+from lxml import etree
+from text_extract import html_to_text, parse_html, element_text
+from feed_entry import FeedEntry
+from metrics import cpu_timed
+from logger_config import get_logger
+
+logger = get_logger(__name__)
 
 def parse_date(entry):
     if hasattr(entry, 'published_parsed'):
@@ -16,118 +21,125 @@ def clean_html(text):
     if not text:
         return ""
     try:
-        soup = BeautifulSoup(text, 'html.parser')
-        # preserve some structure or just get text? 
         # Requirement: "HTML 부분이 나오지 않게" -> Just text is safest and best for tokens
-        return soup.get_text(separator=' ', strip=True) 
+        return html_to_text(text)
     except Exception:
         return text
 
-def fetch_feed(feed_url):
-    feed = feedparser.parse(feed_url)
-    entries = []
-    
-    for entry in feed.entries:
-        # Extract image if available
-        image_url = None
-        if 'media_content' in entry:
-            image_url = entry.media_content[0]['url']
-        elif 'media_thumbnail' in entry:
-            image_url = entry.media_thumbnail[0]['url']
-            
-        content = ""
-        if 'content' in entry:
-            content = entry.content[0].value
-        elif 'summary' in entry:
-            content = entry.summary
-        elif 'description' in entry:
-            content = entry.description
+def _entry_from_feedparser(entry):
+    # Extract image if available
+    image_url = None
+    if 'media_content' in entry:
+        image_url = entry.media_content[0]['url']
+    elif 'media_thumbnail' in entry:
+        image_url = entry.media_thumbnail[0]['url']
         
-        # Clean HTML from content
-        content = clean_html(content)
-            
-        entries.append({
-            'title': entry.title,
-            'link': entry.link,
-            'published_at': parse_date(entry),
-            'content': content,
-            'image_url': image_url
-        })
+    content = ""
+    if 'content' in entry:
+        content = entry.content[0].value
+    elif 'summary' in entry:
+        content = entry.summary
+    elif 'description' in entry:
+        content = entry.description
+    
+    # Clean HTML from content
+    content = clean_html(content)
         
+    return FeedEntry(entry.title, entry.link, parse_date(entry), content, image_url)
+
+@cpu_timed('feed_parse')
+def parse_feed_content(content):
+    """Parses a feed document (URL or raw XML) into FeedEntry objects. CPU bound."""
+    feed = feedparser.parse(content)
     return {
         'title': feed.feed.get('title', 'Unknown Feed'),
-        'entries': entries
+        'entries': [_entry_from_feedparser(entry) for entry in feed.entries]
     }
 
+def fetch_feed(feed_url):
+    return parse_feed_content(feed_url)
+
 import aiohttp
 import asyncio
+from resilience import guarded_get_text
+from body_cache import body_cache, conditional_headers, get_body_ttl
+from url_canon import canonicalize_url
+
+async def fetch_feed_raw_async(feed_url, session):
+    # Timeout + per-host circuit breaker; a hanging feed server can't stall the refresh
+    status, text, _headers = await guarded_get_text(session, feed_url, kind='feed')
+    return text
 
 async def fetch_feed_async(feed_url):
     async with aiohttp.ClientSession() as session:
         try:
-            async with session.get(feed_url) as response:
-                content = await response.text()
-                # Run feedparser in a thread executor as it is CPU bound parsing
-                feed = await asyncio.to_thread(feedparser.parse, content)
-                
-                entries = []
-                for entry in feed.entries:
-                    # Extract image if available
-                    image_url = None
-                    if 'media_content' in entry:
-                        image_url = entry.media_content[0]['url']
-                    elif 'media_thumbnail' in entry:
-                        image_url = entry.media_thumbnail[0]['url']
-                        
-                    content_text = ""
-                    if 'content' in entry:
-                        content_text = entry.content[0].value
-                    elif 'summary' in entry:
-                        content_text = entry.summary
-                    elif 'description' in entry:
-                        content_text = entry.description
-                    
-                    # Clean HTML from content
-                    content_text = clean_html(content_text)
-                        
-                    entries.append({
-                        'title': entry.title,
-                        'link': entry.link,
-                        'published_at': parse_date(entry),
-                        'content': content_text,
-                        'image_url': image_url
-                    })
-                    
-                return {
-                    'title': feed.feed.get('title', 'Unknown Feed'),
-                    'entries': entries
-                }
+            content = await fetch_feed_raw_async(feed_url, session)
+            # Run feedparser in a thread executor as it is CPU bound parsing
+            return await asyncio.to_thread(parse_feed_content, content)
         except Exception as e:
-            print(f"Error fetching {feed_url}: {e}")
+            logger.error(f"Error fetching {feed_url}: {e}")
             return {'title': 'Error', 'entries': []}
 
-async def fetch_article_body_async(url):
+async def fetch_article_body_async(url, session=None, cache_key=None):
     """
-    Fetches the full HTML content of the article and extracts text using BeautifulSoup.
+    Fetches the full HTML content of the article and extracts text using trafilatura.
     This is used for Top 10 articles to get better summarization context.
+    cache_key defaults to the canonical form of `url`.
     """
     headers = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
     }
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=10) as response:
-                if response.status != 200:
-                    return ""
-                
-                html = await response.text()
-                # Use thread for parsing
-                return await asyncio.to_thread(_extract_text_from_html, html)
+        if session is None:
+            async with aiohttp.ClientSession() as own_session:
+                return await _fetch_article_body(url, own_session, headers, cache_key)
+        return await _fetch_article_body(url, session, headers, cache_key)
     except Exception as e:
-        print(f"Error fetching article body {url}: {e}")
+        logger.warning(f"Error fetching article body {url}: {e}")
         return ""
 
+async def _fetch_article_body(url, session, headers, cache_key=None):
+    # Stories often stay in the Top 10 across refreshes: reuse the extracted text
+    cache_key = cache_key or canonicalize_url(url)
+    record = await asyncio.to_thread(body_cache.get, cache_key)
+    if body_cache.is_fresh(record, get_body_ttl()):
+        body_cache.record_lookup('hits')
+        return record['payload']
+
+    request_headers = dict(headers, **conditional_headers(record))
+    status, html, response_headers = await guarded_get_text(session, url, headers=request_headers, timeout=aiohttp.ClientTimeout(total=10), kind='article')
+    if status == 304 and record:
+        body_cache.record_lookup('revalidated')
+        await asyncio.to_thread(body_cache.touch, cache_key)
+        return record['payload']
+
+    body_cache.record_lookup('misses')
+    if status != 200 or not html:
+        return ""
+    # Use thread for parsing
+    text = await asyncio.to_thread(_extract_text_from_html, html)
+    if text:
+        await asyncio.to_thread(body_cache.put, cache_key, text, response_headers.get('ETag'), response_headers.get('Last-Modified'), html)
+    return text
+
+_BOILERPLATE_XPATH = etree.XPath('//script|//style|//nav|//footer|//header|//aside')
+_PARAGRAPH_XPATH = etree.XPath('//p')
+
+def _paragraph_text(html):
+    """Longer <p> texts outside page chrome, joined with spaces."""
+    try:
+        root = parse_html(html)
+    except (etree.ParserError, ValueError):
+        return ""
+    for element in _BOILERPLATE_XPATH(root):
+        element.drop_tree()
+    paragraphs = (element_text(p, separator='', strip=False).strip() for p in _PARAGRAPH_XPATH(root))
+    return ' '.join(text for text in paragraphs if len(text) > 20)
+
+@cpu_timed('article_extract')
 def _extract_text_from_html(html):
+    # Heavy import, only needed once article bodies are fetched
+    import trafilatura
     try:
         # Use trafilatura for high-quality main content extraction
         downloaded = trafilatura.extract(html, include_comments=False, include_tables=True, no_fallback=False)
@@ -135,20 +147,13 @@ def _extract_text_from_html(html):
         if downloaded:
             return downloaded
             
-        # Fallback to BeautifulSoup if trafilatura fails
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "footer", "header", "aside"]):
-            script.decompose()
-
-        paragraphs = soup.find_all('p')
-        text = ' '.join([p.get_text().strip() for p in paragraphs if len(p.get_text().strip()) > 20])
+        # Fallback to the page's paragraphs if trafilatura fails
+        text = _paragraph_text(html)
         
         if not text:
-            text = soup.get_text(separator=' ', strip=True)
+            text = html_to_text(html)
             
         return text
     except Exception as e:
-        print(f"Error extracting text: {e}")
+        logger.warning(f"Error extracting text: {e}")
         return ""
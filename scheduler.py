@@ -1,142 +1,95 @@
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from database import get_feeds, save_article, update_article_summary, cleanup_old_articles, filter_new_urls, update_feed_last_fetched, get_setting, clear_articles, update_job_status
-from rss_fetcher import fetch_feed_async, fetch_article_body_async
-from clien_fetcher import fetch_clien_list, fetch_clien_article_full
-from summarizer import GeminiSummarizer
-from logger_config import logger
+from database import get_feeds, get_feed, save_article, update_article_summary, cleanup_old_articles, filter_new_urls, update_feed_last_fetched, get_setting, set_setting, clear_articles, update_comment_counts, get_thread_states, update_thread_summary, update_job_status, create_job_run, save_job_run_selection, mark_job_run_item_done, get_job_run_done_items, finish_job_run, get_interrupted_job_runs, update_job_run_candidates
+from pipeline import RssPipeline
+from feed_entry import FeedEntry
+from prefetch import rank_candidates
+from feed_polling import is_adaptive_polling, poll_feed
+from clien_fetcher import fetch_clien_list, fetch_clien_article_full, get_clien_crawl_settings, thread_fingerprint
+from summarizer import get_summarizer, local_summary
+from logger_config import get_logger
+from metrics import stage_timer, job_timed
+from tracing import span, traced_job
 import asyncio
-from datetime import datetime, timedelta
+import math
+from datetime import datetime, timedelta, timezone
 
-# Use AsyncIOScheduler
-scheduler = AsyncIOScheduler()
-summarizer = GeminiSummarizer()
+logger = get_logger(__name__)
 
 JOB_ID = 'current_refresh'
 CLIEN_FEED_ID = 'clien-community'
+# Most comments that go into one Clien prompt
+CLIEN_PROMPT_COMMENTS = 50
 
-async def process_article(feed_id, entry, is_top_candidate, semaphore):
-    summary = ""
-    is_top = False
-    
-    # Check if this article was selected as Top 10
-    # Note: Logic slightly changed here. 
-    # Instead of batch select then process, we might want to batch select first.
-    # The original code did: select Top 10 indices from ALL new entries.
-    
-    # So process_article will just handle summarization IF it was marked as top.
-    
-    async with semaphore:
-        if is_top_candidate:
-            logger.info(f"Summarizing Top 10 item: {entry['title']}")
-            
-            # Fetch full content for top articles
-            full_content = await fetch_article_body_async(entry['link'])
-            context_content = full_content if full_content else entry['content']
-            
-            summary = await summarizer.summarize_short_async(context_content)
-            if not summary:
-                 logger.warning("Summarization failed. Using original content as fallback.")
-                 summary = context_content[:500] + "..." # Truncate fallback
-            is_top = True
+# New entries found by per-feed polls, waiting for the shared summarization step.
+# They are checkpointed as a 'summarize_pending' job run so a restart doesn't drop them.
+pending_entries = []
+_pending_run_id = None
+
+_scheduler = None
+
+def get_scheduler():
+    """The AsyncIOScheduler, created on first use so importing this module doesn't load APScheduler."""
+    global _scheduler
+    if _scheduler is None:
+        from apscheduler.schedulers.asyncio import AsyncIOScheduler
+        _scheduler = AsyncIOScheduler()
+    return _scheduler
+
+@traced_job('rss')
+@job_timed('rss')
+async def update_rss_job(resume_run=None):
+    async with RssPipeline(get_summarizer()) as pipeline:
+        if resume_run:
+            logger.info(f"Resuming interrupted RSS update job {resume_run['id']}...")
+            run_id = resume_run['id']
+            all_new_entries = [FeedEntry.from_dict(data) for data in resume_run['candidates']]
+            top_10_indices = resume_run['selected']
+            done_items = get_job_run_done_items(run_id)
+            update_job_status(JOB_ID, "processing", "Resuming RSS update...", len(all_new_entries), 0)
+            # Entries still holding content hadn't been written by the persist lane when the checkpoint was taken
+            await pipeline.persist_entries([entry for entry in all_new_entries if entry.content is not None])
         else:
-            # logger.info(f"Saving standard item: {entry['title']}") 
-            summary = entry['content']
-
-    # Sync DB write
-    save_article(
-        feed_id,
-        entry['title'],
-        entry['link'],
-        entry['published_at'],
-        entry['content'],
-        entry['image_url'],
-        summary=summary,
-        is_top_selection=is_top
-    )
-    return 1 # Processed count
-
-async def update_rss_job():
-    logger.info("Starting async RSS feed update job...")
-    update_job_status(JOB_ID, "fetching", "Starting RSS update...", 0, 0)
-    
-    # 1. Clear RSS articles
-    logger.info("Clearing existing RSS articles...")
-    clear_articles('rss')
-    
-    # 2. Fetch Feeds
-    feeds = get_feeds(active_only=True)
-    update_job_status(JOB_ID, "fetching", f"Fetching {len(feeds)} feeds...", len(feeds), 0)
-    
-    fetch_tasks = [fetch_feed_async(feed['url']) for feed in feeds]
-    results = await asyncio.gather(*fetch_tasks)
-    
-    all_new_entries = []
-    
-    for i, feed in enumerate(feeds):
-        res = results[i]
-        feed_id = feed['id']
-        entries = res.get('entries', [])
-        
-        if entries:
-            # Update last fetched
-            update_feed_last_fetched(feed_id)
+            logger.info("Starting async RSS feed update job...")
+            update_job_status(JOB_ID, "fetching", "Starting RSS update...", 0, 0)
             
-            # Since we cleared DB, all fetched are "new" effectively.
-            # But filter_new_urls logic is still good if we run frequent updates without clearing?
+            # 1. Clear RSS articles
+            logger.info("Clearing existing RSS articles...")
+            clear_articles('rss')
+            
+            # 2. Fetch + parse feeds. Every entry is saved by the persist lane as soon as
+            # its feed is parsed, so non-top articles show up right away.
             # User requirement: "Fetch할 때 마다 기존 DB는 무시하고 새로 list를 build"
-            # So everything fetched IS new.
-            for entry in entries:
-                entry['feed_id'] = feed_id # Tag with feed ID
-                all_new_entries.append(entry)
-                
-    update_job_status(JOB_ID, "processing", f"Found {len(all_new_entries)} articles. Selecting Top 10...", len(all_new_entries), 0)
-    
-    if not all_new_entries:
-        logger.info("No articles found.")
-        update_job_status(JOB_ID, "completed", "No articles found.", 0, 0)
-        return
+            feeds = get_feeds(active_only=True)
+            update_job_status(JOB_ID, "fetching", f"Fetching {len(feeds)} feeds...", len(feeds), 0)
+            
+            fetched_count = 0
+            
+            def on_feed_done(feed, entry_count):
+                nonlocal fetched_count
+                fetched_count += 1
+                update_job_status(JOB_ID, "fetching", f"Fetched {fetched_count}/{len(feeds)} feeds...", len(feeds), fetched_count)
+            
+            with stage_timer('rss', 'collect'), span('collect', 'job'):
+                all_new_entries = await pipeline.collect(feeds, on_feed_done=on_feed_done)
+                        
+            update_job_status(JOB_ID, "processing", f"Found {len(all_new_entries)} articles. Selecting Top 10...", len(all_new_entries), 0)
+            
+            if not all_new_entries:
+                logger.info("No articles found.")
+                update_job_status(JOB_ID, "completed", "No articles found.", 0, 0)
+                return
 
-    # 3. Select Top 10
-    top_10_indices = []
-    titles = [entry['title'] for entry in all_new_entries]
-    
-    if len(titles) > 10:
-        top_10_indexes_result = await summarizer.select_top_10_async(titles)
-        if not top_10_indexes_result:
-             logger.warning("Top 10 selection failed. Fallback to first 10.")
-             top_10_indices = list(range(10))
-        else:
-            top_10_indices = top_10_indexes_result
-            logger.info(f"Selected Top 10 indices: {top_10_indices}")
-    else:
-        top_10_indices = list(range(len(titles)))
+            # Checkpoint the candidate list so a restart doesn't refetch everything
+            run_id = create_job_run('rss', [entry.to_dict() for entry in all_new_entries])
+            top_10_indices = None
+            done_items = set()
 
-    top_10_set = set(top_10_indices)
-    
-    # 4. Process/Summarize Articles
-    update_job_status(JOB_ID, "summarizing", "Summarizing articles...", len(all_new_entries), 0)
-    
-    semaphore = asyncio.Semaphore(3) # Limit concurrent AI calls
-    process_tasks = []
-    
-    processed_count = 0
-    
-    async def process_wrapper(idx, entry):
-        nonlocal processed_count
         try:
-            is_top = idx in top_10_set
-            await process_article(entry['feed_id'], entry, is_top, semaphore)
-        except Exception as e:
-            logger.error(f"Error processing article {entry.get('title', 'Unknown')}: {e}")
-        finally:
-            processed_count += 1
-            # Update status
-            update_job_status(JOB_ID, "summarizing", f"Processing... {processed_count}/{len(all_new_entries)}", len(all_new_entries), processed_count)
-
-    for i, entry in enumerate(all_new_entries):
-        process_tasks.append(process_wrapper(i, entry))
-        
-    await asyncio.gather(*process_tasks)
+            await _process_rss_run(pipeline, run_id, all_new_entries, top_10_indices, done_items)
+        except Exception:
+            finish_job_run(run_id, 'failed')
+            raise
+
+    finish_job_run(run_id, 'completed')
     
     # 5. Cleanup
     cleanup_old_articles(days=7)
@@ -144,115 +97,458 @@ async def update_rss_job():
     update_job_status(JOB_ID, "completed", "RSS update completed.", len(all_new_entries), len(all_new_entries))
     logger.info("RSS feed update job completed.")
 
-async def update_feeds_job():
-    """Combined job for scheduled tasks"""
+async def _process_rss_run(pipeline, run_id, all_new_entries, top_10_indices, done_items):
+    # 3. Select Top 10 (skipped when resuming after the selection was checkpointed)
+    if top_10_indices is None:
+        titles = [entry.title for entry in all_new_entries]
+        
+        if len(titles) > 10:
+            # Overlap likely body downloads with the (throttled) selection call
+            pipeline.start_prefetch(all_new_entries)
+            with stage_timer('rss', 'select'), span('select', 'job'):
+                top_10_indexes_result = await pipeline.summarizer.select_top_10_async(titles)
+            if not top_10_indexes_result:
+                 # Also the path when the token budget rules out the selection call
+                 logger.warning("Top 10 selection failed or skipped. Ranking locally.")
+                 top_10_indices = rank_candidates(all_new_entries)[:10]
+            else:
+                top_10_indices = top_10_indexes_result
+                logger.info(f"Selected Top 10 indices: {top_10_indices}")
+        else:
+            top_10_indices = list(range(len(titles)))
+        save_job_run_selection(run_id, top_10_indices)
+
+    # 4. Summarize the Top 10 in the AI lane; the rest is already persisted
+    pending = [i for i in top_10_indices if i < len(all_new_entries) and i not in done_items]
+    total = len(top_10_indices)
+    processed_count = total - len(pending)
+    update_job_status(JOB_ID, "summarizing", "Summarizing Top 10 articles...", total, processed_count)
+    
+    def on_item_done(idx):
+        nonlocal processed_count
+        processed_count += 1
+        mark_job_run_item_done(run_id, idx)
+        update_job_status(JOB_ID, "summarizing", f"Summarizing... {processed_count}/{total}", total, processed_count)
+
+    with stage_timer('rss', 'summarize'), span('summarize', 'job'):
+        ranks = {idx: rank for rank, idx in enumerate(top_10_indices)}
+        await pipeline.summarize(all_new_entries, pending, on_item_done=on_item_done, ranks=ranks)
+
+def is_sleep_time():
     # Check KST time (UTC+9)
     # Sleep time: 23:00 - 06:00
     utc_now = datetime.utcnow()
     kst_now = utc_now + timedelta(hours=9)
-    
-    if kst_now.hour >= 23 or kst_now.hour < 6:
-        logger.info(f"Sleep time ({kst_now.strftime('%H:%M')} KST). Skipping scheduled update.")
+    return kst_now.hour >= 23 or kst_now.hour < 6
+
+async def refresh_rss_job():
+    """
+    Manual RSS refresh. In adaptive mode a full rebuild would clear the
+    articles and summaries the per-feed polls collected, so every feed is
+    polled right away instead.
+    """
+    if is_adaptive_polling():
+        await poll_all_feeds_job()
+    else:
+        await update_rss_job()
+
+async def update_feeds_job():
+    """Combined job for scheduled tasks"""
+    if is_sleep_time():
+        logger.info("Sleep time (KST). Skipping scheduled update.")
         return
 
-    await update_rss_job()
+    # In adaptive mode every RSS feed has its own poll job
+    if not is_adaptive_polling():
+        await update_rss_job()
     await update_clien_job_standalone()
-    
-async def update_clien_job_standalone():
-    logger.info("Starting Clien update...")
-    update_job_status(JOB_ID, "processing", "Fetching Clien News...", 0, 0)
-    
-    # Clear existing Clien articles for a fresh start
-    logger.info("Clearing existing Clien articles...")
-    clear_articles('clien')
-    
-    # Update last fetched timestamp
-    update_feed_last_fetched(CLIEN_FEED_ID)
-    
-    # 1. Fetch List
-    candidates = await fetch_clien_list()
-    if not candidates:
-        logger.warning("No Clien articles found.")
+
+def _schedule_feed_poll(feed_id, run_date):
+    get_scheduler().add_job(poll_feed_job, 'date', run_date=run_date, args=[feed_id], id=f'feed:{feed_id}', replace_existing=True)
+
+@traced_job('feed_poll')
+@job_timed('feed_poll')
+async def poll_feed_job(feed_id):
+    feed = get_feed(feed_id)
+    if not feed or not feed['is_active']:
         return
 
-    # 2. Select Top 10
-    update_job_status(JOB_ID, "processing", f"Found {len(candidates)} Clien articles. Selecting Top 10...", len(candidates), 0)
-    
-    selected_indices = await summarizer.select_clien_candidates_async(candidates)
-    logger.info(f"Selected Clien indices: {selected_indices}")
+    if is_sleep_time():
+        interval = feed['poll_interval_minutes'] or 60
+    else:
+        try:
+            new_entries, interval = await poll_feed(feed)
+        except Exception as e:
+            logger.error(f"Error polling feed {feed['url']}: {e}")
+            new_entries, interval = [], feed['poll_interval_minutes'] or 60
+        if new_entries:
+            _queue_for_summary(new_entries)
+
+    _schedule_feed_poll(feed_id, datetime.now(timezone.utc) + timedelta(minutes=interval))
+
+@traced_job('rss')
+@job_timed('rss')
+async def poll_all_feeds_job():
+    """Polls every active feed now and summarizes what they found without waiting for the debounce."""
+    feeds = get_feeds(active_only=True)
+    update_job_status(JOB_ID, "fetching", f"Polling {len(feeds)} feeds...", len(feeds), 0)
+    semaphore = asyncio.Semaphore(int(get_setting('pipeline_fetch_concurrency', 8)))
+    polled_count = 0
+
+    async def poll(feed):
+        nonlocal polled_count
+        async with semaphore:
+            try:
+                new_entries, interval = await poll_feed(feed)
+            except Exception as e:
+                logger.error(f"Error polling feed {feed['url']}: {e}")
+                return
+        if new_entries:
+            _queue_for_summary(new_entries, debounce=False)
+        if get_scheduler().get_job(f"feed:{feed['id']}"):
+            # Polled early: its next regular poll moves along
+            _schedule_feed_poll(feed['id'], datetime.now(timezone.utc) + timedelta(minutes=interval))
+        polled_count += 1
+        update_job_status(JOB_ID, "fetching", f"Polled {polled_count}/{len(feeds)} feeds...", len(feeds), polled_count)
+
+    with stage_timer('rss', 'collect'), span('collect', 'job'):
+        await asyncio.gather(*(poll(feed) for feed in feeds))
+
+    if get_scheduler().get_job('summarize_pending'):
+        get_scheduler().remove_job('summarize_pending')
+    update_job_status(JOB_ID, "summarizing", f"Summarizing {len(pending_entries)} new entries...", len(pending_entries), 0)
+    await summarize_pending_job()
+    update_job_status(JOB_ID, "completed", "RSS feeds polled.", len(feeds), len(feeds))
+
+def _queue_for_summary(entries, debounce=True):
+    global _pending_run_id
+    pending_entries.extend(entries)
+    candidates = [entry.to_dict() for entry in pending_entries]
+    if _pending_run_id is None:
+        _pending_run_id = create_job_run('summarize_pending', candidates)
+    else:
+        update_job_run_candidates(_pending_run_id, candidates)
+    # Debounce: collect polls for a while so the selection sees a meaningful batch
+    if debounce and not get_scheduler().get_job('summarize_pending'):
+        delay = float(get_setting('summarize_debounce_minutes', 10))
+        get_scheduler().add_job(summarize_pending_job, 'date', run_date=datetime.now(timezone.utc) + timedelta(minutes=delay), id='summarize_pending')
+
+@traced_job('summarize_pending')
+@job_timed('summarize_pending')
+async def summarize_pending_job(resume_run=None):
+    """Shared summarization step for entries found by per-feed polls."""
+    global _pending_run_id
+    if resume_run:
+        logger.info(f"Resuming interrupted summarization of polled entries {resume_run['id']}...")
+        run_id = resume_run['id']
+        entries = [FeedEntry.from_dict(data) for data in resume_run['candidates']]
+        indices = resume_run['selected']
+        done_items = get_job_run_done_items(run_id)
+    else:
+        run_id, entries = _pending_run_id, pending_entries[:]
+        # Polls from here on start the next batch
+        _pending_run_id = None
+        pending_entries.clear()
+        indices = None
+        done_items = set()
+    if not entries:
+        if run_id:
+            finish_job_run(run_id, 'completed')
+        return
+
+    try:
+        await _summarize_pending_run(run_id, entries, indices, done_items)
+    except Exception:
+        finish_job_run(run_id, 'failed')
+        raise
+    finish_job_run(run_id, 'completed')
+
+async def _summarize_pending_run(run_id, entries, indices, done_items):
+    async with RssPipeline(get_summarizer()) as pipeline:
+        if indices is None:
+            # Keep roughly the Top-10-out-of-100 ratio of a full refresh
+            quota = min(10, math.ceil(len(entries) / 10))
+            logger.info(f"Summarizing {quota} of {len(entries)} newly polled entries...")
+            if len(entries) > quota:
+                pipeline.start_prefetch(entries)
+                indices = await pipeline.summarizer.select_top_10_async([entry.title for entry in entries])
+                indices = [i for i in indices if i < len(entries)][:quota]
+                if not indices:
+                    indices = rank_candidates(entries)[:quota]
+            else:
+                indices = list(range(len(entries)))
+            save_job_run_selection(run_id, indices)
+        pending = [i for i in indices if i < len(entries) and i not in done_items]
+        ranks = {idx: rank for rank, idx in enumerate(indices)}
+        await pipeline.summarize(entries, pending, on_item_done=lambda idx: mark_job_run_item_done(run_id, idx), ranks=ranks)
+
+def sync_feed_polls():
+    """Makes the per-feed poll jobs match the active feeds and the polling settings."""
+    enabled = is_adaptive_polling() and get_setting('auto_refresh', 'true') == 'true'
+    feed_ids = set()
+
+    if enabled:
+        now = datetime.now(timezone.utc)
+        for i, feed in enumerate(get_feeds(active_only=True)):
+            feed_ids.add(feed['id'])
+            if get_scheduler().get_job(f"feed:{feed['id']}"):
+                continue
+            run_date = now + timedelta(seconds=5 * i) # Stagger first polls
+            if feed['next_poll_at']:
+                run_date = max(run_date, datetime.fromisoformat(feed['next_poll_at']).replace(tzinfo=timezone.utc))
+            _schedule_feed_poll(feed['id'], run_date)
+        if not get_scheduler().get_job('sync_feed_polls'):
+            # Picks up feeds added or removed through the web app
+            get_scheduler().add_job(sync_feed_polls, 'interval', minutes=5, id='sync_feed_polls')
+    elif get_scheduler().get_job('sync_feed_polls'):
+        get_scheduler().remove_job('sync_feed_polls')
+
+    for job in get_scheduler().get_jobs():
+        if job.id.startswith('feed:') and job.id[len('feed:'):] not in feed_ids:
+            job.remove()
+
+@traced_job('clien')
+@job_timed('clien')
+async def update_clien_job_standalone(resume_run=None):
+    if resume_run:
+        logger.info(f"Resuming interrupted Clien update job {resume_run['id']}...")
+        run_id = resume_run['id']
+        candidates = resume_run['candidates']
+        selected_indices = resume_run['selected']
+        done_items = get_job_run_done_items(run_id)
+    else:
+        logger.info("Starting Clien update...")
+        update_job_status(JOB_ID, "processing", "Fetching Clien News...", 0, 0)
+        
+        # Update last fetched timestamp
+        update_feed_last_fetched(CLIEN_FEED_ID)
+        
+        # 1. Crawl list pages down to the newest post seen last time
+        crawl = get_clien_crawl_settings()
+        last_seen_id = int(get_setting('clien_last_seen_id', 0))
+        with stage_timer('clien', 'crawl'), span('crawl', 'job'):
+            posts = await fetch_clien_list(crawl['pages'], stop_at_id=last_seen_id or None, concurrency=crawl['concurrency'])
+        if not posts:
+            logger.warning("No Clien articles found.")
+            return
+
+        # Already summarized threads get their comment count refreshed; busy ones are re-summarized incrementally
+        known = update_comment_counts({post['link']: post['comment_count'] for post in posts})
+        # The page that reaches the cursor also holds older posts that weren't picked last time
+        candidates = [
+            post for post in posts
+            if post['link'] not in known and post['post_id'] > last_seen_id
+        ]
+        active = _active_clien_threads(posts, known)
+        logger.info(f"Clien crawl: {len(posts)} posts, {len(known)} already summarized ({len(active)} active), {len(candidates)} new.")
+        if not candidates:
+            await _refresh_clien_threads(active)
+            _advance_clien_cursor(posts)
+            update_job_status(JOB_ID, "completed", "No new Clien posts.", 0, 0)
+            return
+
+        run_id = create_job_run('clien', candidates)
+        selected_indices = None
+        done_items = set()
+
+    try:
+        await _process_clien_run(run_id, candidates, selected_indices, done_items)
+    except Exception:
+        finish_job_run(run_id, 'failed')
+        raise
+    finish_job_run(run_id, 'completed')
+    _advance_clien_cursor(candidates)
+    if not resume_run:
+        await _refresh_clien_threads(active)
+
+def _advance_clien_cursor(posts):
+    """Remembers the newest post number crawled so the next run can stop there."""
+    post_ids = [post['post_id'] for post in posts if post.get('post_id')]
+    last_seen_id = int(get_setting('clien_last_seen_id', 0))
+    if post_ids and max(post_ids) > last_seen_id:
+        set_setting('clien_last_seen_id', max(post_ids))
+
+def _active_clien_threads(posts, previous_counts):
+    """Saved threads that gained at least clien_refresh_min_comments comments, busiest first."""
+    min_new = int(get_setting('clien_refresh_min_comments', 3))
+    limit = int(get_setting('clien_refresh_limit', 5))
+    growth = [
+        (post['comment_count'] - previous_counts[post['link']], post)
+        for post in posts if post['link'] in previous_counts
+    ]
+    growth = [(new, post) for new, post in growth if new >= min_new]
+    growth.sort(key=lambda pair: pair[0], reverse=True)
+    return [post for _new, post in growth[:limit]]
+
+async def _refresh_clien_threads(posts):
+    """
+    Re-summarizes saved threads from what changed since the last summary:
+    only new comments are sent (with the previous comment summary), and the
+    article summary is redone only when the body hash changed.
+    """
+    if not posts:
+        return
+    states = get_thread_states([post['link'] for post in posts])
+    semaphore = asyncio.Semaphore(5)
+    summarizer = get_summarizer()
+
+    async def refresh(post):
+        state = states.get(post['link'])
+        if not state:
+            return
+        async with semaphore:
+            with span('fetch_thread', 'network', url=post['link']):
+                thread = await fetch_clien_article_full(post['link'])
+        if not thread.get('body') and not thread.get('comments'):
+            return
+        body_hash, comment_keys = thread_fingerprint(thread)
+        if not state['body_hash']:
+            # Saved before fingerprints existed: record a baseline, summarize changes from the next run on
+            update_thread_summary(post['link'], state['summary'], state['comment_summary'], body_hash, comment_keys, post['comment_count'])
+            return
+
+        summarized = set(state['comment_keys'])
+        new_comments = [c for c, key in zip(thread['comments'], comment_keys) if key not in summarized]
+        article_sum, comment_sum = state['summary'], state['comment_summary']
+        if body_hash != state['body_hash']:
+            logger.info(f"Clien thread body changed, re-summarizing: {post['title']}")
+            article_sum, comment_sum = await summarizer.summarize_clien_with_comments_async(
+                thread['body'], thread['comments'][:CLIEN_PROMPT_COMMENTS])
+            comment_keys = comment_keys[:CLIEN_PROMPT_COMMENTS]
+        elif new_comments:
+            logger.info(f"Clien thread has {len(new_comments)} new comments: {post['title']}")
+            comment_sum = await summarizer.update_clien_comment_summary_async(
+                state['comment_summary'], new_comments[:CLIEN_PROMPT_COMMENTS])
+            if comment_sum is None:
+                return  # Keep the old fingerprint and count so the comments are retried next time
+            comment_keys = list(summarized) + [key for key in comment_keys if key not in summarized][:CLIEN_PROMPT_COMMENTS]
+        if not article_sum:
+            return
+        update_thread_summary(post['link'], article_sum, comment_sum, body_hash, comment_keys, post['comment_count'])
+
+    with stage_timer('clien', 'refresh'), span('refresh', 'job'):
+        await asyncio.gather(*(refresh(post) for post in posts))
+
+async def _process_clien_run(run_id, candidates, selected_indices, done_items):
+    summarizer = get_summarizer()
+    # 2. Select Top 10 (skipped when resuming after the selection was checkpointed)
+    if selected_indices is None:
+        update_job_status(JOB_ID, "processing", f"Found {len(candidates)} Clien articles. Selecting Top 10...", len(candidates), 0)
+        
+        with stage_timer('clien', 'select'), span('select', 'job'):
+            selected_indices = await summarizer.select_clien_candidates_async(candidates)
+        logger.info(f"Selected Clien indices: {selected_indices}")
+        save_job_run_selection(run_id, selected_indices)
     
     # 3. Process Top 10
-    update_job_status(JOB_ID, "summarizing", "Summarizing Clien articles...", len(selected_indices), 0)
+    update_job_status(JOB_ID, "summarizing", "Summarizing Clien articles...", len(selected_indices), len(done_items))
     
     semaphore = asyncio.Semaphore(10) # Conservative limit
     
     async def process_clien_item(idx, item):
         async with semaphore:
-            full_data = await fetch_clien_article_full(item['link'])
+            with span('fetch_thread', 'network', url=item['link']):
+                full_data = await fetch_clien_article_full(item['link'])
             body = full_data.get('body', '')
             comments = full_data.get('comments', [])
-            logger.info(f"[process_clien_item] body = ", body)
-            logger.info(f"[process_clien_item] comments = ", comments)
+            body_hash, comment_keys = thread_fingerprint(full_data)
+            # Lazy %-args: the body and comments are only formatted when DEBUG is on
+            logger.debug("[process_clien_item] body = %s", body)
+            logger.debug("[process_clien_item] %d comments = %s", len(comments), comments)
 
             # Check comment count from list item to decide strategy
             comment_count_list = item.get('comment_count', 0)
             logger.info(f"Processing item '{item['title']}' with comment_count={comment_count_list}")
 
-            if comment_count_list > 0:
-                 article_sum, comment_sum = await summarizer.summarize_clien_with_comments_async(body, comments)
-            else:
-                 article_sum, comment_sum = await summarizer.summarize_clien_article_only_async(body)
+            with span('summarize_thread', 'gemini', comments=min(len(comments), CLIEN_PROMPT_COMMENTS)):
+                if comment_count_list > 0:
+                     article_sum, comment_sum = await summarizer.summarize_clien_with_comments_async(body, comments[:CLIEN_PROMPT_COMMENTS])
+                else:
+                     article_sum, comment_sum = await summarizer.summarize_clien_article_only_async(body)
 
             if not article_sum:
-                 article_sum = "Summary failed."
+                 article_sum = local_summary(body) or "Summary failed."
 
             # Save to DB with separate summaries
             save_article(
                 CLIEN_FEED_ID,
                 item['title'],
                 item['link'],
-                datetime.utcnow().isoformat(), # Now
+                item.get('published_at') or datetime.utcnow().isoformat(),
                 body, # Raw content
                 summary=article_sum,
                 is_top_selection=True, # All selected are "top" for this feed
                 comment_summary=comment_sum,
-                comment_count=item.get('comment_count', 0)
+                comment_count=item.get('comment_count', 0),
+                body_hash=body_hash,
+                # Comments that went into the summary; later ones are summarized as a delta
+                comment_keys=comment_keys[:CLIEN_PROMPT_COMMENTS] if comment_count_list > 0 else []
             )
+            mark_job_run_item_done(run_id, idx)
 
     tasks = []
     for i in selected_indices:
-        if i < len(candidates):
+        if i < len(candidates) and i not in done_items:
             tasks.append(process_clien_item(i, candidates[i]))
             
-    await asyncio.gather(*tasks)
+    with stage_timer('clien', 'summarize'), span('summarize', 'job'):
+        await asyncio.gather(*tasks)
     cleanup_old_articles(days=7)
     
     update_job_status(JOB_ID, "completed", "Clien update finished.", len(selected_indices), len(selected_indices))
     logger.info("Clien update finished.")
 
+async def resume_interrupted_jobs():
+    """Resumes refresh jobs that were cut short by a restart, newest first per job type."""
+    resumers = {'rss': update_rss_job, 'clien': update_clien_job_standalone, 'summarize_pending': summarize_pending_job}
+    seen_types = set()
+    for run in get_interrupted_job_runs():
+        job_type = run['job_type']
+        # Each batch of polled entries is its own run, a newer one doesn't cover it
+        superseded = job_type in seen_types and job_type != 'summarize_pending'
+        if superseded or job_type not in resumers:
+            # An older checkpoint was superseded by a newer run of the same job
+            finish_job_run(run['id'], 'abandoned')
+            continue
+        seen_types.add(job_type)
+        try:
+            await resumers[job_type](resume_run=run)
+        except Exception as e:
+            logger.error(f"Failed to resume {job_type} job {run['id']}: {e}")
+
+# Job types that can be requested from the web app (see worker.py)
+JOB_TYPES = {
+    'rss': refresh_rss_job,
+    'clien': update_clien_job_standalone,
+    'all': update_feeds_job,
+}
+
 def start_scheduler():
     interval_minutes = int(get_setting('refresh_interval', 120))
     auto_refresh = get_setting('auto_refresh', 'true') == 'true'
 
     if auto_refresh:
-        scheduler.add_job(update_feeds_job, 'interval', minutes=interval_minutes, id='update_feeds')
+        get_scheduler().add_job(update_feeds_job, 'interval', minutes=interval_minutes, id='update_feeds')
         logger.info(f"Scheduler started with interval {interval_minutes} minutes.")
     else:
         logger.info("Scheduler started but auto-refresh is disabled.")
     
-    scheduler.start()
+    get_scheduler().start()
+    sync_feed_polls()
 
 def update_job_settings(auto_refresh, interval_minutes):
-    job = scheduler.get_job('update_feeds')
+    job = get_scheduler().get_job('update_feeds')
     
     if auto_refresh:
         if job:
             job.reschedule(trigger='interval', minutes=interval_minutes)
             logger.info(f"Rescheduled job with interval {interval_minutes} minutes.")
         else:
-            scheduler.add_job(update_feeds_job, 'interval', minutes=interval_minutes, id='update_feeds')
+            get_scheduler().add_job(update_feeds_job, 'interval', minutes=interval_minutes, id='update_feeds')
             logger.info(f"Added job with interval {interval_minutes} minutes.")
     else:
         if job:
             job.remove()
             logger.info("Removed auto-refresh job.")
+
+    sync_feed_polls()
@@ -1,67 +1,205 @@
 import asyncio
 import os
+import re
 import time
-import google.generativeai as genai
-from bs4 import BeautifulSoup
+from collections import Counter
+from text_extract import html_to_text
+from database import get_setting
 from dotenv import load_dotenv
-from logger_config import logger
+from logger_config import get_logger
+from tracing import span, record_span
+from token_budget import BudgetExhaustedError, budget_level, record_usage, LEVELS, NORMAL, COMPACT, LOCAL, RAW
+from metrics import summary_tier_total, gemini_call_seconds, gemini_rate_limited_total, gemini_retries_total, gemini_throttle_wait_seconds_total
+
+logger = get_logger(__name__)
 
 load_dotenv("key.env")
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+_genai = None
+
+def _load_genai():
+    """google.generativeai takes most of a second to import; load and configure it on first use."""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        if GEMINI_API_KEY:
+            genai.configure(api_key=GEMINI_API_KEY)
+        _genai = genai
+    return _genai
+
+# Community comments are often heated; don't let the default filters drop the summary
+COMMENT_SAFETY_SETTINGS = [
+    {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+    {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+# Summary tiers, cheapest first: the text itself, the start of the text (once the
+# token budget is used up), a local extractive summary, a short Gemini summary of
+# the start of the text, the full Gemini summary
+TIERS = ('passthrough', 'raw', 'extractive', 'short', 'full')
+
+_SENTENCE_END = re.compile(r'(?<=[.!?。])\s+|\n+')
+_WORD = re.compile(r'\w{2,}')
+
+def get_summary_tier_settings():
+    return {
+        'passthrough_chars': int(get_setting('summary_passthrough_chars', 300)),
+        'extractive_chars': int(get_setting('summary_extractive_chars', 800)),
+        'full_chars': int(get_setting('summary_full_chars', 3000)),
+        'full_rank': int(get_setting('summary_full_rank', 3)),
+        'short_input_chars': int(get_setting('summary_short_input_chars', 2000)),
+        'raw_chars': int(get_setting('summary_raw_chars', 600)),
+    }
+
+def choose_summary_tier(length, rank, settings):
+    """
+    Tier for a text of `length` chars that was selected at position `rank`
+    (0 = first pick): long or high-ranked texts get the full summary, texts
+    too short to condense are kept as is.
+    """
+    if length < settings['passthrough_chars']:
+        return 'passthrough'
+    if length >= settings['full_chars'] or (rank is not None and rank < settings['full_rank']):
+        return 'full'
+    if length < settings['extractive_chars']:
+        return 'extractive'
+    return 'short'
+
+def extractive_summary(text, max_sentences=3):
+    """The `max_sentences` sentences with the most frequent words, in their original order, as a Markdown list."""
+    sentences = list(dict.fromkeys(s.strip() for s in _SENTENCE_END.split(text) if s.strip()))
+    if len(sentences) <= max_sentences:
+        return '\n'.join(f"- {s}" for s in sentences)
+    frequencies = Counter(word.lower() for word in _WORD.findall(text))
+
+    def score(sentence):
+        words = _WORD.findall(sentence)
+        return sum(frequencies[word.lower()] for word in words) / (len(words) or 1)
+
+    best = sorted(range(len(sentences)), key=lambda i: score(sentences[i]), reverse=True)[:max_sentences]
+    return '\n'.join(f"- {sentences[i]}" for i in sorted(best))
+
+def raw_summary(text, max_chars):
+    """The start of `text`, cut at a word boundary."""
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    return (cut.rsplit(None, 1)[0] if ' ' in cut else cut) + '…'
+
+def local_summary(content):
+    """Summary made without Gemini: the extractive summary of the text."""
+    text = html_to_text(content) if content and '<' in content else (content or '').strip()
+    return extractive_summary(text) if text else ''
+
+def get_compact_limits():
+    """Prompt caps used once the token budget is in the 'compact' level or beyond (see token_budget.py)."""
+    return {
+        'input_chars': int(get_setting('token_compact_input_chars', 1500)),
+        'comments': int(get_setting('token_compact_comments', 20)),
+        'comment_chars': int(get_setting('token_compact_comment_chars', 200)),
+        'title_chars': int(get_setting('token_compact_title_chars', 80)),
+    }
 
 class GeminiSummarizer:
     def __init__(self):
         if not GEMINI_API_KEY:
             logger.warning("Gemini API Key not found in environment variables. AI features will be disabled.")
-        self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        self._model = None
         self.last_call_time = 0
         self.min_interval = 10.0  # Total safeguard interval
         self.max_retries = 5
         self.lock = asyncio.Lock()  # Atomic rate limit lock
+        self._budget_level = NORMAL
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = _load_genai().GenerativeModel('gemini-2.0-flash-lite')
+        return self._model
+
+    @model.setter
+    def model(self, model):
+        self._model = model
 
     def _clean_text(self, text):
         if not text:
             return ""
-        # If it's HTML, clean with BeautifulSoup, else just strip
+        # If it's HTML, reduce to text, else just strip
         if '<' in text and '>' in text:
-            soup = BeautifulSoup(text, 'html.parser')
-            return soup.get_text(separator=' ', strip=True)
+            return html_to_text(text)
         return text.strip()
 
+    def budget_level(self):
+        """Current token budget level (token_budget.NORMAL ... RAW); logs when it changes."""
+        level = budget_level()
+        if level != self._budget_level:
+            log = logger.warning if level > self._budget_level else logger.info
+            log(f"Gemini token budget: switching from '{LEVELS[self._budget_level]}' to '{LEVELS[level]}'")
+            self._budget_level = level
+        return level
+
     async def _call_with_retry_async(self, func, *args, **kwargs):
-        """Generic async retry wrapper for API calls with atomic rate limiting"""
+        """Generic async retry wrapper for API calls with atomic rate limiting and token accounting"""
+        if self.budget_level() >= RAW:
+            raise BudgetExhaustedError("Gemini token budget exhausted")
         for attempt in range(self.max_retries):
             # Atomic check and update of last_call_time
+            queued_at = time.perf_counter()
             async with self.lock:
                 elapsed = time.time() - self.last_call_time
                 if elapsed < self.min_interval:
                     wait_time = self.min_interval - elapsed
                     logger.info(f"Rate limit throttle: waiting {wait_time:.1f}s")
+                    gemini_throttle_wait_seconds_total.inc(wait_time, reason='throttle')
                     await asyncio.sleep(wait_time)
                 
                 # Update time BEFORE the call to reserve the slot
                 self.last_call_time = time.time()
+            # Includes waiting behind other callers for the lock
+            waited = time.perf_counter() - queued_at
+            if waited > 0.01:
+                record_span('throttle_wait', 'throttle', waited)
 
+            started = time.perf_counter()
             try:
-                result = await func(*args, **kwargs)
+                with span('gemini_call', 'gemini', attempt=attempt + 1):
+                    result = await func(*args, **kwargs)
+                gemini_call_seconds.observe(time.perf_counter() - started, outcome='ok')
+                if not kwargs.get('stream'):
+                    record_usage(args[0] if args else '', result)
                 return result
             except Exception as e:
                 error_str = str(e)
                 if "429" in error_str or "quota" in error_str.lower():
+                    gemini_call_seconds.observe(time.perf_counter() - started, outcome='rate_limited')
+                    gemini_rate_limited_total.inc()
                     wait_time = (2 ** attempt) * 4
-                    print(f"Rate limit hit ({error_str}). Retrying in {wait_time} seconds...")
+                    logger.warning(f"Rate limit hit ({error_str}). Retrying in {wait_time} seconds...")
+                    if attempt + 1 < self.max_retries:
+                        gemini_retries_total.inc()
+                    gemini_throttle_wait_seconds_total.inc(wait_time, reason='backoff')
                     await asyncio.sleep(wait_time)
+                    record_span('rate_limit_backoff', 'throttle', wait_time, attempt=attempt + 1)
                 else:
+                    gemini_call_seconds.observe(time.perf_counter() - started, outcome='error')
                     raise e
         raise Exception("Max retries exceeded for Gemini API call")
 
     async def select_top_10_async(self, titles):
+        """Indices of the Top 10 titles; [] when Gemini is unavailable or over budget (callers rank locally)."""
         if not GEMINI_API_KEY:
             return []
+        level = self.budget_level()
+        if level >= LOCAL:
+            logger.info("Token budget: skipping Gemini Top 10 selection.")
+            return []
+        if level >= COMPACT:
+            title_chars = get_compact_limits()['title_chars']
+            titles = [t[:title_chars] for t in titles]
         
         titles_text = "\n".join([f"{i}. {t}" for i, t in enumerate(titles)])
         prompt = f"""
@@ -75,14 +213,15 @@ class GeminiSummarizer:
         """
 
         try:
-            logger.info(f"Gemini select_top_10_async prompt:\n{prompt}")
+            logger.info(f"Gemini select_top_10_async: {len(titles)} titles, prompt {len(prompt)} chars")
+            logger.debug("Gemini select_top_10_async prompt:\n%s", prompt)
             response = await self._call_with_retry_async(self.model.generate_content_async, prompt)
             
             text = response.text.strip()
             indices = [int(x.strip()) for x in text.split(',') if x.strip().isdigit()]
             return indices[:10]
         except Exception as e:
-            print(f"Error selecting top 10 (async): {e}")
+            logger.error(f"Error selecting top 10 (async): {e}")
             return []
 
     async def select_clien_candidates_async(self, candidates):
@@ -90,20 +229,15 @@ class GeminiSummarizer:
         Select Top 10 from Clien news based on comment count and keywords.
         candidates: list of dict {'title', 'comment_count'}
         """
-        if not GEMINI_API_KEY:
+        if not GEMINI_API_KEY or self.budget_level() >= LOCAL:
             # Fallback: Sort by comment count
             sorted_indices = sorted(range(len(candidates)), key=lambda k: candidates[k]['comment_count'], reverse=True)
             return sorted_indices[:10]
             
         # Format for prompt
         # "Index. [Comments: N] Title"
+        # Notices are already dropped by the crawler (see fetch_clien_list)
         items_text = "\n".join([f"{i}. [Comments: {c['comment_count']}] {c['title']}" for i, c in enumerate(candidates)])
-
-        lines = items_text.splitlines()
-        if len(lines) >= 3:
-            remaining_lines = lines[3:]
-        
-        items_text = "\n".join(remaining_lines)
         
         prompt = f"""
         Select the Top 10 articles from the following list from a tech community.
@@ -112,7 +246,7 @@ class GeminiSummarizer:
         2. Relevance to keywords: Google, Apple, Samsung Electronics, Galaxy, TV.
         
         Prioritize articles that match the keywords and have high engagement as much as possible.
-        Return ONLY the indices of the selected articles as a comma-separated list excluding index 0,1,2.
+        Return ONLY the indices of the selected articles as a comma-separated list.
         Do not include any notice articles such as "새소식 게시판 이용권한 변경 안내, 새로운소식 게시판 이용규칙, 사이트 이용규칙 (종합)".
         Try to fill out 10 articles as much as possible without notice articles.
         
@@ -121,14 +255,15 @@ class GeminiSummarizer:
         """
         
         try:
-             logger.info(f"Gemini select_clien_candidates_async prompt:\n{prompt}")
+             logger.info(f"Gemini select_clien_candidates_async: {len(candidates)} candidates, prompt {len(prompt)} chars")
+             logger.debug("Gemini select_clien_candidates_async prompt:\n%s", prompt)
              response = await self._call_with_retry_async(self.model.generate_content_async, prompt)
              
              text = response.text.strip()
              indices = [int(x.strip()) for x in text.split(',') if x.strip().isdigit()]
              return indices[:10]
         except Exception as e:
-            print(f"Error selecting Clien candidates: {e}")
+            logger.error(f"Error selecting Clien candidates: {e}")
             # Fallback
             return sorted(range(len(candidates)), key=lambda k: candidates[k]['comment_count'], reverse=True)[:10]
 
@@ -137,6 +272,8 @@ class GeminiSummarizer:
             return None, None
 
         body_text = self._clean_text(body)
+        if self.budget_level() >= COMPACT:
+            body_text, comments = self._compact_thread(body_text, comments)
         comments_text = "\n".join([f"- {c}" for c in comments])
         
         logger.info(f"Summarizing with comments. Body len: {len(body_text)}, Comments: {len(comments)}")
@@ -166,17 +303,10 @@ class GeminiSummarizer:
         """
         
         try:
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-            
             response = await self._call_with_retry_async(
                 self.model.generate_content_async, 
                 prompt,
-                safety_settings=safety_settings
+                safety_settings=COMMENT_SAFETY_SETTINGS
             )
             
             full_text = response.text
@@ -200,6 +330,44 @@ class GeminiSummarizer:
             logger.error(f"Error in summarize_clien_with_comments_async: {e}")
             return None, None
 
+    async def update_clien_comment_summary_async(self, previous_summary, new_comments):
+        """Folds new comments into an existing comment summary instead of re-reading the whole thread."""
+        if not GEMINI_API_KEY:
+            return None
+
+        if self.budget_level() >= COMPACT:
+            _body, new_comments = self._compact_thread('', new_comments)
+        comments_text = "\n".join([f"- {c}" for c in new_comments])
+        logger.info(f"Updating comment summary with {len(new_comments)} new comments.")
+
+        prompt = f"""
+        Below is the current summary of a Clien community discussion, followed by comments posted since it was written.
+        Update the summary in Korean so it also reflects the new comments (new viewpoints, shifts in sentiment, key points).
+
+        Instructions:
+        - Be objective and professional.
+        - Use Markdown (bullet points, bolding).
+        - Keep it concise but insightful; do not just append the new comments.
+        - Return ONLY the updated comment summary.
+
+        Current Summary:
+        {previous_summary or "(none yet)"}
+
+        New Comments:
+        {comments_text}
+        """
+
+        try:
+            response = await self._call_with_retry_async(
+                self.model.generate_content_async,
+                prompt,
+                safety_settings=COMMENT_SAFETY_SETTINGS
+            )
+            return response.text.strip() if response.text else None
+        except Exception as e:
+            logger.error(f"Error in update_clien_comment_summary_async: {e}")
+            return None
+
     async def summarize_clien_article_only_async(self, body, max_lines=10):
         if not GEMINI_API_KEY:
             return None, ""
@@ -208,13 +376,17 @@ class GeminiSummarizer:
         article_sum = await self.summarize_async(body, max_lines=max_lines)
         return article_sum, ""
 
-    async def summarize_async(self, content, max_lines=None):
+    async def summarize_async(self, content, max_lines=None, on_delta=None):
+        """Gemini summary of `content`; with `on_delta` the answer is streamed and each text chunk passed to it."""
         if not GEMINI_API_KEY:
             return None 
 
         text = self._clean_text(content)
         if not text:
             return None
+        if self.budget_level() >= COMPACT:
+            text = text[:get_compact_limits()['input_chars']]
+            max_lines = min(max_lines or 5, 5)
 
         length_instruction = "keep it concise."
         if max_lines:
@@ -235,17 +407,15 @@ class GeminiSummarizer:
         
         try:
             logger.info(f"Gemini summarize_async prompt length: {len(prompt)} chars")
-            safety_settings = [
-                {"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
-                {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
-            ]
-            
+            if on_delta:
+                text = await self._generate_streamed(prompt, on_delta, safety_settings=COMMENT_SAFETY_SETTINGS)
+                if not text:
+                    logger.warning("Gemini returned empty text.")
+                return text or None
             response = await self._call_with_retry_async(
                 self.model.generate_content_async, 
                 prompt,
-                safety_settings=safety_settings
+                safety_settings=COMMENT_SAFETY_SETTINGS
             )
             
             if not response.text:
@@ -256,5 +426,69 @@ class GeminiSummarizer:
             logger.error(f"Error summarizing (async): {e}")
             return None
 
+    async def _generate_streamed(self, prompt, on_delta, **kwargs):
+        """Streams a generate_content_async answer chunk by chunk into on_delta; returns the whole text."""
+        response = await self._call_with_retry_async(self.model.generate_content_async, prompt, stream=True, **kwargs)
+        parts = []
+        with span('gemini_stream', 'gemini'):
+            async for chunk in response:
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (finish reason / safety ratings only)
+                    continue
+                if text:
+                    parts.append(text)
+                    on_delta(text)
+        # Usage metadata is only complete once the stream is consumed
+        record_usage(prompt, response)
+        return ''.join(parts)
+
+    def _compact_thread(self, body_text, comments):
+        limits = get_compact_limits()
+        return body_text[:limits['input_chars']], [c[:limits['comment_chars']] for c in comments[:limits['comments']]]
+
     async def summarize_short_async(self, content, max_lines=10):
         return await self.summarize_async(content, max_lines=max_lines)
+
+    async def summarize_tiered_async(self, content, rank=None, settings=None, on_delta=None):
+        """
+        Summarizes `content` with the cheapest tier that fits it (see
+        choose_summary_tier). Returns (summary, tier); the summary is None
+        only when there is no text at all. Gemini tiers stream into `on_delta`
+        when it is given.
+        """
+        settings = settings or get_summary_tier_settings()
+        text = self._clean_text(content)
+        if not text:
+            return None, None
+        tier = choose_summary_tier(len(text), rank, settings)
+        level = self.budget_level()
+        if level >= RAW and tier in ('full', 'short'):
+            tier = 'raw'
+        elif level >= COMPACT and tier == 'full':
+            tier = 'short'
+        summary = None
+        if tier == 'full':
+            summary = await self.summarize_async(text, max_lines=10, on_delta=on_delta)
+        elif tier == 'short':
+            summary = await self.summarize_async(text[:settings['short_input_chars']], max_lines=3, on_delta=on_delta)
+        elif tier == 'passthrough':
+            summary = text
+        elif tier == 'raw':
+            summary = raw_summary(text, settings['raw_chars'])
+        if not summary:
+            if tier in ('full', 'short'):
+                logger.warning(f"Gemini {tier} summary failed, using an extractive summary.")
+            tier, summary = 'extractive', local_summary(text)
+        summary_tier_total.inc(tier=tier)
+        return summary, tier
+
+_summarizer = None
+
+def get_summarizer():
+    """The shared summarizer, created on first use (by the first job that needs it)."""
+    global _summarizer
+    if _summarizer is None:
+        _summarizer = GeminiSummarizer()
+    return _summarizer
@@ -0,0 +1,77 @@
+"""
+Fast HTML-to-text conversion.
+
+html_to_text() produces the same output as
+BeautifulSoup(html, 'html.parser').get_text(separator=' ', strip=True) -
+every text run stripped, empty runs dropped, joined with single spaces,
+script/style/template/ruby-annotation text left out - but walks an lxml tree
+instead of building a soup, and skips parsing entirely for input without
+markup. BeautifulSoup remains the fallback for input lxml refuses.
+"""
+import html
+from lxml import etree
+import lxml.html
+
+# Text in these never shows up in BeautifulSoup's get_text()
+SKIP_TAGS = {'script', 'style', 'template', 'rt', 'rp'}
+
+_PARSER = lxml.html.HTMLParser(remove_blank_text=False, remove_comments=False, remove_pis=False, huge_tree=True)
+
+def _text_runs(root):
+    # Iterative walk (feed HTML can nest deeper than the recursion limit).
+    # The stack holds child iterators and pending tails, in output order.
+    if root.text:
+        yield root.text
+    stack = [iter(root)]
+    while stack:
+        top = stack[-1]
+        if isinstance(top, str):
+            stack.pop()
+            yield top
+            continue
+        child = next(top, None)
+        if child is None:
+            stack.pop()
+            continue
+        # Comments and PIs have a callable tag; like skipped tags only their tail is text
+        if isinstance(child.tag, str) and child.tag not in SKIP_TAGS:
+            if child.tail:
+                stack.append(child.tail)
+            if child.text:
+                yield child.text
+            stack.append(iter(child))
+        elif child.tail:
+            yield child.tail
+
+def element_text(element, separator=' ', strip=True):
+    """get_text(separator=separator, strip=strip) for an already parsed lxml element."""
+    if not strip:
+        return separator.join(_text_runs(element))
+    return separator.join(run for run in (r.strip() for r in _text_runs(element)) if run)
+
+def parse_html(text):
+    return lxml.html.document_fromstring(text, parser=_PARSER)
+
+def _has_text_after_html_end(text):
+    end = text.rfind('</html>')
+    return end != -1 and bool(text[end + len('</html>'):].strip())
+
+def _soup_text(text):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(text, 'html.parser').get_text(separator=' ', strip=True)
+
+def html_to_text(text):
+    if not text:
+        return ""
+    if '<' not in text:
+        # No markup: only entities to decode, nothing to parse
+        return (html.unescape(text) if '&' in text else text).strip()
+    if '<![CDATA[' in text or '<textarea' in text or _has_text_after_html_end(text):
+        # libxml2 drops these / keeps textarea markup raw; html.parser treats them as text
+        return _soup_text(text)
+    try:
+        root = parse_html(text)
+    except (etree.ParserError, ValueError):
+        # Empty documents, encoding declarations in str input, ...
+        return _soup_text(text)
+    return element_text(root)
@@ -0,0 +1,228 @@
+"""
+Local thumbnails for article images.
+
+When an entry is picked for the Top 10 its image_url is downloaded once,
+resized to the widths in THUMB_WIDTHS and stored as JPEG files under
+cache/thumbs/, named by the sha256 of the source image. The image_thumbs
+table maps image URLs to that hash, so an image shared by several
+articles (or seen again on the next refresh) is not downloaded again, and
+/thumb/{hash} can be served with an immutable cache header. The directory
+is kept under a byte budget by evicting the least recently used thumbnails
+(mtime is bumped when one is served). Stores run in a worker thread, next
+to the resizing, and are serialized with a lock.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import re
+import threading
+from datetime import datetime, timedelta
+from database import get_setting, get_image_thumbs, save_image_thumb, delete_image_thumbs
+from url_canon import get_host
+from metrics import cpu_timed, fetch_timer
+from logger_config import get_logger
+from tracing import span
+
+logger = get_logger(__name__)
+
+CACHE_DIR = os.path.join("cache", "thumbs")
+THUMB_WIDTHS = (320, 640)
+JPEG_QUALITY = 80
+# A failed image is retried on a later refresh, not on every one
+RETRY_FAILED_AFTER = timedelta(hours=24)
+IMAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/*,*/*;q=0.8',
+}
+
+_HASH = re.compile(r'^[0-9a-f]{64}$')
+
+def is_thumb_hash(value):
+    return bool(_HASH.match(value or ''))
+
+def pick_width(requested):
+    """Smallest stored width that covers `requested` (the largest one otherwise)."""
+    for width in THUMB_WIDTHS:
+        if requested <= width:
+            return width
+    return THUMB_WIDTHS[-1]
+
+class ThumbnailCache:
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+        self.total_bytes = None
+        self.stats = {'downloads': 0, 'reused': 0, 'failures': 0, 'stores': 0, 'evictions': 0}
+        self._lock = threading.Lock()
+
+    def path(self, thumb_hash, width):
+        return os.path.join(self.directory, thumb_hash[:2], f"{thumb_hash}-{width}.jpg")
+
+    def has(self, thumb_hash):
+        return all(os.path.exists(self.path(thumb_hash, width)) for width in THUMB_WIDTHS)
+
+    def get_path(self, thumb_hash, width):
+        """Path of a stored thumbnail (marked as recently used) or None."""
+        path = self.path(thumb_hash, width)
+        try:
+            os.utime(path)  # LRU: most recently used = newest mtime
+        except OSError:
+            return None
+        return path
+
+    def _scan(self):
+        if self.total_bytes is not None:
+            return
+        total = 0
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        self.total_bytes = total
+
+    def put(self, thumb_hash, thumbs):
+        """Stores {width: jpeg bytes} for one source image."""
+        with self._lock:
+            self._put(thumb_hash, thumbs)
+
+    def _put(self, thumb_hash, thumbs):
+        self._scan()
+        for width, data in thumbs.items():
+            path = self.path(thumb_hash, width)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data) - old_size
+        self.stats['stores'] += 1
+        self._evict()
+
+    def _evict(self):
+        max_bytes = float(get_setting('thumb_cache_max_mb', 50)) * 1024 * 1024
+        if self.total_bytes <= max_bytes:
+            return
+        files = []
+        for root, _dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        # Evict down to 90% so we don't evict on every store
+        target = max_bytes * 0.9
+        evicted = set()
+        for _mtime, size, path in files:
+            if self.total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.total_bytes -= size
+            self.stats['evictions'] += 1
+            evicted.add(os.path.basename(path).split('-', 1)[0])
+        # Cards must not keep pointing at /thumb URLs that are gone
+        delete_image_thumbs(evicted)
+
+    def log_stats(self):
+        if self.stats['downloads'] or self.stats['reused'] or self.stats['failures']:
+            logger.info(f"Thumbnails: {self.stats}, {self.total_bytes or 0} bytes on disk.")
+
+@cpu_timed('thumbnail')
+def make_thumbnails(data):
+    """Source image bytes -> {width: jpeg bytes}; never upscales, so small images are stored at their own size."""
+    from PIL import Image, ImageOps  # Only the refresh jobs resize images
+
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG decoders can skip detail we are about to throw away
+        image.draft('RGB', (THUMB_WIDTHS[-1], THUMB_WIDTHS[-1] * 4))
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            if image.mode == 'RGBA':
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+        thumbs = {}
+        for width in THUMB_WIDTHS:
+            if image.width > width:
+                resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+            else:
+                resized = image
+            out = io.BytesIO()
+            resized.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            thumbs[width] = out.getvalue()
+        return thumbs
+
+async def _download(session, url, max_bytes):
+    from resilience import get_fetch_timeout
+
+    with fetch_timer(get_host(url), 'image'):
+        async with session.get(url, headers=IMAGE_HEADERS, timeout=get_fetch_timeout()) as response:
+            if response.status != 200:
+                return None
+            if response.content_length and response.content_length > max_bytes:
+                return None
+            data = bytearray()
+            # content.read(n) returns whatever is buffered, not n bytes
+            async for chunk in response.content.iter_chunked(64 * 1024):
+                data += chunk
+                if len(data) > max_bytes:
+                    return None
+    return bytes(data) or None
+
+def _make_and_store(thumb_hash, data):
+    thumb_cache.put(thumb_hash, make_thumbnails(data))
+
+async def _store_thumbnail(session, url, max_bytes):
+    try:
+        data = await _download(session, url, max_bytes)
+        if not data:
+            raise ValueError("no image data or image too large")
+        thumb_hash = hashlib.sha256(data).hexdigest()
+        if not thumb_cache.has(thumb_hash):
+            await asyncio.to_thread(_make_and_store, thumb_hash, data)
+            if not thumb_cache.has(thumb_hash):
+                raise ValueError("evicted right away, thumb_cache_max_mb is too small")
+        thumb_cache.stats['downloads'] += 1
+    except Exception as e:
+        logger.warning(f"Thumbnail failed for {url}: {e}")
+        thumb_cache.stats['failures'] += 1
+        thumb_hash = None
+    save_image_thumb(url, thumb_hash)
+
+def _needs_fetch(row):
+    if row is None:
+        return True
+    if row['thumb_hash']:
+        # Known image, fetch again only if its files were evicted
+        return not thumb_cache.has(row['thumb_hash'])
+    return datetime.fromisoformat(row['fetched_at']) < datetime.utcnow() - RETRY_FAILED_AFTER
+
+async def fetch_thumbnails(image_urls, session):
+    """Downloads and stores thumbnails for the image URLs not cached yet, thumbnail_concurrency at a time."""
+    urls = list(dict.fromkeys(url for url in image_urls if url and url.startswith(('http://', 'https://'))))
+    known = get_image_thumbs(urls)
+    pending = [url for url in urls if _needs_fetch(known.get(url))]
+    thumb_cache.stats['reused'] += len(urls) - len(pending)
+    if not pending:
+        return
+
+    semaphore = asyncio.Semaphore(int(get_setting('thumbnail_concurrency', 4)))
+    max_bytes = int(float(get_setting('thumbnail_max_source_mb', 10)) * 1024 * 1024)
+
+    async def fetch_one(url):
+        async with semaphore:
+            await _store_thumbnail(session, url, max_bytes)
+
+    with span('fetch_thumbnails', 'network', images=len(pending)):
+        await asyncio.gather(*(fetch_one(url) for url in pending))
+
+thumb_cache = ThumbnailCache()
@@ -0,0 +1,123 @@
+"""
+Gemini token accounting and budgets.
+
+Every Gemini call adds its prompt and output tokens (from the response's
+usage_metadata, or estimated from the text when that is missing) to the
+token_usage table, one row per job run and day. Usage against the
+token_budget_daily and token_budget_per_job settings (0 = no limit) sets the
+level the summarizer works at:
+
+    normal   full prompts
+    compact  smaller prompts: capped inputs and comments, no full-tier summaries
+    local    selection/ranking done locally, summaries still from Gemini (compact)
+    raw      no Gemini calls, Top 10 summaries are the start of the raw text
+             (summary_raw_chars), Clien ones the local extractive summary
+
+so a runaway run degrades instead of burning the quota and stalling every
+later call in 429 backoff. The level is looked up at most every
+LEVEL_CHECK_SECONDS per job run, not on every Gemini request.
+"""
+import time
+from datetime import datetime
+from database import get_setting, add_token_usage, get_token_usage_totals
+from logger_config import get_logger
+from metrics import gemini_tokens_total
+from tracing import current_trace_id, current_job_type
+
+logger = get_logger(__name__)
+
+LEVELS = ('normal', 'compact', 'local', 'raw')
+NORMAL, COMPACT, LOCAL, RAW = range(len(LEVELS))
+
+# Rough chars per token for the estimate (Korean runs denser, English lighter)
+CHARS_PER_TOKEN = 3
+# How long one level lookup (settings + usage queries) is reused within a job run
+LEVEL_CHECK_SECONDS = 5
+
+_level_checked = (0.0, None, NORMAL)
+
+class BudgetExhaustedError(Exception):
+    pass
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN if text else 0
+
+def usage_from_response(prompt, response):
+    """(prompt_tokens, output_tokens, estimated) for one Gemini response."""
+    usage = getattr(response, 'usage_metadata', None)
+    prompt_tokens = getattr(usage, 'prompt_token_count', None)
+    if prompt_tokens:
+        return prompt_tokens, getattr(usage, 'candidates_token_count', None) or 0, False
+    try:
+        text = response.text or ''
+    except Exception:
+        # Blocked responses (and unfinished streams) have no text
+        text = ''
+    return estimate_tokens(prompt), estimate_tokens(text), True
+
+def today():
+    return datetime.utcnow().date().isoformat()
+
+def record_usage(prompt, response):
+    prompt_tokens, output_tokens, estimated = usage_from_response(prompt, response)
+    gemini_tokens_total.inc(prompt_tokens, kind='prompt')
+    gemini_tokens_total.inc(output_tokens, kind='output')
+    try:
+        add_token_usage(today(), current_trace_id() or '', current_job_type(), prompt_tokens, output_tokens, estimated)
+    except Exception as e:
+        # Accounting must never fail a summary
+        logger.error(f"Failed to record token usage: {e}")
+
+def get_budget_settings():
+    return {
+        'daily': int(get_setting('token_budget_daily', 0)),
+        'per_job': int(get_setting('token_budget_per_job', 0)),
+        'compact_at': float(get_setting('token_budget_compact_at', 0.7)),
+        'local_at': float(get_setting('token_budget_local_at', 0.85)),
+    }
+
+def budget_fraction(settings=None):
+    """Largest share of a budget used so far (today, and this job run when inside one); 0 without budgets."""
+    settings = settings or get_budget_settings()
+    if not settings['daily'] and not settings['per_job']:
+        return 0.0
+    trace_id = current_trace_id()
+    day_tokens, job_tokens = get_token_usage_totals(today(), trace_id)
+    fraction = 0.0
+    if settings['daily']:
+        fraction = day_tokens / settings['daily']
+    if settings['per_job'] and trace_id:
+        fraction = max(fraction, job_tokens / settings['per_job'])
+    return fraction
+
+def level_for(fraction, settings):
+    if fraction >= 1:
+        return RAW
+    if fraction >= settings['local_at']:
+        return LOCAL
+    if fraction >= settings['compact_at']:
+        return COMPACT
+    return NORMAL
+
+def budget_level():
+    global _level_checked
+    checked_at, trace_id, level = _level_checked
+    if trace_id == current_trace_id() and time.monotonic() - checked_at < LEVEL_CHECK_SECONDS:
+        return level
+    settings = get_budget_settings()
+    level = level_for(budget_fraction(settings), settings)
+    _level_checked = (time.monotonic(), current_trace_id(), level)
+    return level
+
+def usage_summary():
+    """Today's usage against the daily budget, for the settings page."""
+    settings = get_budget_settings()
+    day_tokens, _job_tokens = get_token_usage_totals(today(), None)
+    fraction = day_tokens / settings['daily'] if settings['daily'] else 0.0
+    return {
+        'day_tokens': day_tokens,
+        'daily_budget': settings['daily'],
+        'per_job_budget': settings['per_job'],
+        'daily_pct': fraction * 100 if settings['daily'] else None,
+        'level': LEVELS[level_for(fraction, settings)],
+    }
@@ -0,0 +1,173 @@
+"""
+Lightweight span tracing for refresh jobs.
+
+A trace is opened per job run (traced_job); inside it, span() records a
+named, timed block with its parent taken from a context variable, so spans
+nest correctly across awaits, asyncio tasks and asyncio.to_thread calls.
+Spans are buffered in memory and written to the trace_spans table in one
+transaction when the job ends. Outside a traced job span() costs a context
+variable lookup and nothing is recorded.
+
+Categories used for the waterfall colours: job, network, cpu, gemini,
+throttle, db.
+"""
+import functools
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from database import get_setting, save_trace_spans
+from logger_config import get_logger, add_log_context
+
+logger = get_logger(__name__)
+
+_current_trace = ContextVar('current_trace', default=None)
+_current_span = ContextVar('current_span', default=None)
+
+class Trace:
+    def __init__(self, job_type):
+        self.id = str(uuid.uuid4())
+        self.job_type = job_type
+        self.started_at = datetime.utcnow()
+        self.origin = time.perf_counter()
+        self.spans = []
+
+    def add(self, span_id, parent_id, name, category, started, duration, attrs):
+        # list.append is atomic, spans may come from worker threads
+        self.spans.append({
+            'trace_id': self.id, 'span_id': span_id, 'parent_id': parent_id,
+            'job_type': self.job_type, 'name': name, 'category': category,
+            'offset_ms': (started - self.origin) * 1000, 'duration_ms': duration * 1000,
+            'attrs': attrs or None,
+        })
+
+    def flush(self):
+        try:
+            save_trace_spans(self.id, self.started_at.isoformat(), self.spans, int(get_setting('trace_keep_runs', 20)))
+        except Exception as e:
+            # Tracing must never fail a job
+            logger.error(f"Failed to save trace {self.id}: {e}")
+
+def current_trace_id():
+    trace = _current_trace.get()
+    return trace.id if trace else None
+
+def current_job_type():
+    trace = _current_trace.get()
+    return trace.job_type if trace else None
+
+def _log_context():
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    return {'job': trace.job_type, 'trace_id': trace.id, 'span_id': _current_span.get()}
+
+# Log records written inside a traced job carry its IDs (see logger_config)
+add_log_context(_log_context)
+
+@contextmanager
+def span(name, category='', **attrs):
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        attrs['error'] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add(span_id, parent_id, name, category, started, time.perf_counter() - started, attrs)
+
+def record_span(name, category, duration, **attrs):
+    """Records a span that already happened and ended now (e.g. a measured wait)."""
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace.add(uuid.uuid4().hex[:16], _current_span.get(), name, category,
+              time.perf_counter() - duration, duration, attrs)
+
+def traced_job(job_type):
+    """Decorator for async job functions: one trace per run, the run itself is the root span."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if _current_trace.get() is not None:
+                # Nested job (update_feeds_job -> update_rss_job): a span in the outer trace
+                with span(job_type, 'job'):
+                    return await func(*args, **kwargs)
+            trace = Trace(job_type)
+            trace_token = _current_trace.set(trace)
+            try:
+                with span(job_type, 'job'):
+                    return await func(*args, **kwargs)
+            finally:
+                _current_trace.reset(trace_token)
+                trace.flush()
+        return wrapper
+    return decorator
+
+def _assign_lanes(spans):
+    """
+    Complete ('X') events on one thread row must nest, but sibling spans run
+    concurrently. Each span goes to the first lane where it fits inside the
+    currently open span (or the lane is idle).
+    """
+    lanes = []
+    assignment = {}
+    for row in sorted(spans, key=lambda r: (r['offset_ms'], -r['duration_ms'])):
+        start, end = row['offset_ms'], row['offset_ms'] + row['duration_ms']
+        for lane_id, open_ends in enumerate(lanes):
+            while open_ends and open_ends[-1] <= start:
+                open_ends.pop()
+            if not open_ends or open_ends[-1] >= end:
+                break
+        else:
+            lane_id = len(lanes)
+            lanes.append([])
+        lanes[lane_id].append(end)
+        assignment[row['span_id']] = lane_id
+    return assignment
+
+def to_chrome_trace(spans):
+    """Chrome trace-event JSON (chrome://tracing, Perfetto) for the rows of one trace."""
+    lanes = _assign_lanes(spans)
+    events = []
+    for row in spans:
+        events.append({
+            'name': row['name'],
+            'cat': row['category'] or 'other',
+            'ph': 'X',
+            'ts': round(row['offset_ms'] * 1000),
+            'dur': round(row['duration_ms'] * 1000),
+            'pid': 1,
+            'tid': lanes[row['span_id']],
+            'args': dict(row['attrs'] or {}, span_id=row['span_id'], parent_id=row['parent_id']),
+        })
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+def build_waterfall(spans, max_rows=200):
+    """Rows for the Settings waterfall: depth-first order with depth and percent offsets."""
+    if not spans:
+        return []
+    children = {}
+    for row in spans:
+        children.setdefault(row['parent_id'], []).append(row)
+    total = max(row['offset_ms'] + row['duration_ms'] for row in spans) or 1.0
+
+    rows = []
+    stack = [(row, 0) for row in sorted(children.get(None, []), key=lambda r: r['offset_ms'], reverse=True)]
+    while stack and len(rows) < max_rows:
+        row, depth = stack.pop()
+        rows.append(dict(row, depth=depth,
+                         left_pct=100.0 * row['offset_ms'] / total,
+                         width_pct=max(0.2, 100.0 * row['duration_ms'] / total)))
+        for child in sorted(children.get(row['span_id'], []), key=lambda r: r['offset_ms'], reverse=True):
+            stack.append((child, depth + 1))
+    return rows
@@ -0,0 +1,65 @@
+"""
+URL canonicalization used as the dedup/cache key for articles.
+
+The same story often arrives with different utm_* parameters, fragments,
+http/https or a feed-proxy redirect URL. canonicalize_url() folds those
+variants onto one key; redirects.py resolves the proxy URLs. The canonical
+form is a key, not necessarily the URL we fetch or show.
+"""
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+TRACKING_PARAMS = {
+    'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid',
+    '_hsenc', '_hsmi', 'ref_src', 'ocid', 'cmpid', 'spm', 'feature', 'share',
+}
+TRACKING_PREFIXES = ('utm_',)
+
+# Hosts whose query string never identifies the content (paging/sorting only)
+STRIP_QUERY_HOSTS = {'www.clien.net', 'clien.net', 'm.clien.net'}
+
+# Feed proxies / shorteners that need a HEAD request to find the real article
+REDIRECTOR_HOSTS = {
+    'feedproxy.google.com', 'feeds.feedburner.com', 'feedburner.com',
+    't.co', 'bit.ly', 'ow.ly', 'buff.ly', 'lnkd.in', 'dlvr.it', 'trib.al',
+}
+
+def _is_tracking_param(name):
+    name = name.lower()
+    return name in TRACKING_PARAMS or name.startswith(TRACKING_PREFIXES)
+
+def get_host(url):
+    return (urlsplit(url).hostname or '').lower()
+
+def canonicalize_url(url):
+    if not url:
+        return url
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        return url
+
+    host = parts.hostname.lower()
+    netloc = host if port in (None, 80, 443) else f"{host}:{port}"
+
+    path = parts.path or '/'
+    while '//' in path:
+        path = path.replace('//', '/')
+    if len(path) > 1 and path.endswith('/'):
+        path = path.rstrip('/')
+
+    query = ''
+    if host not in STRIP_QUERY_HOSTS:
+        params = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking_param(k)]
+        query = urlencode(sorted(params))
+
+    # http/https variants are the same article; fragments never are different ones
+    return urlunsplit(('https', netloc, path, query, ''))
+
+def is_redirector(url):
+    try:
+        return (urlsplit(url).hostname or '').lower() in REDIRECTOR_HOSTS
+    except ValueError:
+        return False
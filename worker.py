@@ -0,0 +1,120 @@
+"""
+Standalone pipeline worker.
+
+Runs the RSS/Clien refresh jobs outside the FastAPI process so that feed
+fetching, parsing and summarization don't compete with request handling.
+The web app and the worker only talk through the database: the web app
+queues rows in `job_requests` (RSSY2_WORKER_MODE=external) and reads
+`job_status`, the worker claims the requests and runs them.
+
+Usage:
+    python -m worker                  # scheduled runs + queued requests
+    python -m worker --once rss       # run one job (rss, clien, all) and exit
+    python -m worker --no-schedule    # only serve queued requests
+    python -m worker --metrics-port 9108  # also serve /metrics for the pipeline
+"""
+import argparse
+import asyncio
+import os
+from aiohttp import web
+from dotenv import load_dotenv
+from database import init_db, get_setting, claim_next_job_request, finish_job_request, reset_stale_job_requests
+from scheduler import JOB_TYPES, start_scheduler, update_job_settings, resume_interrupted_jobs
+from logger_config import get_logger, apply_log_settings
+from metrics import registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+import events
+
+logger = get_logger('worker')
+
+load_dotenv("key.env")
+
+def read_schedule_settings():
+    auto_refresh = get_setting('auto_refresh', 'true') == 'true'
+    interval_minutes = int(get_setting('refresh_interval', 120))
+    # Polling settings only matter for change detection; update_job_settings reads them itself
+    polling = (get_setting('polling_mode', 'global'), get_setting('poll_min_minutes'), get_setting('poll_max_minutes'))
+    return auto_refresh, interval_minutes, polling
+
+async def run_job_request(request):
+    job = JOB_TYPES.get(request['job_type'])
+    if not job:
+        logger.warning(f"Unknown job type requested: {request['job_type']}")
+        finish_job_request(request['id'], 'failed', f"unknown job type {request['job_type']}")
+        return
+
+    logger.info(f"Worker running requested job '{request['job_type']}' ({request['id']})")
+    try:
+        await job()
+        finish_job_request(request['id'], 'completed')
+    except Exception as e:
+        logger.error(f"Requested job '{request['job_type']}' failed: {e}")
+        finish_job_request(request['id'], 'failed', str(e))
+
+async def start_metrics_server(port):
+    """Serves the worker's own metrics; the web app's /metrics can't see this process."""
+    async def handle_metrics(request):
+        return web.Response(body=registry.render().encode('utf-8'), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', port).start()
+    logger.info(f"Worker metrics on :{port}/metrics")
+
+async def run_worker(poll_interval=2.0, schedule=True, metrics_port=None):
+    init_db()
+    apply_log_settings(get_setting)
+    # Live updates go through the DB; the web app relays them to browsers
+    events.use_db_channel()
+    if metrics_port:
+        await start_metrics_server(metrics_port)
+    reset_stale_job_requests()
+    await resume_interrupted_jobs()
+
+    settings = None
+    if schedule:
+        start_scheduler()
+        settings = read_schedule_settings()
+
+    logger.info(f"Worker started (pid {os.getpid()}, schedule={'on' if schedule else 'off'}).")
+    while True:
+        request = claim_next_job_request()
+        if request:
+            await run_job_request(request)
+            continue
+
+        if schedule:
+            # Settings are edited through the web app; follow them via the DB
+            current = read_schedule_settings()
+            if current != settings:
+                update_job_settings(current[0], current[1])
+                settings = current
+
+        await asyncio.sleep(poll_interval)
+
+async def run_once(job_type):
+    init_db()
+    apply_log_settings(get_setting)
+    events.use_db_channel()
+    await JOB_TYPES[job_type]()
+
+def main():
+    parser = argparse.ArgumentParser(description="RSSy2 pipeline worker")
+    parser.add_argument('--once', choices=sorted(JOB_TYPES), help="run a single job and exit")
+    parser.add_argument('--no-schedule', action='store_true', help="don't run the periodic refresh, only queued requests")
+    parser.add_argument('--poll-interval', type=float, default=2.0, help="seconds between job request polls")
+    parser.add_argument('--nice', type=int, default=0, help="increment the process nice level")
+    parser.add_argument('--metrics-port', type=int, help="serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    if args.nice:
+        os.nice(args.nice)
+
+    if args.once:
+        asyncio.run(run_once(args.once))
+    else:
+        asyncio.run(run_worker(poll_interval=args.poll_interval, schedule=not args.no_schedule, metrics_port=args.metrics_port))
+
+if __name__ == "__main__":
+    main()